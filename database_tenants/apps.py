@@ -2,10 +2,9 @@ from django.apps import AppConfig
 from django.db import connection
 from django.http import HttpResponseForbidden
 
-from django_tenants.utils import get_tenant_model
 from django_tenants.middleware.main import TenantMainMiddleware
-from pgrest.utils import make_error, get_tenant_id_from_base_url
-from pgrest.__init__ import t
+from database_tenants.registry import get_tenant_record, tenant_id_for_base_url
+from pgrest.utils import make_error
 from tapisservice.logs import get_logger
 
 logger = get_logger(__name__)
@@ -30,7 +29,7 @@ class GetTenantsFromRequest(TenantMainMiddleware):
             # Try and get tenant_id from request url and tapipy
             try:
                 request_url = request.scheme + "://" + request.get_host()
-                tenant_id = get_tenant_id_from_base_url(request_url, t.tenant_cache)
+                tenant_id = tenant_id_for_base_url(request_url)
                 logger.debug(f"Got tenant information, tenant_id = {tenant_id}, request_url = {request_url}, hostname = {hostname}")
             except Exception as e:
                 msg = f"Error getting tenant_id from request_url = {request_url}."
@@ -38,17 +37,19 @@ class GetTenantsFromRequest(TenantMainMiddleware):
                 return HttpResponseForbidden(make_error(msg=msg))
 
             # Check if tenant exists with tenant_name == tenant_id
-            tenant_model = get_tenant_model()
-            if not tenant_model.objects.filter(tenant_name=tenant_id).exists():
+            tenant_record = get_tenant_record(tenant_id)
+            if tenant_record is None:
                 msg = f"Could not find tenant with tenant_id equal to {tenant_id}"
                 logger.critical(msg)
                 return HttpResponseForbidden(make_error(msg=msg))
             logger.debug(f"Found tenant matching tenant_id = {tenant_id}")
+            # Views reuse this instead of looking the tenant up again.
+            request.tenant_record = tenant_record
 
-            # Try and set the schema to tenant_id
+            # Try and set the schema to the tenant's schema
             try:
-                connection.set_schema(tenant_id)
-                logger.debug(f"Django Tenant: Set schema to {tenant_id}")
+                connection.set_schema(tenant_record.schema_name)
+                logger.debug(f"Django Tenant: Set schema to {tenant_record.schema_name}")
             except Exception as e:
                 msg=f"Error setting schema to tenant_id = {tenant_id}"
                 logger.critical(msg + f" e: {e}")
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Per table/view change counters behind the ETags of /v3/pgrest/data/ and /v3/pgrest/views/ reads.
+    Shared across tenants in the public schema, see pgrest.db_transactions.data_utils.CHANGE_COUNTERS_TABLE.
+    """
+
+    dependencies = [
+        ('database_tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE TABLE IF NOT EXISTS public.pgrest_change_counters ("
+                "tenant varchar(255) NOT NULL, "
+                "obj_name varchar(255) NOT NULL, "
+                "counter bigint NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (tenant, obj_name));",
+            reverse_sql="DROP TABLE IF EXISTS public.pgrest_change_counters;",
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Sequence numbering cross-worker cache invalidation events, see pgrest.invalidation.VERSION_SEQUENCE.
+    """
+
+    dependencies = [
+        ('database_tenants', '0002_change_counters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE SEQUENCE IF NOT EXISTS public.pgrest_invalidation_seq;",
+            reverse_sql="DROP SEQUENCE IF EXISTS public.pgrest_invalidation_seq;",
+        ),
+    ]
@@ -0,0 +1,66 @@
+from django_tenants.utils import get_tenant_model
+from pgrest.cache import LRUCache
+from pgrest.invalidation import on_event
+from pgrest.utils import get_tenant_id_from_base_url
+from pgrest.__init__ import t
+from tapisservice.config import conf
+from tapisservice.logs import get_logger
+
+logger = get_logger(__name__)
+
+# Tenant metadata, {("url", base_url): tenant_id} and {("tenant", tenant_id): TenantRecord}.
+# Cleared whenever a tenant is created, and entries expire after tenant_registry_ttl regardless.
+TENANT_REGISTRY = LRUCache("tenant_registry",
+                           maxsize=conf.tenant_registry_max_size,
+                           ttl=conf.tenant_registry_ttl)
+
+
+class TenantRecord:
+    """
+    The parts of a Tenants row needed to route a request.
+    """
+    __slots__ = ("tenant_id", "schema_name", "db_instance_name")
+
+    def __init__(self, tenant_id, schema_name, db_instance_name):
+        self.tenant_id = tenant_id
+        self.schema_name = schema_name
+        self.db_instance_name = db_instance_name
+
+    def __repr__(self):
+        return f"TenantRecord(tenant_id={self.tenant_id!r}, schema_name={self.schema_name!r}, " \
+               f"db_instance_name={self.db_instance_name!r})"
+
+
+def tenant_id_for_base_url(base_url):
+    """
+    Returns the tenant_id for a request base URL, only scanning the tapipy tenant cache on a miss.
+    """
+    key = ("url", base_url)
+    tenant_id = TENANT_REGISTRY.get(key)
+    if tenant_id is None:
+        tenant_id = get_tenant_id_from_base_url(base_url, t.tenant_cache)
+        TENANT_REGISTRY.set(key, tenant_id)
+    return tenant_id
+
+
+def get_tenant_record(tenant_id):
+    """
+    Returns the TenantRecord for tenant_id, or None if PgREST has no such tenant. Unknown tenants
+    aren't cached, so a tenant created by another worker is found on the next request.
+    """
+    key = ("tenant", tenant_id)
+    record = TENANT_REGISTRY.get(key)
+    if record is None:
+        row = get_tenant_model().objects.filter(tenant_name=tenant_id)\
+                                        .values_list("schema_name", "db_instance_name").first()
+        if row is None:
+            return None
+        record = TenantRecord(tenant_id, row[0], row[1])
+        TENANT_REGISTRY.set(key, record)
+    return record
+
+
+@on_event("tenants")
+def invalidate_tenant_registry(event=None):
+    TENANT_REGISTRY.clear()
+    logger.debug("Cleared tenant registry.")
@@ -3,6 +3,7 @@ from rest_framework.views import APIView
 from django.http import HttpResponse, HttpResponseBadRequest
 
 from database_tenants.models import Tenants
+from pgrest.invalidation import publish
 from pgrest.utils import make_error, make_success
 from tapisservice.logs import get_logger
 
@@ -36,5 +37,7 @@ class CreateTenant(APIView):
             msg = f"Failed to create new tenant {schema_name} in db_instance {db_instance}. {e}"
             logger.error(msg)
             return HttpResponseBadRequest(make_error(msg=msg))
+        # Clears the tenant registry in every worker.
+        publish("tenants")
 
         return HttpResponse(make_success(msg=f"Tenant '{schema_name}' created successfully."), content_type='application/json')
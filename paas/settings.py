@@ -65,14 +65,25 @@ INSTALLED_APPS = list(SHARED_APPS) + [app for app in TENANT_APPS if app not in S
 MIDDLEWARE = [
     'database_tenants.apps.GetTenantsFromRequest', # django_tenants.middleware.main.TenantMainMiddleware is default, we write it a bit to get tenant with tapipy
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'pgrest.middleware.CompressionMiddleware', # compresses /v3/pgrest/data/ and /v3/pgrest/views/ responses
+    'pgrest.middleware.APISkippingSessionMiddleware', # sessions are only used by the admin, never by /v3/pgrest/ requests
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'pgrest.middleware.APISkippingAuthenticationMiddleware',
+    'pgrest.middleware.APISkippingMessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# PgREST authenticates every request itself in RoleSessionMixin.dispatch, DRF shouldn't look at sessions or users.
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
+    # ?format= selects a PgREST response format (e.g. columnar), not a DRF renderer.
+    'URL_FORMAT_OVERRIDE': None,
+    # Views negotiate CSV/NDJSON exports from the Accept header themselves, see pgrest.formats.
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'pgrest.formats.PgRESTContentNegotiation',
+}
+
 ROOT_URLCONF = 'paas.urls'
 
 TEMPLATES = [
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'paas.settings')
 
 application = get_wsgi_application()
+
+# With lazy-apps each uWSGI worker loads this module after forking, so each worker gets its own listener.
+from pgrest.invalidation import start_listener
+start_listener()
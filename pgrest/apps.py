@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class PgRESTConfig(AppConfig):
     name = 'pgrest'
+
+    def ready(self):
+        # Connects the ManageTables/ManageViews signal handlers that invalidate cached descriptors.
+        from pgrest import signals  # noqa: F401
@@ -0,0 +1,116 @@
+import hashlib
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from pgrest.cache import LRUCache
+from tapisservice.config import conf
+from tapisservice.logs import get_logger
+logger = get_logger(__name__)
+
+
+def token_digest(token):
+    """
+    Returns the SHA-256 hex digest of a token. Caches are keyed by digest so raw tokens are never held in memory.
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class AuthContext:
+    """
+    Who is making the request, set on the request as `request.auth_context` by RoleSessionMixin.dispatch.
+    Lives only as long as the request; nothing is written to Django sessions.
+    """
+    __slots__ = ("username", "tenant_id", "roles", "db_instance_name")
+
+    def __init__(self, username, tenant_id, roles, db_instance_name):
+        self.username = username
+        self.tenant_id = tenant_id
+        self.roles = roles
+        self.db_instance_name = db_instance_name
+
+    def __repr__(self):
+        return f"AuthContext(username={self.username!r}, tenant_id={self.tenant_id!r}, roles={self.roles!r})"
+
+
+class V2ProfilesError(Exception):
+    """
+    The profiles API couldn't be reached or returned a server error. Says nothing about whether the token is valid.
+    """
+    pass
+
+
+class V2ProfilesBackend:
+    """
+    Resolves Tapis v2 OAuth tokens to usernames with the v2 profiles API.
+
+    Requests go through one requests.Session so connections to the profiles API are kept alive and
+    reused, with separate connect and read timeouts. Usernames are cached by token digest for
+    `cache_ttl` seconds, and tokens the profiles API rejects are cached for `negative_ttl` seconds
+    so clients retrying a bad token don't cause a call each time.
+    """
+    def __init__(self, url, connect_timeout, read_timeout, cache_ttl, negative_ttl, maxsize, pool_size):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.negative_ttl = negative_ttl
+        self.cache = LRUCache("v2_token_usernames", maxsize=maxsize, ttl=cache_ttl)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def resolve_username(self, token):
+        """
+        Returns the username for token, or None if the profiles API says the token is invalid.
+        Raises V2ProfilesError when the profiles API can't be reached; those results are not cached.
+        """
+        key = token_digest(token)
+        # Valid tokens are cached as their username, invalid ones as False.
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached or None
+
+        try:
+            response = self.session.get(self.url,
+                                        headers={'Authorization': f'Bearer {token}'},
+                                        timeout=self.timeout)
+        except requests.RequestException as e:
+            raise V2ProfilesError(f"Got exception making request to profiles API. Exception: {e}")
+        logger.debug(f"got response from profiles API: {response}")
+        if response.status_code >= 500:
+            raise V2ProfilesError(f"Profiles API returned status {response.status_code}.")
+
+        try:
+            username = response.json()['result']['username']
+        except (ValueError, KeyError, TypeError):
+            username = None
+        if not username:
+            self.cache.set(key, False, ttl=self.negative_ttl)
+            return None
+        self.cache.set(key, username)
+        return username
+
+    def close(self):
+        self.session.close()
+
+
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def get_v2_backend():
+    """
+    Returns this process' V2ProfilesBackend, creating it from config on first use.
+    """
+    global _BACKEND
+    if _BACKEND is None:
+        with _BACKEND_LOCK:
+            if _BACKEND is None:
+                _BACKEND = V2ProfilesBackend(url=conf.v2_profiles_url,
+                                             connect_timeout=conf.v2_profiles_connect_timeout,
+                                             read_timeout=conf.v2_profiles_read_timeout,
+                                             cache_ttl=conf.v2_token_cache_ttl,
+                                             negative_ttl=conf.v2_token_negative_cache_ttl,
+                                             maxsize=conf.token_cache_max_size,
+                                             pool_size=conf.v2_profiles_pool_size)
+    return _BACKEND
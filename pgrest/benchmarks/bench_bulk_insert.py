@@ -0,0 +1,72 @@
+"""
+Benchmark for row creation.
+Compares row_creator (one multi-row INSERT ... VALUES ... RETURNING *) with bulk_insert_rows
+(COPY ... FROM STDIN into a staging table, then INSERT ... SELECT), as used by POST /data?bulk=true.
+
+Creates and drops the table pgrest_bench.bulk_insert on the "default" db_instance.
+
+Run inside the api container:
+    docker-compose run api python -m pgrest.benchmarks.bench_bulk_insert
+"""
+import time
+
+from pgrest.db_transactions.data_utils import do_transaction, invalidate_column_catalog
+from pgrest.db_transactions.table_data import bulk_insert_rows, row_creator
+
+DB_INSTANCE = "default"
+SCHEMA = "pgrest_bench"
+TABLE = "bulk_insert"
+PRIMARY_KEY = "bulk_insert_id"
+VALIDATE_JSON_CREATE = {"col_one": {"type": "string", "maxlength": 255},
+                        "col_two": {"type": "integer"},
+                        "col_three": {"type": "boolean", "nullable": True},
+                        "col_four": {"type": "string", "nullable": True},
+                        "created": {"type": "string"}}
+
+
+def create_table():
+    do_transaction(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA};", DB_INSTANCE)
+    do_transaction(f"DROP TABLE IF EXISTS {SCHEMA}.{TABLE};", DB_INSTANCE)
+    # created mirrors a CREATETIME column, which PgREST gives a NOW() default.
+    do_transaction(f"CREATE TABLE {SCHEMA}.{TABLE} ("
+                   f"{PRIMARY_KEY} serial PRIMARY KEY, "
+                   f"col_one varchar(255), col_two integer, col_three boolean, col_four text, "
+                   f"created timestamp DEFAULT NOW());", DB_INSTANCE)
+    invalidate_column_catalog(SCHEMA, TABLE, DB_INSTANCE)
+
+
+def drop_table():
+    do_transaction(f"DROP TABLE IF EXISTS {SCHEMA}.{TABLE};", DB_INSTANCE)
+    invalidate_column_catalog(SCHEMA, TABLE, DB_INSTANCE)
+
+
+def make_rows(count):
+    return [{"col_one": f"value {i}",
+             "col_two": i,
+             "col_three": None if i % 3 == 0 else i % 2 == 0,
+             "col_four": "hehe" if i % 5 == 0 else ""} for i in range(count)]
+
+
+def run(func, rows):
+    do_transaction(f"TRUNCATE {SCHEMA}.{TABLE};", DB_INSTANCE)
+    start = time.perf_counter()
+    func(TABLE, rows, SCHEMA, PRIMARY_KEY, VALIDATE_JSON_CREATE, db_instance=DB_INSTANCE)
+    return time.perf_counter() - start
+
+
+def main():
+    create_table()
+    try:
+        for count in [1000, 10000, 100000]:
+            rows = make_rows(count)
+            print(f"--- {count} rows ---")
+            for name, func in [("INSERT (row_creator)", row_creator),
+                               ("COPY (bulk_insert_rows)", bulk_insert_rows)]:
+                best = min(run(func, rows) for _ in range(3))
+                print(f"{name:<25} {best * 1000:10.2f} ms  {count / best:12.0f} rows/s")
+    finally:
+        drop_table()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark for list reads.
+Compares the 'python' read engine (row tuples to dicts, _pkid added in Python, json.dumps with
+timestampJSONEncoder) with the 'postgres_json' engine (json_agg builds the result array in Postgres
+and the text is spliced into the response).
+
+Creates and drops the table pgrest_bench.read_engine on the "default" db_instance.
+
+Run inside the api container:
+    docker-compose run api python -m pgrest.benchmarks.bench_read_engine
+"""
+import timeit
+
+from pgrest.db_transactions.data_utils import (do_transaction, expose_primary_key, fetch_json_rows,
+                                               parse_object_data, select_command)
+from pgrest.utils import make_success, make_success_json
+
+DB_INSTANCE = "default"
+SCHEMA = "pgrest_bench"
+TABLE = "read_engine"
+PRIMARY_KEY = "read_engine_id"
+
+
+def create_table(count):
+    do_transaction(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA};", DB_INSTANCE)
+    do_transaction(f"DROP TABLE IF EXISTS {SCHEMA}.{TABLE};", DB_INSTANCE)
+    do_transaction(f"CREATE TABLE {SCHEMA}.{TABLE} ("
+                   f"{PRIMARY_KEY} serial PRIMARY KEY, "
+                   f"col_one varchar(255), col_two integer, col_three integer, col_four boolean, "
+                   f"col_five text, created timestamp);", DB_INSTANCE)
+    do_transaction(f"INSERT INTO {SCHEMA}.{TABLE} (col_one, col_two, col_three, col_four, col_five, created) "
+                   f"SELECT 'value ' || i, i, i * 2, i % 2 = 0, CASE WHEN i % 3 = 0 THEN 'hehe' END, "
+                   f"now() - i * interval '1 minute' "
+                   f"FROM generate_series(1, {int(count)}) AS i;", DB_INSTANCE)
+
+
+def drop_table():
+    do_transaction(f"DROP TABLE IF EXISTS {SCHEMA}.{TABLE};", DB_INSTANCE)
+
+
+def python_engine(command):
+    obj_description, obj_unparsed_data, _ = do_transaction(command, DB_INSTANCE)
+    result = parse_object_data(obj_description, obj_unparsed_data)
+    expose_primary_key(result, PRIMARY_KEY)
+    return make_success(result=result)
+
+
+def postgres_json_engine(command):
+    return make_success_json(fetch_json_rows(command, DB_INSTANCE, primary_key=PRIMARY_KEY))
+
+
+def main():
+    create_table(100000)
+    try:
+        for limit in [1000, 10000, 100000]:
+            command, _ = select_command(SCHEMA, TABLE, [], limit, None, DB_INSTANCE)
+            print(f"--- {limit} rows ---")
+            for name, func in [("python", python_engine),
+                               ("postgres_json", postgres_json_engine)]:
+                size = len(func(command))
+                best = min(timeit.repeat(lambda: func(command), number=1, repeat=3))
+                print(f"{name:<15} {best * 1000:10.2f} ms  {limit / best:12.0f} rows/s  {size:12d} bytes")
+    finally:
+        drop_table()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Micro-benchmarks for response serialization.
+Compares the old make_success path (json.dumps with the timestampJSONEncoder callback) with the
+stdlib and orjson serializers in pgrest.serialization, on a few typical row shapes.
+
+Run inside the api container:
+    docker-compose run api python -m pgrest.benchmarks.bench_serialization
+"""
+import datetime
+import decimal
+import json
+import timeit
+import uuid
+
+from pgrest import serialization
+from pgrest.utils import timestampJSONEncoder
+
+
+def narrow_rows(count):
+    # Lookup table: a key, a label and a flag.
+    return [{"id": i, "label": f"label {i % 20}", "active": bool(i % 2), "_pkid": i} for i in range(count)]
+
+
+def wide_rows(count):
+    # CII style tables: dozens of mostly text and integer columns.
+    rows = []
+    for i in range(count):
+        row = {"_pkid": i}
+        for col in range(40):
+            row[f"col_{col}"] = f"value {i} {col}" if col % 2 else i * col
+        rows.append(row)
+    return rows
+
+
+def timestamp_rows(count):
+    # Event style tables: every row carries several timestamps and dates.
+    start = datetime.datetime(2023, 5, 3, 12, 0, 0)
+    return [{"id": i,
+             "created": start + datetime.timedelta(seconds=i),
+             "updated": start + datetime.timedelta(seconds=i, microseconds=500),
+             "day": (start + datetime.timedelta(days=i % 365)).date(),
+             "_pkid": i} for i in range(count)]
+
+
+def mixed_rows(count):
+    # Decimals, UUIDs, nulls and arrays.
+    return [{"id": i,
+             "amount": decimal.Decimal(f"{i}.25"),
+             "uid": uuid.UUID(int=i),
+             "note": None if i % 3 else "hehe",
+             "tags": ["a", "b", str(i)],
+             "_pkid": i} for i in range(count)]
+
+
+def old_dumps(obj):
+    # The pre-serialization-layer make_success path, with Decimal and UUID added so it can run every shape.
+    def encoder(raw_object):
+        if isinstance(raw_object, (decimal.Decimal, uuid.UUID)):
+            return str(raw_object)
+        return timestampJSONEncoder(raw_object)
+    return json.dumps(obj, default=encoder).encode()
+
+
+def main():
+    serializers = [("json.dumps + timestampJSONEncoder", old_dumps),
+                   ("stdlib serializer", serialization.StdlibSerializer().dumps)]
+    if serialization.orjson is not None:
+        serializers.append(("orjson serializer", serialization.OrjsonSerializer().dumps))
+    else:
+        print("orjson is not installed, skipping it.")
+
+    for shape in [narrow_rows, wide_rows, timestamp_rows, mixed_rows]:
+        for count in [1000, 10000]:
+            rows = shape(count)
+            print(f"--- {shape.__name__}, {count} rows ---")
+            for name, dumps in serializers:
+                size = len(dumps({"result": rows}))
+                best = min(timeit.repeat(lambda: dumps({"result": rows}), number=1, repeat=5))
+                print(f"{name:<35} {best * 1000:10.2f} ms  {count / best:12.0f} rows/s  {size:10d} bytes")
+
+
+if __name__ == "__main__":
+    main()
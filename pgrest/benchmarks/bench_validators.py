@@ -0,0 +1,62 @@
+"""
+Benchmark for row validation during bulk inserts.
+Compares building a Cerberus validator per row (the old row_creator behaviour), reusing one
+Cerberus validator, and the cached RowValidator batch API.
+
+Run inside the api container:
+    docker-compose run api python -m pgrest.benchmarks.bench_validators
+"""
+import timeit
+
+from cerberus import Validator
+
+from pgrest import test_data
+from pgrest.utils import create_validate_schema
+from pgrest.validation import RowValidator
+
+
+def make_rows(count):
+    rows = []
+    for i in range(count):
+        rows.append({"col_one": f"value {i}",
+                     "col_two": i,
+                     "col_three": i * 2,
+                     "col_four": bool(i % 2),
+                     "col_five": None if i % 3 else "hehe"})
+    return rows
+
+
+def per_row_validator(schema, rows):
+    for row in rows:
+        v = Validator(schema)
+        if not v.validate(row):
+            raise Exception(v.errors)
+
+
+def shared_validator(schema, rows):
+    v = Validator(schema)
+    for row in rows:
+        if not v.validate(row):
+            raise Exception(v.errors)
+
+
+def batch_validator(schema, rows):
+    invalid = RowValidator(schema).validate_rows(rows)
+    if invalid:
+        raise Exception(invalid)
+
+
+def main():
+    schema, _ = create_validate_schema(test_data.init_table_1["columns"], "dev", [])
+    for count in [100, 1000, 10000]:
+        rows = make_rows(count)
+        print(f"--- {count} rows ---")
+        for name, func in [("cerberus, validator per row", per_row_validator),
+                           ("cerberus, shared validator", shared_validator),
+                           ("RowValidator.validate_rows", batch_validator)]:
+            best = min(timeit.repeat(lambda: func(schema, rows), number=1, repeat=3))
+            print(f"{name:<30} {best * 1000:10.2f} ms  {count / best:12.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import OrderedDict
+
+from tapisservice.logs import get_logger
+logger = get_logger(__name__)
+
+
+# Every cache created in this process, by name. Used for stats and for flushing everything at once.
+CACHES = {}
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe, in-process LRU cache with optional expiry.
+
+    Entries expire `ttl` seconds after being set (or at `expires_at`, an epoch time, when
+    given to set()). A maxsize of None means the cache is unbounded. Caches live in a single
+    worker process; anything that changes what they hold must invalidate them explicitly.
+
+    With `stale_ttl`, expired entries are kept for that many extra seconds so get_or_load()
+    can serve them when reloading fails.
+
+    Every pop(), evict() and clear() bumps the cache's generation. get_or_load() doesn't cache a value
+    whose load started in an earlier generation, since it may have been read before the invalidation.
+    """
+    def __init__(self, name, maxsize=None, ttl=None, stale_ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.RLock()
+        self._data = OrderedDict()  # {key: (value, expires_monotonic or None)}
+        self._loading = {}          # {key: threading.Lock} for keys being loaded by get_or_load()
+        self._generation = 0        # bumped by every invalidation, see get_or_load()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.stale_hits = 0
+        CACHES[name] = self
+
+    def _expiry(self, ttl=None, expires_at=None):
+        if expires_at is not None:
+            return time.monotonic() + (expires_at - time.time())
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None:
+            return None
+        return time.monotonic() + ttl
+
+    def _peek(self, key, stale_ok=False):
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires = entry
+        if expires is not None:
+            now = time.monotonic()
+            if expires <= now:
+                if stale_ok and expires + (self.stale_ttl or 0) > now:
+                    return value
+                if not self.stale_ttl or expires + self.stale_ttl <= now:
+                    del self._data[key]
+                return _MISSING
+        return value
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._peek(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for key, calling loader() to fill it on a miss.
+
+        Only one thread loads a given key at a time; other threads asking for the same key
+        wait for that load instead of calling loader() themselves. If loader() raises and the
+        cache holds an expired value still within `stale_ttl`, the stale value is returned.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                with self._lock:
+                    # Another thread may have loaded the key while we waited.
+                    value = self._peek(key)
+                    generation = self._generation
+                if value is not _MISSING:
+                    return value
+                try:
+                    value = loader()
+                except Exception as e:
+                    with self._lock:
+                        self.load_errors += 1
+                        value = self._peek(key, stale_ok=True)
+                        if value is _MISSING:
+                            raise
+                        self.stale_hits += 1
+                    logger.warning(f"Serving stale entry from cache {self.name} after load error. e: {e}")
+                    return value
+                with self._lock:
+                    self.loads += 1
+                    if self._generation == generation:
+                        self.set(key, value)
+                    else:
+                        logger.debug(f"Not caching {key} in cache {self.name}; it was invalidated during the load.")
+                return value
+            finally:
+                with self._lock:
+                    if self._loading.get(key) is key_lock:
+                        del self._loading[key]
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        with self._lock:
+            self._data[key] = (value, self._expiry(ttl, expires_at))
+            self._data.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            self._generation += 1
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def evict(self, predicate):
+        """
+        Remove every entry whose key satisfies predicate(key). Returns the number removed.
+        """
+        with self._lock:
+            self._generation += 1
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+        if keys:
+            logger.debug(f"Evicted {len(keys)} entries from cache {self.name}.")
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data),
+                    "maxsize": self.maxsize,
+                    "ttl": self.ttl,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "loads": self.loads,
+                    "load_errors": self.load_errors,
+                    "stale_hits": self.stale_hits}
+
+
+def cache_stats():
+    """
+    Returns stats for every cache in this process, keyed by cache name.
+    """
+    return {name: cache.stats() for name, cache in list(CACHES.items())}
@@ -0,0 +1,119 @@
+"""
+Response compression codecs. gzip is always available; zstd and br (brotli) are used when the optional
+zstandard and brotli packages are installed.
+
+Each codec's compressor has compress(data) -> bytes, flush() -> bytes, which emits everything passed so
+far so streamed chunks reach the client without waiting for the rest, and finish() -> bytes.
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    # zstandard is optional, without it zstd isn't offered.
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    # brotli is optional, without it br isn't offered.
+    brotli = None
+
+
+class GzipCompressor:
+    def __init__(self, level):
+        # wbits=31 gives the gzip container rather than a raw zlib stream.
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class ZstdCompressor:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+class BrotliCompressor:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+# Content-Encoding name -> compressor class, for the codecs installed in this process.
+CODECS = {"gzip": GzipCompressor}
+if zstandard is not None:
+    CODECS["zstd"] = ZstdCompressor
+if brotli is not None:
+    CODECS["br"] = BrotliCompressor
+
+
+def negotiate_encoding(accept_encoding, preferred):
+    """
+    Returns the first encoding in `preferred` that is installed and accepted by an Accept-Encoding
+    header (by name or "*", with q > 0), or None to send the response uncompressed.
+    """
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, *params = [piece.strip() for piece in part.split(";")]
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.lower()] = q
+
+    for encoding in preferred:
+        if encoding not in CODECS:
+            continue
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding, level):
+    compressor = CODECS[encoding](level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(chunks, encoding, level):
+    """
+    Compresses an iterable of byte chunks on the fly, flushing after each chunk so nothing is held back.
+    """
+    compressor = CODECS[encoding](level)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
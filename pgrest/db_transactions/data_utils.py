@@ -1,9 +1,29 @@
+import queue
+import threading
 from re import split
 import psycopg2
 from . import config
+from .pool import get_pool, pooled_connection
+from pgrest import serialization
+from pgrest.cache import LRUCache
+from pgrest.invalidation import on_event
+from tapisservice.config import conf
 from tapisservice.logs import get_logger
 logger = get_logger(__name__)
 
+# Column catalog for tables and views, {(db_instance, tenant, obj_name): {'colName': 'dataType', ...}}
+# Entries must be invalidated whenever an object's columns change, see invalidate_column_catalog().
+COLUMN_CATALOG = LRUCache("column_catalog", maxsize=conf.column_catalog_max_size)
+
+# Per table/view modification counters behind data ETags, one row per (tenant, obj_name), created by the
+# database_tenants 0002_change_counters migration. Write paths bump the counter inside the transaction making
+# the change (do_transaction's `changes`), so a committed change always moves the ETag and a failed bump rolls
+# the change back. Rows are never deleted, so a recreated table keeps counting up instead of repeating old values.
+CHANGE_COUNTERS_TABLE = "public.pgrest_change_counters"
+
+# CopyStream hands COPY output out in chunks of about COPY_CHUNK_SIZE bytes, buffering at most COPY_QUEUE_SIZE chunks.
+COPY_CHUNK_SIZE = 64 * 1024
+COPY_QUEUE_SIZE = 8
 
 
 def parse_object_data(obj_description, obj_data):
@@ -31,15 +51,42 @@ def expose_primary_key(result_list, primary_key):
     return list_with_id_field
 
 
-def do_transaction(command, db_instance, parameterized_values=None):
+def bump_change_counter(cur, tenant, obj_name):
+    """
+    Bumps the change counter of tenant.obj_name on cur. Run it in the transaction that makes the change,
+    before the commit, so the data and its counter can't disagree.
+    """
+    cur.execute(f"INSERT INTO {CHANGE_COUNTERS_TABLE} AS counters (tenant, obj_name, counter) "
+                f"VALUES (%s, %s, 1) "
+                f"ON CONFLICT (tenant, obj_name) DO UPDATE SET counter = counters.counter + 1",
+                (tenant, obj_name))
+
+
+def get_change_counter(tenant, obj_name, db_instance):
+    """
+    Returns the change counter of tenant.obj_name, 0 if it was never written through PgREST.
+    """
+    with pooled_connection(db_instance) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT counter FROM {CHANGE_COUNTERS_TABLE} WHERE tenant = %s AND obj_name = %s",
+                        (tenant, obj_name))
+            row = cur.fetchone()
+        conn.commit()
+    return row[0] if row else 0
+
+
+def do_transaction(command, db_instance, parameterized_values=None, changes=None):
+    """
+    Runs command in its own transaction and returns (description, rows, affected_rows).
+    `changes`, a (tenant, obj_name) tuple, names the table or view the command modifies; its change
+    counter is bumped in the same transaction.
+    """
     conn = None
+    pool = None
     try:
-        # Read the connection parameters and connect to database.
-        if db_instance:
-            params = config.config(db_instance)
-        else:
-            params = config.config()
-        conn = psycopg2.connect(**params)
+        # Check a connection out of the pool for this db_instance.
+        pool = get_pool(db_instance)
+        conn = pool.getconn()
         cur = conn.cursor()
         
         # Mogrify, adds in parameterized_values if they exist, does nothing otherwise.
@@ -59,13 +106,18 @@ def do_transaction(command, db_instance, parameterized_values=None):
             # Got here because there's no results to fetch
             obj_unparsed_data = []
 
+        if changes:
+            bump_change_counter(cur, *changes)
+
         # Close cursor properly
         cur.close()
         conn.commit()
+        pool.putconn(conn)
 
     except psycopg2.DatabaseError as e:
         if conn:
-            conn.close()
+            # putconn rolls back the failed transaction, and drops the connection if it's broken.
+            pool.putconn(conn)
         msg = f"Error accessing database: {e}"
         # Check to see if this is actually a unique constraint collision.
         try:
@@ -77,7 +129,7 @@ def do_transaction(command, db_instance, parameterized_values=None):
         raise Exception(msg)
     except Exception as e:
         if conn:
-            conn.close()
+            pool.putconn(conn, discard=True)
         msg = f"Error executing command: {command}; e: {e}"
         logger.error(msg)
         raise Exception(msg)
@@ -86,16 +138,16 @@ def do_transaction(command, db_instance, parameterized_values=None):
     return obj_description, obj_unparsed_data, affected_rows
 
 
-def search_parse(search_params, tenant, obj_name, db_instance):
-    # 'obj' references 'database object', so both views and tables.
-    # search_params list is [[key, oper, value], ...]
-    parameterized_values = []
-
-    # We add where to command now to get ready for query        
-    command = " WHERE"
+def get_column_catalog(tenant, obj_name, db_instance):
+    """
+    Returns the columns of a table or view as {'colName': 'dataType', ...}, in column order.
+    Served from COLUMN_CATALOG so the filter/order hot path doesn't query pg_attribute every request.
+    """
+    key = (db_instance or 'default', tenant, obj_name)
+    obj_data_dict = COLUMN_CATALOG.get(key)
+    if obj_data_dict is not None:
+        return obj_data_dict
 
-    # If we have search_params we first have to get the objects's columns to ensure
-    # columns entered are indeed columns in the obj and not sql injection
     get_obj_data_cmd = (
         "SELECT attname AS column_name, format_type(atttypid, atttypmod) AS data_type "
         "FROM   pg_attribute "
@@ -106,12 +158,59 @@ def search_parse(search_params, tenant, obj_name, db_instance):
     obj_data = parse_object_data(obj_description, obj_unparsed_data)
     logger.info(f"Got obj data for : {tenant}.{obj_name}. Data: {obj_data}")
 
-    # Now we have the obj data, parse into dict of {'colName': 'dataType'}
+    # Now we have the obj data, parse into dict of {'colName': 'dataType', ...}
     obj_data_dict = {}
     if obj_data:
         for column_data in obj_data:
             obj_data_dict[column_data['column_name']] = column_data['data_type']
-            
+
+    COLUMN_CATALOG.set(key, obj_data_dict)
+    return obj_data_dict
+
+
+def get_unique_columns(tenant, obj_name, db_instance):
+    """
+    Returns the set of columns of a table or materialized view that have a single-column, non-partial unique index.
+    Plain views can't have indexes, so they have none.
+    """
+    command = ("SELECT a.attname FROM pg_index i "
+               "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0] "
+               f"WHERE i.indrelid = '{tenant}.{obj_name}'::regclass AND i.indisunique "
+               "AND i.indnatts = 1 AND i.indpred IS NULL;")
+    _, obj_unparsed_data, _ = do_transaction(command, db_instance)
+    return {row[0] for row in obj_unparsed_data}
+
+
+def invalidate_column_catalog(tenant, obj_name, db_instance=None):
+    """
+    Drops the cached columns of a table or view. Call after anything that creates, alters, renames or drops it.
+    """
+    COLUMN_CATALOG.pop((db_instance or 'default', tenant, obj_name))
+    logger.debug(f"Invalidated column catalog for {tenant}.{obj_name} on db_instance {db_instance}.")
+
+
+@on_event("tenant_objects")
+def invalidate_tenant_column_catalog(event):
+    """
+    Drops the cached columns of every table and view in a tenant.
+    """
+    db_instance = event.get("db_instance") or 'default'
+    tenant = event["tenant"]
+    COLUMN_CATALOG.evict(lambda key: key[0] == db_instance and key[1] == tenant)
+
+
+def search_parse(search_params, tenant, obj_name, db_instance):
+    # 'obj' references 'database object', so both views and tables.
+    # search_params list is [[key, oper, value], ...]
+    parameterized_values = []
+
+    # We add where to command now to get ready for query        
+    command = " WHERE"
+
+    # If we have search_params we first have to get the objects's columns to ensure
+    # columns entered are indeed columns in the obj and not sql injection
+    obj_data_dict = get_column_catalog(tenant, obj_name, db_instance)
+
     # Now we go through search params. First check if key is in objects's columns.
     # if it is we can modify the value to match the key data type (convert to timestamp if need be),
     # then we throw everything into the command.
@@ -214,21 +313,7 @@ def order_parse(order_string, tenant, obj_name, db_instance):
 
     # We have to get the objects's columns to ensure column entered
     # is indeed a column in the obj and not sql injection
-    get_obj_data_cmd = (
-        "SELECT attname AS column_name, format_type(atttypid, atttypmod) AS data_type "
-        "FROM   pg_attribute "
-        f"WHERE  attrelid = '{tenant}.{obj_name}'::regclass AND NOT attisdropped AND attnum > 0"
-        "ORDER  BY attnum;")
-    # Object data retrieved comes in the form [{'column_name': 'nameHere', 'data_type': 'integer'}, ...]
-    obj_description, obj_unparsed_data, _ = do_transaction(get_obj_data_cmd, db_instance)
-    obj_data = parse_object_data(obj_description, obj_unparsed_data)
-    logger.info(f"Got obj data for : {tenant}.{obj_name}. Data: {obj_data}")
-
-    # Now we have the obj data, parse into dict of {'colName': 'dataType', ...}
-    obj_data_dict = {}
-    if obj_data:
-        for column_data in obj_data:
-            obj_data_dict[column_data['column_name']] = column_data['data_type']
+    obj_data_dict = get_column_catalog(tenant, obj_name, db_instance)
 
     if not column_name in obj_data_dict:
         msg = f"Got a columnName of {column_name} in order. Not in valid column name, columns for this table are: {obj_data_dict.keys()}"
@@ -242,3 +327,343 @@ def order_parse(order_string, tenant, obj_name, db_instance):
     logger.info(f"Order part of command: {command}")
     
     return command
+
+
+def select_parse(select_string, tenant, obj_name, db_instance):
+    # 'obj' references 'database object', so both views and tables.
+    # input for select should be ?select=col_1,col_2, so select_string is col_1,col_2
+    # Returns the requested column names, in order and without duplicates.
+    columns = []
+    for column_name in select_string.split(','):
+        column_name = column_name.strip()
+        if column_name and column_name not in columns:
+            columns.append(column_name)
+    if not columns:
+        msg = f"Select must be a comma separated list of column names, e.g. 'col_1,col_2'. Got {select_string}"
+        logger.warning(msg)
+        raise Exception(msg)
+
+    # We have to get the objects's columns to ensure columns entered
+    # are indeed columns in the obj and not sql injection
+    obj_data_dict = get_column_catalog(tenant, obj_name, db_instance)
+    for column_name in columns:
+        if not column_name in obj_data_dict:
+            msg = f"Got a columnName of {column_name} in select. Not a valid column name, columns for this object are: {list(obj_data_dict.keys())}"
+            logger.warning(msg)
+            raise Exception(msg)
+    return columns
+
+
+def select_command(tenant, obj_name, search_params, limit, offset, db_instance, order=None, keyset=None, select=None):
+    """
+    Builds the SELECT for a list read of a table or view, with search params, order, limit and offset.
+    With a pgrest.pagination.Keyset, rows are ordered by the keyset and start after its continuation
+    point, and `order` is ignored (the keyset already includes it).
+    With `select` ('col_1,col_2'), only those columns are read, plus any columns the keyset needs
+    for its continuation token.
+    Returns (command, parameterized_values).
+    """
+    if select:
+        columns = select_parse(select, tenant, obj_name, db_instance)
+        if keyset is not None:
+            columns += [col for col in (keyset.order_column, keyset.key_column) if col and col not in columns]
+        command = f"SELECT {', '.join(columns)} FROM {tenant}.{obj_name}"
+    else:
+        command = f"SELECT * FROM {tenant}.{obj_name}"
+    parameterized_values = []
+    if search_params:
+        search_command, parameterized_values = search_parse(search_params, tenant, obj_name, db_instance)
+        command += search_command
+
+    if keyset is not None:
+        keyset_command, keyset_values = keyset.where()
+        if keyset_command:
+            command += (" AND " if search_params else " WHERE ") + keyset_command
+            parameterized_values = parameterized_values + keyset_values
+        command += keyset.order_by()
+    elif order is not None:
+        command += order_parse(order, tenant, obj_name, db_instance)
+
+    if limit:
+        command += f" LIMIT {int(limit)} "
+    if offset:
+        command += f" OFFSET {int(offset)};"
+    return command, parameterized_values
+
+
+def json_agg_command(command, primary_key=None):
+    """
+    Wraps a SELECT so Postgres returns its rows as one JSON array (a single text value) built with
+    json_agg, with the `_pkid` field added when primary_key is given. Timestamps come out in ISO 8601,
+    same as timestampJSONEncoder. The wrapped query's order is kept, json_agg aggregates rows in the
+    order the subquery returns them.
+    """
+    inner = command.strip().rstrip(";")
+    if primary_key:
+        inner = f"SELECT pgrest_query.*, pgrest_query.{primary_key} AS _pkid FROM ({inner}) AS pgrest_query"
+    return f"SELECT coalesce(json_agg(pgrest_rows), '[]')::text FROM ({inner}) AS pgrest_rows;"
+
+
+def fetch_json_rows(command, db_instance, parameterized_values=None, primary_key=None):
+    """
+    Runs a list read through json_agg_command and returns the JSON text of the result array,
+    ready for make_success_json. No per-row Python objects are created.
+    """
+    _, obj_unparsed_data, _ = do_transaction(json_agg_command(command, primary_key), db_instance,
+                                             parameterized_values)
+    return obj_unparsed_data[0][0]
+
+
+class RowStream:
+    """
+    Runs a query with a named (server-side) cursor and hands the rows out in batches of `batch_size`,
+    so only one batch is ever held in memory.
+
+    The query runs and the first batch is fetched when the stream is created, so errors in the query
+    raise before the caller starts responding. Iterate over the stream to get lists of row tuples; the
+    pooled connection is returned once iteration finishes, fails, or the stream is closed.
+    """
+    def __init__(self, command, db_instance, parameterized_values=None, batch_size=None):
+        self.batch_size = batch_size or conf.stream_batch_size
+        self._pool = get_pool(db_instance)
+        self._conn = self._pool.getconn()
+        self._cur = None
+        try:
+            self._cur = self._conn.cursor(name=f"pgrest_stream_{id(self)}")
+            self._cur.itersize = self.batch_size
+            logger.info(f"Streaming command: {command}; values: {parameterized_values}")
+            self._cur.execute(command, parameterized_values)
+            self._first_batch = self._cur.fetchmany(self.batch_size)
+        except Exception as e:
+            self.close(discard=not isinstance(e, psycopg2.DatabaseError))
+            msg = f"Error accessing database: {e}"
+            logger.error(msg)
+            raise Exception(msg)
+        # Named cursors only have a description once rows have been fetched.
+        self.description = self._cur.description
+        self.columns = [col[0] for col in self.description]
+        self.row_count = 0
+        self.last_row = None
+
+    def __iter__(self):
+        failed = False
+        try:
+            batch = self._first_batch
+            self._first_batch = None
+            while batch:
+                self.row_count += len(batch)
+                self.last_row = batch[-1]
+                yield batch
+                if len(batch) < self.batch_size:
+                    break
+                batch = self._cur.fetchmany(self.batch_size)
+        except Exception as e:
+            failed = True
+            logger.error(f"Error while streaming rows after {self.row_count} rows. e: {e}")
+            raise
+        finally:
+            # Also runs when the client goes away and the response closes this generator early.
+            self.close(discard=failed)
+
+    def close(self, discard=False):
+        if self._conn is None:
+            return
+        try:
+            if self._cur is not None and not self._cur.closed:
+                self._cur.close()
+        except Exception:
+            discard = True
+        # putconn rolls back the read-only transaction the cursor was opened in.
+        self._pool.putconn(self._conn, discard=discard)
+        self._conn = None
+
+
+class _CopyCancelled(Exception):
+    pass
+
+
+class _ChunkWriter:
+    """
+    File-like object for copy_expert. Groups COPY output into chunks of about COPY_CHUNK_SIZE bytes
+    and passes each one to emit().
+    """
+    def __init__(self, emit):
+        self.emit = emit
+        self.buffer = []
+        self.size = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= COPY_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            chunk = b"".join(self.buffer)
+            self.buffer = []
+            self.size = 0
+            self.emit(chunk)
+
+
+class CopyStream:
+    """
+    Runs `COPY (query) TO STDOUT` and hands the output out as byte chunks of about COPY_CHUNK_SIZE.
+
+    copy_expert only returns once the whole COPY is done, so it runs in a helper thread that passes
+    chunks to the iterating thread through a queue of COPY_QUEUE_SIZE chunks; memory use doesn't grow
+    with the result. Like RowStream, the first chunk is waited for when the stream is created so
+    errors in the query raise before the caller starts responding, and the pooled connection is
+    returned once iteration finishes, fails, or the stream is closed.
+    """
+    def __init__(self, query, db_instance, parameterized_values=None, options="FORMAT csv, HEADER"):
+        self._pool = get_pool(db_instance)
+        self._conn = self._pool.getconn()
+        self._queue = queue.Queue(maxsize=COPY_QUEUE_SIZE)
+        self._cancelled = threading.Event()
+        self._thread = None
+        self._first_item = None
+        try:
+            # COPY can't take parameters, so they're bound client side first.
+            with self._conn.cursor() as cur:
+                query = cur.mogrify(query.strip().rstrip(";"), parameterized_values).decode()
+            self.command = f"COPY ({query}) TO STDOUT WITH ({options})"
+            logger.info(f"Streaming command: {self.command}")
+            self._thread = threading.Thread(target=self._copy, name="pgrest-copy", daemon=True)
+            self._thread.start()
+            self._first_item = self._queue.get()
+            if self._first_item[0] == "error":
+                raise self._first_item[1]
+        except Exception as e:
+            self.close(discard=not isinstance(e, psycopg2.DatabaseError))
+            msg = f"Error accessing database: {e}"
+            logger.error(msg)
+            raise Exception(msg)
+
+    def _put(self, item):
+        # Waits for room in the queue, giving up if the stream was closed.
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+        raise _CopyCancelled()
+
+    def _copy(self):
+        writer = _ChunkWriter(lambda chunk: self._put(("data", chunk)))
+        try:
+            with self._conn.cursor() as cur:
+                cur.copy_expert(self.command, writer)
+            writer.flush()
+            self._put(("done", None))
+        except _CopyCancelled:
+            pass
+        except Exception as e:
+            try:
+                self._put(("error", e))
+            except _CopyCancelled:
+                pass
+
+    def __iter__(self):
+        failed = True
+        try:
+            item = self._first_item
+            self._first_item = None
+            while item is not None:
+                kind, value = item
+                if kind == "done":
+                    self._thread.join()
+                    failed = False
+                    break
+                if kind == "error":
+                    raise value
+                yield value
+                item = self._queue.get()
+        except Exception as e:
+            logger.error(f"Error while streaming COPY output. e: {e}")
+            raise
+        finally:
+            # Also runs when the client goes away and the response closes this generator early.
+            self.close(discard=failed)
+
+    def close(self, discard=False):
+        if self._conn is None:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            # Stop the COPY if it's still running, the connection can't be reused mid-COPY.
+            self._cancelled.set()
+            discard = True
+            try:
+                self._conn.cancel()
+            except Exception:
+                pass
+            self._thread.join()
+        self._pool.putconn(self._conn, discard=discard)
+        self._conn = None
+
+
+class ChunkReader:
+    """
+    File-like object for copy_expert's `COPY ... FROM STDIN`, reading from an iterable of byte chunks.
+    Chunks are only pulled as COPY asks for more data, so the whole input never has to be encoded at once.
+    Reads advance an offset into the buffered chunk instead of slicing off the rest, and the consumed part is
+    only dropped when the next chunk comes in, so each byte is copied a constant number of times.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = bytes(self._buffer[self._offset:]) + b"".join(self._chunks)
+            self._buffer, self._offset = bytearray(), 0
+            return data
+        while len(self._buffer) - self._offset < size:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                break
+            if self._offset:
+                del self._buffer[:self._offset]
+                self._offset = 0
+            self._buffer += chunk
+        data = bytes(self._buffer[self._offset:self._offset + size])
+        self._offset += len(data)
+        return data
+
+
+def _array_literal(values):
+    items = []
+    for item in values:
+        if item is None:
+            items.append("NULL")
+        elif isinstance(item, (list, tuple)):
+            items.append(_array_literal(item))
+        else:
+            if isinstance(item, bool):
+                item = "t" if item else "f"
+            item = str(item).replace("\\", "\\\\").replace('"', '\\"')
+            items.append(f'"{item}"')
+    return "{" + ",".join(items) + "}"
+
+
+def copy_csv_value(value, data_type=""):
+    """
+    Encodes a value as a field for `COPY ... WITH (FORMAT csv)`. NULL is an unquoted empty field and
+    everything else is quoted, so empty strings stay empty strings. Lists going to array columns
+    (data_type ending in '[]') become array literals, other lists and dicts become JSON.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        value = "t" if value else "f"
+    elif isinstance(value, (list, tuple)) and data_type.endswith("[]"):
+        value = _array_literal(value)
+    elif isinstance(value, (dict, list, tuple)):
+        value = serialization.dumps(value).decode()
+    else:
+        value = str(value)
+    value = value.replace('"', '""')
+    return f'"{value}"'
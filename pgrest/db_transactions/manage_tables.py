@@ -1,7 +1,7 @@
 import re
 import psycopg2
 from . import config
-from .data_utils import do_transaction
+from .data_utils import do_transaction, invalidate_column_catalog
 from tapisservice.logs import get_logger
 logger = get_logger(__name__)
 
@@ -208,6 +208,7 @@ def create_table(table_name, columns, existing_enum_names, constraints, tenant,
     # Run command
     try:
         do_transaction(command, db_instance)
+        invalidate_column_catalog(tenant, table_name, db_instance)
         logger.debug(f"Table {tenant}.{table_name} successfully created in postgres db.")
     except Exception as e:
         msg = f"Error creating table {tenant}.{table_name}: {e}"
@@ -224,6 +225,7 @@ def delete_table(table_name, tenant, db_instance=None):
     # Run command
     try:
         do_transaction(command, db_instance)
+        invalidate_column_catalog(tenant, table_name, db_instance)
         logger.info(f"Table {tenant}.{table_name} successfully dropped from postgres db.")
     except Exception as e:
         msg = f"Error dropping table {tenant}.{table_name}: {e}"
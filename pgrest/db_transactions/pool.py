@@ -0,0 +1,294 @@
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from tapisservice.config import conf
+from tapisservice.logs import get_logger
+
+from . import config
+logger = get_logger(__name__)
+
+
+class PoolExhaustedError(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections for a single db_instance.
+
+    Connections are checked for health when taken out of the pool and are
+    recycled once they are older than `max_age` seconds. Connections idle for
+    longer than `ping_after` seconds get a `SELECT 1` before being handed out.
+    """
+    def __init__(self, db_instance, min_size, max_size, max_age, ping_after, timeout):
+        self.db_instance = db_instance
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self.ping_after = ping_after
+        self.timeout = timeout
+
+        self._params = config.config(db_instance)
+        self._lock = threading.Condition()
+        self._idle = []       # [(conn, created_at, last_used), ...]
+        self._created = {}    # {id(conn): created_at} for every open connection we own
+        self._connecting = 0  # slots reserved by getconn() calls opening a connection outside the lock
+        self._closed = False
+
+        # Counters used by stats().
+        self._checkouts = 0
+        self._connects = 0
+        self._recycled = 0
+        self._discarded = 0
+        self._waits = 0
+        self._timeouts = 0
+
+        for _ in range(self.min_size):
+            try:
+                conn = self._connect()
+            except Exception as e:
+                logger.warning(f"Unable to prefill pool for db_instance {db_instance}. e: {e}")
+                break
+            self._idle.append((conn, self._created[id(conn)], time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._params)
+        self._register(conn)
+        return conn
+
+    def _register(self, conn):
+        self._created[id(conn)] = time.monotonic()
+        self._connects += 1
+
+    def _close(self, conn):
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, created_at):
+        """
+        Cheap checks for an idle connection, made under the lock. Pinging is left to _ping().
+        """
+        if conn.closed:
+            return False
+        if self.max_age and time.monotonic() - created_at > self.max_age:
+            self._recycled += 1
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        return True
+
+    def _ping(self, conn):
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+        except Exception as e:
+            logger.info(f"Pooled connection for db_instance {self.db_instance} failed health check. e: {e}")
+            return False
+        return True
+
+    def getconn(self):
+        """
+        Get a healthy connection from the pool, opening a new one if there's room.
+        Blocks for up to `timeout` seconds when the pool is at `max_size`.
+        Idle connections are pinged and new connections are opened outside the lock, so a slow, hung or
+        unreachable database doesn't hold up threads returning or taking other connections. A connection being
+        pinged stays counted as open, and a slot is reserved for one being opened.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._lock:
+                if self._closed:
+                    raise PoolExhaustedError(f"Connection pool for db_instance {self.db_instance} is closed.")
+                while True:
+                    while self._idle:
+                        conn, created_at, last_used = self._idle.pop()
+                        if self._is_usable(conn, created_at):
+                            break
+                        self._discarded += 1
+                        self._close(conn)
+                        conn = None
+                    if conn is not None:
+                        if self.ping_after is None or time.monotonic() - last_used <= self.ping_after:
+                            self._checkouts += 1
+                            return conn
+                        break
+
+                    if len(self._created) + self._connecting < self.max_size:
+                        self._connecting += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        msg = f"Connection pool for db_instance {self.db_instance} exhausted; " \
+                              f"{self.max_size} connections in use."
+                        logger.error(msg)
+                        raise PoolExhaustedError(msg)
+                    self._waits += 1
+                    self._lock.wait(remaining)
+
+            if conn is None:
+                break
+            # Idle longer than ping_after, check it's still alive.
+            if self._ping(conn):
+                with self._lock:
+                    self._checkouts += 1
+                return conn
+            with self._lock:
+                self._discarded += 1
+                self._created.pop(id(conn), None)
+                self._lock.notify()
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+        try:
+            conn = psycopg2.connect(**self._params)
+        except Exception:
+            with self._lock:
+                self._connecting -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._connecting -= 1
+            self._register(conn)
+            self._checkouts += 1
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """
+        Return a connection to the pool. Broken connections, connections with an open
+        transaction, and connections returned with discard=True are closed instead.
+        """
+        with self._lock:
+            created_at = self._created.get(id(conn))
+            if created_at is None:
+                # Not one of ours (or already closed by closeall()).
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                return
+            if not discard and not conn.closed:
+                try:
+                    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except Exception:
+                    discard = True
+            if discard or conn.closed or self._closed:
+                self._discarded += 1
+                self._close(conn)
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._lock.notify()
+
+    def closeall(self):
+        with self._lock:
+            self._closed = True
+            for conn, _, _ in self._idle:
+                self._close(conn)
+            self._idle = []
+            self._lock.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {"db_instance": self.db_instance,
+                    "min_size": self.min_size,
+                    "max_size": self.max_size,
+                    "open": len(self._created),
+                    "idle": len(self._idle),
+                    "in_use": len(self._created) - len(self._idle),
+                    "connecting": self._connecting,
+                    "checkouts": self._checkouts,
+                    "connects": self._connects,
+                    "recycled": self._recycled,
+                    "discarded": self._discarded,
+                    "waits": self._waits,
+                    "timeouts": self._timeouts}
+
+
+# Pools are keyed by db_instance name from conf.databases. With uWSGI lazy-apps each
+# worker process builds its own pools after forking, so connections are never shared
+# across processes.
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(db_instance=None):
+    """
+    Returns the connection pool for db_instance, creating it on first use.
+    """
+    if not db_instance:
+        db_instance = 'default'
+    pool = _POOLS.get(db_instance)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(db_instance)
+            if pool is None:
+                pool = ConnectionPool(db_instance,
+                                      min_size=conf.db_pool_min_size,
+                                      max_size=conf.db_pool_max_size,
+                                      max_age=conf.db_pool_max_age,
+                                      ping_after=conf.db_pool_ping_after,
+                                      timeout=conf.db_pool_timeout)
+                _POOLS[db_instance] = pool
+                logger.info(f"Created connection pool for db_instance {db_instance}.")
+    return pool
+
+
+@contextmanager
+def pooled_connection(db_instance=None):
+    """
+    Context manager that checks a connection out of the db_instance pool and returns it
+    on exit. Connections are discarded if the block raised a psycopg2 error so a broken
+    connection never makes it back into the pool.
+    """
+    pool = get_pool(db_instance)
+    conn = pool.getconn()
+    discard = False
+    try:
+        yield conn
+    except psycopg2.Error:
+        discard = True
+        raise
+    finally:
+        pool.putconn(conn, discard=discard)
+
+
+def pool_stats():
+    """
+    Returns stats for every pool created in this process, keyed by db_instance.
+    """
+    return {name: pool.stats() for name, pool in list(_POOLS.items())}
+
+
+def close_all_pools():
+    """
+    Close every pooled connection. Registered to run when the process exits, which
+    includes uWSGI recycling a worker after `max-requests`.
+    """
+    with _POOLS_LOCK:
+        for name, pool in _POOLS.items():
+            logger.info(f"Closing connection pool for db_instance {name}.")
+            pool.closeall()
+        _POOLS.clear()
+
+
+atexit.register(close_all_pools)
+try:
+    import uwsgi
+    uwsgi.atexit = close_all_pools
+except ImportError:
+    # Not running under uWSGI (tests, manage.py), atexit is enough.
+    pass
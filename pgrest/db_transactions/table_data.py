@@ -1,8 +1,12 @@
 import re
+import uuid
 import psycopg2
-from cerberus import Validator
 from . import config
-from .data_utils import do_transaction, parse_object_data, search_parse, order_parse, expose_primary_key
+from .data_utils import do_transaction, parse_object_data, search_parse, order_parse, select_parse, select_command, fetch_json_rows, RowStream, CopyStream, expose_primary_key
+from .data_utils import COPY_CHUNK_SIZE, ChunkReader, bump_change_counter, copy_csv_value, get_column_catalog
+from .pool import pooled_connection
+from pgrest.validation import format_row_errors, get_validator
+from tapisservice.config import conf
 from tapisservice.logs import get_logger
 logger = get_logger(__name__)
 
@@ -10,16 +14,25 @@ logger = get_logger(__name__)
 # Forbidden: \ ` ' " ~  / ? # [ ] ( ) @ ! $ & * + = - . , : ;
 FORBIDDEN_CHARS =  re.compile("^[^<>\\\/{}[\]~` $'\".:-?#@!$&()*+,;=]*$")
 
+# Value ranges of Postgres' integer types, by format_type() name.
+INTEGER_RANGES = {"smallint": (-2**15, 2**15 - 1),
+                  "integer": (-2**31, 2**31 - 1),
+                  "bigint": (-2**63, 2**63 - 1)}
 
-def get_row_from_table(table_name, pk_id, tenant, primary_key, db_instance=None):
+
+def get_row_from_table(table_name, pk_id, tenant, primary_key, db_instance=None, select=None):
     """
     Gets the row with given primary key from the specified table.
+    With `select` ('col_1,col_2'), only those columns are read.
     """
     logger.info(f"Getting row with pk {pk_id} from table {tenant}.{table_name}...")
+    columns = "*"
+    if select:
+        columns = ", ".join(select_parse(select, tenant, table_name, db_instance))
     if type(pk_id) == 'int' or type(pk_id) == 'float':
-        command = f"SELECT * FROM {tenant}.{table_name} WHERE {primary_key} = {pk_id};"
+        command = f"SELECT {columns} FROM {tenant}.{table_name} WHERE {primary_key} = {pk_id};"
     else:
-        command = f"SELECT * FROM {tenant}.{table_name} WHERE {primary_key} = '{pk_id}';"
+        command = f"SELECT {columns} FROM {tenant}.{table_name} WHERE {primary_key} = '{pk_id}';"
     
     # Run command
     try:
@@ -29,7 +42,8 @@ def get_row_from_table(table_name, pk_id, tenant, primary_key, db_instance=None)
             msg = f"Error. Received no result when retrieving row with pk \'{pk_id}\' from view {tenant}.{table_name}."
             logger.error(msg)
             raise Exception(msg)
-        expose_primary_key(result, primary_key)
+        if primary_key in result[0]:
+            expose_primary_key(result, primary_key)
         logger.info(f"Row {pk_id} successfully retrieved from view {tenant}.{table_name}.")
     except Exception as e:
         msg = f"Error retrieving row with pk \'{pk_id}\' from view {tenant}.{table_name}: {e}"
@@ -43,34 +57,58 @@ def get_rows_from_table(table_name, search_params, tenant, limit, offset, db_ins
     Gets all rows from given table with an optional limit and filter.
     """
     logger.info(f"Getting rows from table {tenant}.{table_name}")
-    command = f"SELECT * FROM {tenant}.{table_name}"
-
     # Add search params, order, limit, and offset to command
     try:
-        parameterized_values = []
-        if search_params:
-            search_command, parameterized_values = search_parse(search_params, tenant, table_name, db_instance)
-            command += search_command
-
-        if "order" in kwargs:
-            order = kwargs["order"]
-            order_command = order_parse(order, tenant, table_name, db_instance)
-            command += order_command
-
-        if limit:
-            command += f" LIMIT {int(limit)} "
-        if offset:
-            command += f" OFFSET {int(offset)};"
+        command, parameterized_values = select_command(tenant, table_name, search_params, limit, offset, db_instance,
+                                                       order=kwargs.get("order"),
+                                                       keyset=kwargs.get("keyset"),
+                                                       select=kwargs.get("select"))
     except Exception as e:
-        msg = f"Unable to add order, limit, offset, and search for table {tenant}.{table_name}: {e}"
+        msg = f"Unable to add select, order, limit, offset, and search for table {tenant}.{table_name}: {e}"
         logger.warning(msg)
         raise Exception(msg)
 
     # Run command
     try:
         obj_description, obj_unparsed_data, _ = do_transaction(command, db_instance, parameterized_values)
+        if kwargs.get("as_tuples"):
+            # Raw column names and row tuples, for response formats that don't use row dicts.
+            logger.info(f"Rows successfully retrieved from table {tenant}.{table_name}.")
+            return [col[0] for col in obj_description], obj_unparsed_data
         result = parse_object_data(obj_description, obj_unparsed_data)
-        expose_primary_key(result, primary_key)
+        # With ?select=, _pkid is only added when the primary key was selected.
+        if primary_key in [col[0] for col in obj_description]:
+            expose_primary_key(result, primary_key)
+        logger.info(f"Rows successfully retrieved from table {tenant}.{table_name}.")
+    except Exception as e:
+        msg = f"Error retrieving rows from table {tenant}.{table_name}: {e}"
+        logger.error(msg)
+        raise Exception(msg)
+    return result
+
+
+def get_rows_from_table_json(table_name, search_params, tenant, limit, offset, db_instance, primary_key, **kwargs):
+    """
+    Same query as get_rows_from_table, but Postgres builds the result with json_agg and this returns
+    the JSON text of the result array.
+    """
+    logger.info(f"Getting rows from table {tenant}.{table_name} as JSON")
+    try:
+        command, parameterized_values = select_command(tenant, table_name, search_params, limit, offset, db_instance,
+                                                       order=kwargs.get("order"),
+                                                       select=kwargs.get("select"))
+    except Exception as e:
+        msg = f"Unable to add select, order, limit, offset, and search for table {tenant}.{table_name}: {e}"
+        logger.warning(msg)
+        raise Exception(msg)
+
+    # With ?select=, _pkid is only added when the primary key was selected.
+    select = kwargs.get("select")
+    if select and primary_key not in select_parse(select, tenant, table_name, db_instance):
+        primary_key = None
+
+    try:
+        result = fetch_json_rows(command, db_instance, parameterized_values, primary_key)
         logger.info(f"Rows successfully retrieved from table {tenant}.{table_name}.")
     except Exception as e:
         msg = f"Error retrieving rows from table {tenant}.{table_name}: {e}"
@@ -79,6 +117,53 @@ def get_rows_from_table(table_name, search_params, tenant, limit, offset, db_ins
     return result
 
 
+def stream_rows_from_table(table_name, search_params, tenant, limit, offset, db_instance, **kwargs):
+    """
+    Same query as get_rows_from_table, but returns a RowStream that reads the rows in batches
+    through a server-side cursor instead of loading them all.
+    """
+    logger.info(f"Streaming rows from table {tenant}.{table_name}")
+    try:
+        command, parameterized_values = select_command(tenant, table_name, search_params, limit, offset, db_instance,
+                                                       order=kwargs.get("order"),
+                                                       keyset=kwargs.get("keyset"),
+                                                       select=kwargs.get("select"))
+    except Exception as e:
+        msg = f"Unable to add select, order, limit, offset, and search for table {tenant}.{table_name}: {e}"
+        logger.warning(msg)
+        raise Exception(msg)
+
+    try:
+        return RowStream(command, db_instance, parameterized_values)
+    except Exception as e:
+        msg = f"Error retrieving rows from table {tenant}.{table_name}: {e}"
+        logger.error(msg)
+        raise Exception(msg)
+
+
+def copy_rows_from_table(table_name, search_params, tenant, limit, offset, db_instance, **kwargs):
+    """
+    Same query as get_rows_from_table, but exported as CSV with a header row through
+    `COPY (...) TO STDOUT`. Returns a CopyStream of byte chunks.
+    """
+    logger.info(f"Exporting rows from table {tenant}.{table_name} as CSV")
+    try:
+        command, parameterized_values = select_command(tenant, table_name, search_params, limit, offset, db_instance,
+                                                       order=kwargs.get("order"),
+                                                       select=kwargs.get("select"))
+    except Exception as e:
+        msg = f"Unable to add select, order, limit, offset, and search for table {tenant}.{table_name}: {e}"
+        logger.warning(msg)
+        raise Exception(msg)
+
+    try:
+        return CopyStream(command, db_instance, parameterized_values)
+    except Exception as e:
+        msg = f"Error retrieving rows from table {tenant}.{table_name}: {e}"
+        logger.error(msg)
+        raise Exception(msg)
+
+
 def create_row(table_name, data, tenant, primary_key, db_instance=None):
     """
     Creates a new row in the given table. Returns the primary key ID of the new row.
@@ -103,7 +188,8 @@ def create_row(table_name, data, tenant, primary_key, db_instance=None):
 
     # Run command
     try:
-        obj_description, obj_unparsed_data, _ = do_transaction(command, db_instance, parameterized_values)
+        obj_description, obj_unparsed_data, _ = do_transaction(command, db_instance, parameterized_values,
+                                                               changes=(tenant, table_name))
         result = parse_object_data(obj_description, obj_unparsed_data)
         # We used "RETURNING %pk" in command, so we should get the PK value for later use.
         result_id = result[0][primary_key]
@@ -115,11 +201,12 @@ def create_row(table_name, data, tenant, primary_key, db_instance=None):
     return result_id
 
 
-def row_creator(table_name, data, tenant, primary_key, validate_json_create, db_instance=None):
+def row_creator(table_name, data, tenant, primary_key, validate_json_create, db_instance=None, table_id=None):
     """
     Creates new rows in a given table. Does it all in one transaction. Command will be the following.
     Returns the rows that are inserted. Note, this means we need column_names and value_lists to match
     throughout. Meaning we need to get all table columns, check column values, and list new data properly.
+    table_id is used to look up the table's cached validator.
     
     Command:
         INSERT INTO table_name (column_list)
@@ -148,17 +235,18 @@ def row_creator(table_name, data, tenant, primary_key, validate_json_create, db_
             logger.debug(msg)
             raise Exception(msg)
 
-        # Validate each row against the table's json schema.
-        try:
-            v = Validator(validate_json_create)
-            if not v.validate(row_def):
-                msg = f"Row definition determined invalid from validation schema; errors: {v.errors}; row def: {row_def}"
-                logger.warning(msg)
-                raise Exception(msg)
-        except Exception as e:
-            msg = f"Error occurred when validating the data from the validation schema; Details: {e}"
-            logger.error(msg)
-            raise Exception(msg)
+    # Validate all rows against the table's json schema in one pass with the table's cached validator.
+    try:
+        invalid_rows = get_validator(table_id, validate_json_create).validate_rows(data)
+    except Exception as e:
+        msg = f"Error occurred when validating the data from the validation schema; Details: {e}"
+        logger.error(msg)
+        raise Exception(msg)
+    if invalid_rows:
+        msg = f"Error occurred when validating the data from the validation schema; Details: " \
+              f"Row definition determined invalid from validation schema; errors: {format_row_errors(invalid_rows)}"
+        logger.warning(msg)
+        raise Exception(msg)
 
     # We get all column names from validate_json_create (table def on ManageTables)
     # we have INSERT reference all column_values. For each row, we either put in correct
@@ -205,7 +293,8 @@ def row_creator(table_name, data, tenant, primary_key, validate_json_create, db_
     # Run command
     logger.info("Created command and got parameterized values. Running command")
     try:
-        obj_description, obj_unparsed_data, _ = do_transaction(command, db_instance, parameterized_values)
+        obj_description, obj_unparsed_data, _ = do_transaction(command, db_instance, parameterized_values,
+                                                               changes=(tenant, table_name))
         row_creator_result = parse_object_data(obj_description, obj_unparsed_data)
         logger.info(f"Rows successfully added to table {tenant}.{table_name}.")
     except Exception as e:
@@ -215,6 +304,392 @@ def row_creator(table_name, data, tenant, primary_key, validate_json_create, db_
     return row_creator_result
 
 
+
+def _bulk_insert_chunks(data, columns, column_types, primary_key, validator, shapes):
+    """
+    Validates rows and encodes them as CSV for the bulk_insert_rows staging table, conf.bulk_insert_chunk_size
+    rows at a time. Each line is the row's index, its shape (the set of columns it gives, numbered in `shapes`)
+    and its column values.
+    """
+    chunk_size = conf.bulk_insert_chunk_size
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        for row_def in chunk:
+            if not isinstance(row_def, dict):
+                msg = f"Data lists during row creation should contain dicts of row_information. List contained type '{type(row_def)}'. Item: {row_def}"
+                logger.debug(msg)
+                raise Exception(msg)
+        invalid_rows = validator.validate_rows(chunk)
+        if invalid_rows:
+            for entry in invalid_rows:
+                entry["index"] += start
+            msg = f"Error occurred when validating the data from the validation schema; Details: " \
+                  f"Row definition determined invalid from validation schema; errors: {format_row_errors(invalid_rows)}"
+            logger.warning(msg)
+            raise Exception(msg)
+
+        lines = []
+        for index, row_def in enumerate(chunk, start):
+            pk_val = row_def.get(primary_key)
+            if isinstance(pk_val, str) and not FORBIDDEN_CHARS.match(pk_val):
+                msg = f"The primary_key value must be url safe. Value inputted for pk '{primary_key}' was '{pk_val}'"
+                logger.error(msg)
+                raise Exception(msg)
+            shape_columns = tuple(column for column in columns if column in row_def)
+            shape = shapes.setdefault(shape_columns, [len(shapes), 0])
+            shape[1] += 1
+            fields = [str(index), str(shape[0])]
+            fields.extend(copy_csv_value(row_def.get(column), column_types[column]) for column in columns)
+            lines.append(",".join(fields))
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def bulk_insert_rows(table_name, data, tenant, primary_key, validate_json_create, db_instance=None, table_id=None):
+    """
+    Bulk version of row_creator for large loads. Rows are validated and CSV encoded in chunks and streamed
+    with COPY ... FROM STDIN into a temporary staging table, then moved into the table with one
+    INSERT ... SELECT per distinct set of given columns. Columns a row leaves out still get their DEFAULT,
+    including the NOW() defaults of CREATETIME and UPDATETIME columns. Does it all in one transaction.
+
+    Returns counts and the range of inserted primary keys instead of the rows:
+        {"inserted": 500000, "primary_key": "table_id", "pk_min": 1, "pk_max": 500000}
+    """
+    logger.info(f"In bulk_insert_rows for {tenant}.{table_name}...")
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list):
+        msg = f"Data for row creation should be of type dict or list (which contains dicts). Received '{type(data)}'"
+        logger.debug(msg)
+        raise Exception(msg)
+
+    column_types = get_column_catalog(tenant, table_name, db_instance)
+    columns = [column for column in column_types if column in validate_json_create]
+    validator = get_validator(table_id, validate_json_create)
+    shapes = {} # {(col_one, col_two): [shape_number, row_count], ...}
+    staging = "pgrest_bulk_insert"
+    staging_columns = ", ".join(f"{column} {column_types[column]}" for column in columns)
+    result = {"inserted": 0, "primary_key": primary_key, "pk_min": None, "pk_max": None}
+
+    try:
+        with pooled_connection(db_instance) as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"CREATE TEMP TABLE {staging} (_pgrest_row bigint, _pgrest_shape integer"
+                            f"{', ' if columns else ''}{staging_columns}) ON COMMIT DROP;")
+                cur.copy_expert(f"COPY {staging} (_pgrest_row, _pgrest_shape{', ' if columns else ''}{', '.join(columns)}) "
+                                "FROM STDIN WITH (FORMAT csv)",
+                                ChunkReader(_bulk_insert_chunks(data, columns, column_types, primary_key, validator, shapes)),
+                                size=COPY_CHUNK_SIZE)
+
+                for shape_columns, (shape, row_count) in shapes.items():
+                    if shape_columns:
+                        column_list = ", ".join(shape_columns)
+                        commands = [f"INSERT INTO {tenant}.{table_name} ({column_list}) SELECT {column_list} "
+                                    f"FROM {staging} WHERE _pgrest_shape = {shape} ORDER BY _pgrest_row"]
+                    else:
+                        # Rows giving no columns at all are all DEFAULTs, which INSERT ... SELECT can't express.
+                        commands = [f"INSERT INTO {tenant}.{table_name} DEFAULT VALUES"] * row_count
+                    for command in commands:
+                        cur.execute(f"WITH inserted AS ({command} RETURNING {primary_key}) "
+                                    f"SELECT count(*), min({primary_key}), max({primary_key}) FROM inserted;")
+                        inserted, pk_min, pk_max = cur.fetchone()
+                        result["inserted"] += inserted
+                        if pk_min is not None and (result["pk_min"] is None or pk_min < result["pk_min"]):
+                            result["pk_min"] = pk_min
+                        if pk_max is not None and (result["pk_max"] is None or pk_max > result["pk_max"]):
+                            result["pk_max"] = pk_max
+                bump_change_counter(cur, tenant, table_name)
+            conn.commit()
+        logger.info(f"{result['inserted']} rows successfully bulk inserted into table {tenant}.{table_name}.")
+    except Exception as e:
+        msg = f"Error bulk inserting rows into table {tenant}.{table_name}: {e}"
+        logger.error(msg)
+        raise Exception(msg)
+    return result
+
+
+def bulk_insert_row_chunks(table_name, rows, tenant, primary_key, validate_json_create, chunk_size, db_instance=None,
+                           table_id=None):
+    """
+    Inserts an iterable of rows with bulk_insert_rows, chunk_size rows and one transaction at a time, so rows
+    can be read as they're inserted. Yields a summary per committed chunk:
+        {"chunk": 0, "first_row": 0, "inserted": 10000, "pk_min": 1, "pk_max": 10000}
+    Stops with an Exception at the first chunk that fails; earlier chunks stay committed.
+    """
+    def insert_chunk(chunk_number, first_row, chunk):
+        try:
+            result = bulk_insert_rows(table_name, chunk, tenant, primary_key, validate_json_create,
+                                      db_instance=db_instance, table_id=table_id)
+        except Exception as e:
+            msg = f"Chunk {chunk_number} (rows {first_row}-{first_row + len(chunk) - 1}) failed. {e}"
+            logger.error(msg)
+            raise Exception(msg)
+        return {"chunk": chunk_number,
+                "first_row": first_row,
+                "inserted": result["inserted"],
+                "pk_min": result["pk_min"],
+                "pk_max": result["pk_max"]}
+
+    chunk = []
+    chunk_number = 0
+    first_row = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield insert_chunk(chunk_number, first_row, chunk)
+            chunk_number += 1
+            first_row += len(chunk)
+            chunk = []
+    if chunk:
+        yield insert_chunk(chunk_number, first_row, chunk)
+
+
+def upsert_rows(table_name, data, tenant, primary_key, validate_json_create, on_conflict, constraints=None,
+                special_rules=None, db_instance=None, table_id=None):
+    """
+    Inserts rows, updating the existing row instead wherever a row conflicts with one on `on_conflict`, which
+    is the table's primary key column or the name of one of its unique constraints. Rows go to Postgres
+    conf.batch_write_chunk_size at a time, with one statement per chunk for each set of given columns, all in
+    one transaction. Only the columns a row gives are updated; UPDATETIME columns it doesn't give are set to NOW().
+    Rows sharing a conflict key are merged into one first, later rows' values winning, which leaves the table as
+    upserting them one by one would (Postgres can't update a row twice in one statement).
+    Returns {"inserted": count, "updated": count}, counting merged rows once.
+
+    Command:
+        INSERT INTO table_name (column_list)
+        VALUES
+            (value_list_1),
+            (value_list_2)
+        ON CONFLICT (primary_key) DO UPDATE SET col_one = EXCLUDED.col_one, ...
+    """
+    logger.info(f"In upsert_rows for {tenant}.{table_name}...")
+    unique_constraints = (constraints or {}).get("unique", {})
+    if on_conflict == primary_key:
+        conflict_target = f"({primary_key})"
+        conflict_columns = [primary_key]
+    elif on_conflict in unique_constraints:
+        conflict_target = f"ON CONSTRAINT {on_conflict}"
+        conflict_columns = unique_constraints[on_conflict]
+    else:
+        msg = f"on_conflict must be the table's primary key '{primary_key}' or the name of one of its unique " \
+              f"constraints {list(unique_constraints)}. Received '{on_conflict}'"
+        logger.debug(msg)
+        raise Exception(msg)
+
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or not all(isinstance(row_def, dict) for row_def in data):
+        msg = f"Data for upserts should be a dict or a list of dicts. Received '{type(data)}'"
+        logger.debug(msg)
+        raise Exception(msg)
+
+    invalid_rows = get_validator(table_id, validate_json_create).validate_rows(data)
+    if invalid_rows:
+        msg = f"Error occurred when validating the data from the validation schema; Details: " \
+              f"Row definition determined invalid from validation schema; errors: {format_row_errors(invalid_rows)}"
+        logger.warning(msg)
+        raise Exception(msg)
+    for row_def in data:
+        pk_val = row_def.get(primary_key)
+        if isinstance(pk_val, str) and not FORBIDDEN_CHARS.match(pk_val):
+            msg = f"The primary_key value must be url safe. Value inputted for pk '{primary_key}' was '{pk_val}'"
+            logger.error(msg)
+            raise Exception(msg)
+
+    # Merge rows with the same conflict key. Rows missing part of the key (NULLs never conflict) are kept as is.
+    merged = {} # {conflict key or row index: row_def}
+    for index, row_def in enumerate(data):
+        key = tuple(row_def.get(column) for column in conflict_columns)
+        if None in key:
+            key = index
+        merged[key] = {**merged[key], **row_def} if key in merged else row_def
+    if len(merged) < len(data):
+        logger.info(f"Merged {len(data) - len(merged)} rows with repeated conflict keys.")
+    data = list(merged.values())
+
+    columns = list(validate_json_create)
+    updatetime_columns = (special_rules or {}).get("UPDATETIME", [])
+    chunk_size = conf.batch_write_chunk_size
+    result = {"inserted": 0, "updated": 0}
+
+    try:
+        with pooled_connection(db_instance) as conn:
+            with conn.cursor() as cur:
+                for start in range(0, len(data), chunk_size):
+                    shapes = {} # {(col_one, col_two): [row_def, ...]}
+                    for row_def in data[start:start + chunk_size]:
+                        shape_columns = tuple(column for column in columns if column in row_def)
+                        shapes.setdefault(shape_columns, []).append(row_def)
+                    for shape_columns, rows in shapes.items():
+                        if not shape_columns:
+                            msg = "Rows being upserted need at least one column value."
+                            logger.debug(msg)
+                            raise Exception(msg)
+                        updates = [f"{column} = EXCLUDED.{column}" for column in shape_columns
+                                   if column not in conflict_columns]
+                        updates += [f"{column} = NOW()" for column in updatetime_columns if column not in shape_columns]
+                        if not updates:
+                            # Nothing to change, but DO NOTHING wouldn't return the conflicting rows to count.
+                            updates = [f"{conflict_columns[0]} = EXCLUDED.{conflict_columns[0]}"]
+                        row_template = f"({', '.join(['%s'] * len(shape_columns))})"
+                        parameterized_values = [row_def[column] for row_def in rows for column in shape_columns]
+                        # xmax is 0 on rows the statement inserted and set on rows it updated.
+                        command = f"WITH upserted AS (" \
+                                  f"INSERT INTO {tenant}.{table_name} ({', '.join(shape_columns)}) " \
+                                  f"VALUES {', '.join([row_template] * len(rows))} " \
+                                  f"ON CONFLICT {conflict_target} DO UPDATE SET {', '.join(updates)} " \
+                                  f"RETURNING (xmax = 0) AS inserted) " \
+                                  f"SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted;"
+                        cur.execute(command, parameterized_values)
+                        inserted, updated = cur.fetchone()
+                        result["inserted"] += inserted
+                        result["updated"] += updated
+                bump_change_counter(cur, tenant, table_name)
+            conn.commit()
+        logger.info(f"Upserted rows in table {tenant}.{table_name}: {result}")
+    except Exception as e:
+        msg = f"Error upserting rows in table {tenant}.{table_name}: {e}"
+        logger.error(msg)
+        raise Exception(msg)
+    return result
+
+
+def _cast_pk(pk, pk_type):
+    """
+    Converts a primary key value from a request body to the Python type psycopg2 sends as pk_type, the column's
+    format_type() name. Raises ValueError for values Postgres would refuse to cast. Types not checked here are
+    passed through as given.
+    """
+    if isinstance(pk, bool) or pk is None:
+        raise ValueError(f"Invalid pk {pk}")
+    if pk_type in INTEGER_RANGES:
+        if isinstance(pk, float) and not pk.is_integer():
+            raise ValueError(f"Invalid pk {pk}")
+        try:
+            value = int(pk.strip()) if isinstance(pk, str) else int(pk)
+        except (TypeError, OverflowError) as e:
+            raise ValueError(f"Invalid pk {pk}. e: {e}")
+        low, high = INTEGER_RANGES[pk_type]
+        if not low <= value <= high:
+            raise ValueError(f"pk {pk} is out of range for {pk_type}")
+        return value
+    if pk_type == "uuid":
+        return str(uuid.UUID(str(pk)))
+    if pk_type == "text" or pk_type.startswith(("character varying", "character(")):
+        if not isinstance(pk, (str, int)):
+            raise ValueError(f"Invalid pk {pk}")
+        return str(pk)
+    return pk
+
+
+def update_rows_with_pks(table_name, updates, tenant, primary_key, validate_json_update, special_rules=None,
+                         db_instance=None, table_id=None):
+    """
+    Updates many rows by primary key, each with its own values. updates is a list of {"pk": pk, "changes": {...}}
+    objects. pks are checked against the primary key's type and changes against the update schema first, so bad
+    entries are reported on their own instead of failing the batch. The valid ones are applied conf.batch_write_chunk_size at a time,
+    with one statement per chunk for each set of changed columns, all in one transaction. UPDATETIME columns
+    an update doesn't set are set to NOW().
+    Returns {"updated": count, "failed": count, "results": [{"pk": pk, "success": True}, ...]}, in the order of
+    updates; failed entries have an "error" instead.
+
+    Command:
+        UPDATE table_name SET col_one = v.col_one, ...
+        FROM (VALUES (pk_1, col_one_val_1), (pk_2, col_one_val_2)) AS v (_pgrest_pk, col_one)
+        WHERE table_name.primary_key = v._pgrest_pk
+        RETURNING table_name.primary_key
+    """
+    logger.info(f"In update_rows_with_pks for {tenant}.{table_name}...")
+    if not isinstance(updates, list):
+        msg = f"Updates should be a list of {{'pk': pk, 'changes': {{...}}}} objects. Received '{type(updates)}'"
+        logger.debug(msg)
+        raise Exception(msg)
+
+    column_types = get_column_catalog(tenant, table_name, db_instance)
+    pk_type = column_types[primary_key]
+    results = []
+    candidates = [] # [(index, pk, changes), ...]
+    seen_pks = set()
+    for index, update in enumerate(updates):
+        if not isinstance(update, dict) or "pk" not in update or not isinstance(update.get("changes"), dict):
+            results.append({"pk": update.get("pk") if isinstance(update, dict) else None,
+                            "success": False,
+                            "error": "Each update should be an object with 'pk' and a 'changes' object."})
+            continue
+        pk, changes = update["pk"], update["changes"]
+        results.append({"pk": pk, "success": False})
+        if not changes:
+            results[index]["error"] = "changes is empty."
+            continue
+        # One pk Postgres can't cast would abort its whole chunk, so bad pks are caught here.
+        try:
+            pk = _cast_pk(pk, pk_type)
+        except ValueError:
+            results[index]["error"] = f"pk '{pk}' is not a valid {pk_type}."
+            continue
+        new_pk = changes.get(primary_key)
+        if str(pk) in seen_pks:
+            results[index]["error"] = "pk is given more than once in this batch."
+        elif isinstance(new_pk, str) and not FORBIDDEN_CHARS.match(new_pk):
+            results[index]["error"] = f"The primary_key value must be url safe. Value inputted for pk '{primary_key}' was '{new_pk}'"
+        else:
+            seen_pks.add(str(pk))
+            candidates.append((index, pk, changes))
+
+    validator = get_validator(table_id, validate_json_update)
+    invalid_rows = {entry["index"]: entry["errors"]
+                    for entry in validator.validate_rows([changes for _, _, changes in candidates])}
+    valid = [] # [(index, pk, changes), ...]
+    for position, (index, pk, changes) in enumerate(candidates):
+        if position in invalid_rows:
+            results[index]["error"] = f"Data determined invalid from json validation schema: {invalid_rows[position]}"
+        else:
+            valid.append((index, pk, changes))
+
+    if valid:
+        columns = list(validate_json_update)
+        updatetime_columns = (special_rules or {}).get("UPDATETIME", [])
+        chunk_size = conf.batch_write_chunk_size
+        try:
+            with pooled_connection(db_instance) as conn:
+                with conn.cursor() as cur:
+                    for start in range(0, len(valid), chunk_size):
+                        shapes = {} # {(col_one, col_two): [(index, pk, changes), ...]}
+                        for entry in valid[start:start + chunk_size]:
+                            shape_columns = tuple(column for column in columns if column in entry[2])
+                            shapes.setdefault(shape_columns, []).append(entry)
+                        for shape_columns, entries in shapes.items():
+                            sets = [f"{column} = v.{column}" for column in shape_columns]
+                            sets += [f"{column} = NOW()" for column in updatetime_columns if column not in shape_columns]
+                            # VALUES has no column types to go by, so every value is cast to its column's type.
+                            row_template = "(" + ", ".join(f"%s::{column_types[column]}"
+                                                           for column in (primary_key,) + shape_columns) + ")"
+                            parameterized_values = []
+                            for _, pk, changes in entries:
+                                parameterized_values.append(pk)
+                                parameterized_values.extend(changes[column] for column in shape_columns)
+                            command = f"UPDATE {tenant}.{table_name} SET {', '.join(sets)} " \
+                                      f"FROM (VALUES {', '.join([row_template] * len(entries))}) " \
+                                      f"AS v (_pgrest_pk, {', '.join(shape_columns)}) " \
+                                      f"WHERE {table_name}.{primary_key} = v._pgrest_pk " \
+                                      f"RETURNING {table_name}.{primary_key};"
+                            cur.execute(command, parameterized_values)
+                            updated_pks = {str(row[0]) for row in cur.fetchall()}
+                            for index, pk, _ in entries:
+                                if str(pk) in updated_pks:
+                                    results[index]["success"] = True
+                                else:
+                                    results[index]["error"] = f"No row with pk '{pk}'."
+                    bump_change_counter(cur, tenant, table_name)
+                conn.commit()
+        except Exception as e:
+            msg = f"Error updating rows in table {tenant}.{table_name}: {e}"
+            logger.error(msg)
+            raise Exception(msg)
+
+    updated = sum(1 for result in results if result["success"])
+    logger.info(f"{updated} of {len(results)} rows were successfully updated in table {tenant}.{table_name}.")
+    return {"updated": updated, "failed": len(results) - updated, "results": results}
+
 def delete_row(table_name, pk_id, tenant, primary_key, db_instance=None):
     """
     Deletes the specified row in the given table.
@@ -227,7 +702,7 @@ def delete_row(table_name, pk_id, tenant, primary_key, db_instance=None):
 
     # Run command
     try:
-        _, _, affected_rows = do_transaction(command, db_instance)
+        _, _, affected_rows = do_transaction(command, db_instance, changes=(tenant, table_name))
         if affected_rows == 0:
             msg = f"Error. Delete row affected 0 rows, expected to delete 1."
             logger.error(msg)
@@ -239,6 +714,66 @@ def delete_row(table_name, pk_id, tenant, primary_key, db_instance=None):
         raise Exception(msg)
 
 
+
+def delete_rows(table_name, tenant, primary_key, db_instance=None, search_params=None, pks=None):
+    """
+    Deletes the rows matching search_params, or the rows with the primary keys in pks. Rows are deleted
+    conf.delete_batch_size at a time, each batch in its own transaction, so a large purge never holds its locks
+    or writes all of its WAL in one transaction. Batches that already ran stay deleted if a later one fails.
+    Returns {"deleted": count, "batches": count, "truncated": bool}.
+
+    Where clauses stop at the first batch deleting fewer than delete_batch_size rows, so rows a concurrent update
+    moves mid-batch (their ctid changes between the subselect and the delete) can be left behind; repeat the
+    request to catch them. Matching rows inserted concurrently could keep the loop going, so it also stops after
+    conf.delete_max_batches batches and sets "truncated".
+
+    Command (repeated until a batch deletes fewer than delete_batch_size rows):
+        DELETE FROM table_name WHERE ctid IN (SELECT ctid FROM table_name WHERE ... LIMIT delete_batch_size)
+    """
+    logger.info(f"Deleting rows in {tenant}.{table_name}...")
+    if not search_params and not pks:
+        msg = "Deleting rows requires a where clause or a list of primary keys."
+        logger.debug(msg)
+        raise Exception(msg)
+    batch_size = conf.delete_batch_size
+    result = {"deleted": 0, "batches": 0, "truncated": False}
+
+    try:
+        if pks:
+            if not isinstance(pks, list):
+                msg = f"pks should be a list of primary keys. Received '{type(pks)}'"
+                logger.debug(msg)
+                raise Exception(msg)
+            pk_type = get_column_catalog(tenant, table_name, db_instance)[primary_key]
+            command = f"DELETE FROM {tenant}.{table_name} WHERE {primary_key} = ANY(%s::{pk_type}[]);"
+            for start in range(0, len(pks), batch_size):
+                _, _, affected_rows = do_transaction(command, db_instance, [pks[start:start + batch_size]],
+                                                     changes=(tenant, table_name))
+                result["deleted"] += affected_rows
+                result["batches"] += 1
+        else:
+            search_command, parameterized_values = search_parse(search_params, tenant, table_name, db_instance)
+            command = f"DELETE FROM {tenant}.{table_name} WHERE ctid IN " \
+                      f"(SELECT ctid FROM {tenant}.{table_name}{search_command} LIMIT {int(batch_size)});"
+            while True:
+                if result["batches"] >= conf.delete_max_batches:
+                    result["truncated"] = True
+                    logger.warning(f"Stopped deleting rows in {tenant}.{table_name} after "
+                                   f"{conf.delete_max_batches} batches.")
+                    break
+                _, _, affected_rows = do_transaction(command, db_instance, parameterized_values,
+                                                     changes=(tenant, table_name))
+                result["deleted"] += affected_rows
+                result["batches"] += 1
+                if affected_rows < batch_size:
+                    break
+        logger.info(f"{result['deleted']} rows were successfully deleted from table {tenant}.{table_name}.")
+    except Exception as e:
+        msg = f"Error deleting rows in table {tenant}.{table_name} after {result['deleted']} rows were deleted: {e}"
+        logger.error(msg)
+        raise Exception(msg)
+    return result
+
 def update_row_with_pk(table_name, pk_id, data, tenant, primary_key, db_instance=None):
     """
     Updates a specified row on a table with the given columns and associated values.
@@ -259,7 +794,7 @@ def update_row_with_pk(table_name, pk_id, data, tenant, primary_key, db_instance
 
     # Run command
     try:
-        _, _, affected_rows = do_transaction(command, db_instance)
+        _, _, affected_rows = do_transaction(command, db_instance, changes=(tenant, table_name))
         if affected_rows == 0:
             msg = f"Error. Delete row affected 0 rows, expected to delete 1."
             logger.error(msg)
@@ -296,7 +831,8 @@ def update_rows_with_where(table_name, data, tenant, db_instance, search_params=
     
     # Run command
     try:
-        obj_description, obj_unparsed_data, affected_rows = do_transaction(command, db_instance, parameterized_values)
+        obj_description, obj_unparsed_data, affected_rows = do_transaction(command, db_instance, parameterized_values,
+                                                                                changes=(tenant, table_name))
         logger.info(f"{affected_rows} rows were successfully updated in table {tenant}.{table_name}.")
     except Exception as e:
         msg = f"Error updating rows in table {tenant}.{table_name}: {e}"
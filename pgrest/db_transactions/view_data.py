@@ -1,7 +1,7 @@
 import re
 import psycopg2
 from . import config
-from .data_utils import do_transaction, parse_object_data, search_parse, order_parse
+from .data_utils import do_transaction, parse_object_data, search_parse, order_parse, select_command, fetch_json_rows, RowStream, CopyStream, invalidate_column_catalog
 from tapisservice.logs import get_logger
 logger = get_logger(__name__)
 
@@ -37,32 +37,24 @@ def get_rows_from_view(view_name, search_params, tenant, limit, offset, db_insta
     Gets all rows from given table with an optional limit and filter.
     """
     logger.info(f"Getting rows from table {tenant}.{view_name}")
-    command = f"SELECT * FROM {tenant}.{view_name}"
-
     # Add search params, order, limit, and offset to command
     try:
-        parameterized_values = []
-        if search_params:
-            search_command, parameterized_values = search_parse(search_params, tenant, view_name, db_instance)
-            command += search_command
-
-        if "order" in kwargs:
-            order = kwargs["order"]
-            order_command = order_parse(order, tenant, view_name, db_instance)
-            command += order_command
-
-        if limit:
-            command += f" LIMIT {int(limit)} "
-        if offset:
-            command += f" OFFSET {int(offset)};"
+        command, parameterized_values = select_command(tenant, view_name, search_params, limit, offset, db_instance,
+                                                       order=kwargs.get("order"),
+                                                       keyset=kwargs.get("keyset"),
+                                                       select=kwargs.get("select"))
     except Exception as e:
-        msg = f"Unable to add order, limit, offset, and search for view {tenant}.{view_name}: {e}"
+        msg = f"Unable to add select, order, limit, offset, and search for view {tenant}.{view_name}: {e}"
         logger.warning(msg)
         raise Exception(msg)
 
     # Run command
     try:
         obj_description, obj_unparsed_data, _ = do_transaction(command, db_instance, parameterized_values)
+        if kwargs.get("as_tuples"):
+            # Raw column names and row tuples, for response formats that don't use row dicts.
+            logger.info(f"Rows successfully retrieved from view {tenant}.{view_name}.")
+            return [col[0] for col in obj_description], obj_unparsed_data
         result = parse_object_data(obj_description, obj_unparsed_data)
         logger.info(f"Rows successfully retrieved from view {tenant}.{view_name}.")
     except Exception as e:
@@ -72,6 +64,78 @@ def get_rows_from_view(view_name, search_params, tenant, limit, offset, db_insta
     return result
 
 
+def get_rows_from_view_json(view_name, search_params, tenant, limit, offset, db_instance, **kwargs):
+    """
+    Same query as get_rows_from_view, but Postgres builds the result with json_agg and this returns
+    the JSON text of the result array.
+    """
+    logger.info(f"Getting rows from view {tenant}.{view_name} as JSON")
+    try:
+        command, parameterized_values = select_command(tenant, view_name, search_params, limit, offset, db_instance,
+                                                       order=kwargs.get("order"),
+                                                       select=kwargs.get("select"))
+    except Exception as e:
+        msg = f"Unable to add select, order, limit, offset, and search for view {tenant}.{view_name}: {e}"
+        logger.warning(msg)
+        raise Exception(msg)
+
+    try:
+        result = fetch_json_rows(command, db_instance, parameterized_values)
+        logger.info(f"Rows successfully retrieved from view {tenant}.{view_name}.")
+    except Exception as e:
+        msg = f"Error retrieving rows from view {tenant}.{view_name}: {e}"
+        logger.error(msg)
+        raise Exception(msg)
+    return result
+
+
+def stream_rows_from_view(view_name, search_params, tenant, limit, offset, db_instance, **kwargs):
+    """
+    Same query as get_rows_from_view, but returns a RowStream that reads the rows in batches
+    through a server-side cursor instead of loading them all.
+    """
+    logger.info(f"Streaming rows from view {tenant}.{view_name}")
+    try:
+        command, parameterized_values = select_command(tenant, view_name, search_params, limit, offset, db_instance,
+                                                       order=kwargs.get("order"),
+                                                       keyset=kwargs.get("keyset"),
+                                                       select=kwargs.get("select"))
+    except Exception as e:
+        msg = f"Unable to add select, order, limit, offset, and search for view {tenant}.{view_name}: {e}"
+        logger.warning(msg)
+        raise Exception(msg)
+
+    try:
+        return RowStream(command, db_instance, parameterized_values)
+    except Exception as e:
+        msg = f"Error retrieving rows from view {tenant}.{view_name}: {e}"
+        logger.error(msg)
+        raise Exception(msg)
+
+
+def copy_rows_from_view(view_name, search_params, tenant, limit, offset, db_instance, **kwargs):
+    """
+    Same query as get_rows_from_view, but exported as CSV with a header row through
+    `COPY (...) TO STDOUT`. Returns a CopyStream of byte chunks.
+    """
+    logger.info(f"Exporting rows from view {tenant}.{view_name} as CSV")
+    try:
+        command, parameterized_values = select_command(tenant, view_name, search_params, limit, offset, db_instance,
+                                                       order=kwargs.get("order"),
+                                                       select=kwargs.get("select"))
+    except Exception as e:
+        msg = f"Unable to add select, order, limit, offset, and search for view {tenant}.{view_name}: {e}"
+        logger.warning(msg)
+        raise Exception(msg)
+
+    try:
+        return CopyStream(command, db_instance, parameterized_values)
+    except Exception as e:
+        msg = f"Error retrieving rows from view {tenant}.{view_name}: {e}"
+        logger.error(msg)
+        raise Exception(msg)
+
+
 def create_view(view_name, view_definition, tenant, db_instance=None):
     """Create view in the PostgreSQL database"""
     try:
@@ -103,6 +167,7 @@ def create_view(view_name, view_definition, tenant, db_instance=None):
     # Run command
     try:
         do_transaction(command, db_instance)
+        invalidate_column_catalog(tenant, view_name, db_instance)
         if materialized_view_raw_sql:
             logger.debug(f"Materialized view {tenant}.{view_name} successfully created in postgres db.")
         else:
@@ -129,6 +194,7 @@ def delete_view(view_name, tenant, materialized_view=False, db_instance=None):
     # Run command
     try:
         do_transaction(command, db_instance)
+        invalidate_column_catalog(tenant, view_name, db_instance)
         if materialized_view:
             logger.info(f"Materialized view {tenant}.{view_name} successfully dropped from postgres db.")
         else:   
@@ -150,7 +216,7 @@ def refresh_view(view_name, tenant, db_instance=None):
 
     # Run command
     try:
-        do_transaction(command, db_instance)
+        do_transaction(command, db_instance, changes=(tenant, view_name))
         logger.info(f"Materialized view {tenant}.{view_name} successfully refreshed in postgres db.")
     except Exception as e:
         msg = f"Error refreshing materialized view {tenant}.{view_name}: {e}"
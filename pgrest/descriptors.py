@@ -0,0 +1,86 @@
+import threading
+from collections import namedtuple
+
+from pgrest.cache import LRUCache
+from pgrest.invalidation import on_event
+from pgrest.models import ManageTables, ManageViews
+from tapisservice.config import conf
+from tapisservice.logs import get_logger
+logger = get_logger(__name__)
+
+# What the data endpoints need to know about a table or view. Field names match the model fields so
+# descriptors can be used in place of model instances. Descriptors are shared between requests, so the
+# dict fields (schemas, special_rules, constraints, view_definition) must be treated as read-only.
+TableDescriptor = namedtuple("TableDescriptor", ["manage_table_id",
+                                                 "table_name",
+                                                 "root_url",
+                                                 "primary_key",
+                                                 "endpoints",
+                                                 "special_rules",
+                                                 "constraints",
+                                                 "validate_json_create",
+                                                 "validate_json_update"])
+ViewDescriptor = namedtuple("ViewDescriptor", ["manage_view_id",
+                                               "view_name",
+                                               "root_url",
+                                               "permission_rules",
+                                               "endpoints",
+                                               "view_definition"])
+
+# {(kind, tenant, root_url): (version, descriptor)}. An entry is only used while its version matches
+# the tenant's current version, so bumping the version invalidates every descriptor for the tenant.
+DESCRIPTORS = LRUCache("descriptors", maxsize=conf.descriptor_cache_max_size)
+_VERSIONS = {}
+_VERSIONS_LOCK = threading.Lock()
+
+
+def descriptor_version(tenant):
+    return _VERSIONS.get(tenant, 0)
+
+
+def bump_descriptor_version(tenant):
+    """
+    Invalidates every cached table and view descriptor for tenant. Called whenever a
+    ManageTables or ManageViews row is saved or deleted.
+    """
+    with _VERSIONS_LOCK:
+        version = _VERSIONS.get(tenant, 0) + 1
+        _VERSIONS[tenant] = version
+    DESCRIPTORS.evict(lambda key: key[1] == tenant)
+    logger.debug(f"Descriptor version for tenant {tenant} is now {version}.")
+    return version
+
+
+@on_event("tenant_objects")
+def _tenant_objects_changed(event):
+    bump_descriptor_version(event["tenant"])
+
+
+def _get_descriptor(kind, model, descriptor_class, tenant, root_url):
+    key = (kind, tenant, root_url)
+    # Read the version before querying, so a write that lands mid-query leaves a stale version behind.
+    version = descriptor_version(tenant)
+    cached = DESCRIPTORS.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    row = model.objects.filter(root_url=root_url, tenant_id=tenant)\
+                       .values_list(*descriptor_class._fields).first()
+    if row is None:
+        raise model.DoesNotExist(f"No {kind} with root_url {root_url} in tenant {tenant}.")
+    descriptor = descriptor_class(*row)
+    DESCRIPTORS.set(key, (version, descriptor))
+    return descriptor
+
+
+def get_table_descriptor(tenant, root_url):
+    """
+    Returns the TableDescriptor for root_url in tenant. Raises ManageTables.DoesNotExist if there is no such table.
+    """
+    return _get_descriptor("table", ManageTables, TableDescriptor, tenant, root_url)
+
+
+def get_view_descriptor(tenant, root_url):
+    """
+    Returns the ViewDescriptor for root_url in tenant. Raises ManageViews.DoesNotExist if there is no such view.
+    """
+    return _get_descriptor("view", ManageViews, ViewDescriptor, tenant, root_url)
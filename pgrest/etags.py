@@ -0,0 +1,114 @@
+"""
+Conditional GET for data and view reads.
+
+A read's ETag is a digest of the table or view's change counter (see data_utils.do_transaction's `changes`)
+plus everything about the request that shapes the response: its query params and negotiated media type.
+Clients sending the ETag back in If-None-Match get a 304 without the data query running. Handlers only check
+If-None-Match with etag_response() once the table or view is resolved and the caller may read it, so a 304 never
+answers a request the handler would have refused.
+
+Only changes made through PgREST bump counters. Plain views read other tables live, so they get no ETag;
+materialized views are only bumped by their refresh endpoint.
+"""
+import hashlib
+from functools import wraps
+
+from django.http import HttpResponseNotModified
+from pgrest.db_transactions.data_utils import get_change_counter
+from pgrest.formats import negotiate_media_type
+from tapisservice.logs import get_logger
+logger = get_logger(__name__)
+
+
+def make_etag(*parts, request=None):
+    """
+    Returns a strong ETag for parts and, when given, the request's query params and negotiated media type.
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(f"{part}\x00".encode())
+    if request is not None:
+        for key, values in sorted(request.GET.lists()):
+            digest.update(f"{key}={values}\x00".encode())
+        digest.update(negotiate_media_type(request.META.get("HTTP_ACCEPT")).encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison of an If-None-Match header against etag, as RFC 7232 asks for with GET.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def etag_response(request, etag):
+    """
+    Call from a GET handler after its authorization and endpoint checks pass. Returns a 304 when If-None-Match
+    matches etag, else None. The etag is kept on the request so @sends_etag adds it to the handler's 200 response.
+    """
+    if not etag:
+        return None
+    request.etag = etag
+    if etag_matches(request.META.get("HTTP_IF_NONE_MATCH"), etag):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+    return None
+
+
+def sends_etag(view_func):
+    """
+    Decorator for GET views calling etag_response(). Sends the ETag it recorded with 200 responses.
+    """
+    @wraps(view_func)
+    def wrapper(self, request, *args, **kwargs):
+        response = view_func(self, request, *args, **kwargs)
+        etag = getattr(request, "etag", None)
+        if etag and response.status_code == 200:
+            response["ETag"] = etag
+        return response
+    return wrapper
+
+
+def table_etag(request, table):
+    """
+    ETag for reads of the table descriptor `table`, or None if its change counter can't be read.
+    """
+    tenant = request.auth_context.tenant_id
+    db_instance = request.auth_context.db_instance_name
+    try:
+        counter = get_change_counter(tenant, table.table_name, db_instance)
+    except Exception as e:
+        logger.warning(f"No ETag for {request.path}, unable to read change counter. e: {e}")
+        return None
+    return make_etag("table", tenant, table.manage_table_id, table.table_name, counter, request=request)
+
+
+def view_etag(request, view_descriptor):
+    """
+    ETag for reads of the view descriptor `view_descriptor`. None for plain views, or if its change counter
+    can't be read.
+    """
+    if not view_descriptor.view_definition.get("materialized_view_raw_sql"):
+        return None
+    tenant = request.auth_context.tenant_id
+    db_instance = request.auth_context.db_instance_name
+    try:
+        counter = get_change_counter(tenant, view_descriptor.view_name, db_instance)
+    except Exception as e:
+        logger.warning(f"No ETag for {request.path}, unable to read change counter. e: {e}")
+        return None
+    # Views can filter rows by user with permission_rules, so ETags are per user.
+    return make_etag("view", tenant, view_descriptor.manage_view_id, view_descriptor.view_name, counter,
+                     request.auth_context.username, request=request)
@@ -0,0 +1,249 @@
+"""
+Alternate response formats for list reads of tables and views.
+"""
+import json
+import re
+
+from rest_framework.negotiation import DefaultContentNegotiation
+from tapisservice.logs import get_logger
+logger = get_logger(__name__)
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    # pyarrow is optional. Without it Arrow and Parquet output are unavailable.
+    pyarrow = None
+
+# Query param values for ?format=. "json" is the default list of row objects.
+RESPONSE_FORMATS = ["json", "columnar"]
+
+# Types that are dictionary encoded with ?format=columnar&dictionary=true when they're low-cardinality.
+DICTIONARY_TYPES = ("character varying", "character", "text")
+
+# Media types list reads can answer with, picked from the Accept header. The first is the default.
+JSON = "application/json"
+CSV = "text/csv"
+NDJSON = "application/x-ndjson"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+EXPORT_MEDIA_TYPES = [JSON, CSV, NDJSON, ARROW_STREAM, PARQUET]
+ARROW_MEDIA_TYPES = (ARROW_STREAM, PARQUET)
+
+
+def negotiate_media_type(accept_header, offered=EXPORT_MEDIA_TYPES):
+    """
+    Returns the type in `offered` that best matches an Accept header, by q value and then by how
+    specifically it was asked for (text/csv over text/* over */*). Falls back to the first offered
+    type when nothing matches, so clients sending e.g. text/html keep getting JSON.
+    """
+    ranges = []
+    for part in (accept_header or "").split(","):
+        media_range, *params = [piece.strip() for piece in part.split(";")]
+        if not media_range:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((media_range.lower(), q))
+
+    best, best_key = offered[0], None
+    for index, media_type in enumerate(offered):
+        main_type = media_type.split("/")[0]
+        match = None
+        for media_range, q in ranges:
+            if media_range == media_type:
+                specificity = 2
+            elif media_range == f"{main_type}/*":
+                specificity = 1
+            elif media_range == "*/*":
+                specificity = 0
+            else:
+                continue
+            if match is None or specificity > match[1]:
+                match = (q, specificity)
+        if match is None or match[0] <= 0:
+            continue
+        key = (match[0], match[1], -index)
+        if best_key is None or key > best_key:
+            best, best_key = media_type, key
+    return best
+
+
+class PgRESTContentNegotiation(DefaultContentNegotiation):
+    """
+    PgREST views build their own responses and pick CSV/NDJSON/... from the Accept header themselves
+    (negotiate_media_type), so DRF should never refuse a request with 406 over its renderers.
+    Request parsing is unchanged.
+    """
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def columnar_result(columns, rows, column_types, primary_key=None, dictionary=False):
+    """
+    Builds the ?format=columnar result straight from cursor tuples:
+        {"columns": [{"name": "col_one", "type": "integer"}, ...],
+         "primary_key": "col_one",
+         "rows": [[1, "a"], [2, "b"], ...],
+         "dictionaries": {"col_two": ["a", "b"]}}
+
+    Column names and types are listed once, rows are arrays in column order, and the primary key
+    is named once instead of being copied into every row as `_pkid`. With dictionary=True, string
+    columns with at most half as many distinct values as there are rows are sent as indexes into
+    "dictionaries"; NULLs stay null.
+    """
+    dictionaries = {}
+    if dictionary and rows:
+        encoded = []
+        for index, column in enumerate(columns):
+            if not column_types.get(column, "").startswith(DICTIONARY_TYPES):
+                continue
+            values = {}
+            for row in rows:
+                value = row[index]
+                if value is not None and value not in values:
+                    values[value] = len(values)
+                    if len(values) * 2 > len(rows):
+                        break
+            if len(values) * 2 <= len(rows):
+                dictionaries[column] = list(values)
+                encoded.append((index, values))
+        if encoded:
+            rows = [list(row) for row in rows]
+            for row in rows:
+                for index, values in encoded:
+                    if row[index] is not None:
+                        row[index] = values[row[index]]
+
+    result = {"columns": [{"name": column, "type": column_types.get(column)} for column in columns],
+              "primary_key": primary_key if primary_key in columns else None,
+              "rows": rows}
+    if dictionary:
+        result["dictionaries"] = dictionaries
+    return result
+
+
+def arrow_available():
+    return pyarrow is not None
+
+
+def arrow_type(data_type):
+    """
+    Maps a Postgres type name from the column catalog (format_type output, e.g. 'character varying(255)')
+    to an Arrow type. Returns None for types sent as strings (enums, uuids, json, plain numeric, ...).
+    numeric(p,s) is a decimal128 up to 38 digits of precision and a decimal256 up to 76; wider ones
+    (Postgres allows 1000) are strings.
+    """
+    if data_type.endswith("[]"):
+        item_type = arrow_type(data_type[:-2])
+        return pyarrow.list_(item_type) if item_type is not None else None
+    if data_type.startswith(("character varying", "character", "text")):
+        return pyarrow.string()
+    if data_type.startswith("timestamp"):
+        return pyarrow.timestamp("us", tz="UTC" if "with time zone" in data_type else None)
+    if data_type.startswith("time "):
+        return pyarrow.time64("us") if "without time zone" in data_type else None
+    if data_type == "numeric":
+        # Unconstrained numeric has no fixed precision or scale to give an Arrow decimal.
+        return None
+    numeric = re.match(r"numeric\((\d+),(\d+)\)$", data_type)
+    if numeric:
+        precision, scale = int(numeric.group(1)), int(numeric.group(2))
+        if precision <= 38:
+            return pyarrow.decimal128(precision, scale)
+        if precision <= 76:
+            return pyarrow.decimal256(precision, scale)
+        return None
+    return {"smallint": pyarrow.int16(),
+            "integer": pyarrow.int32(),
+            "bigint": pyarrow.int64(),
+            "real": pyarrow.float32(),
+            "double precision": pyarrow.float64(),
+            "boolean": pyarrow.bool_(),
+            "date": pyarrow.date32(),
+            "bytea": pyarrow.binary()}.get(data_type)
+
+
+def _as_string(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+class _ChunkSink:
+    """
+    Write-only file object for pyarrow writers that keeps what was written until taken with drain().
+    """
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_chunks(row_stream, column_types, media_type):
+    """
+    Serializes a RowStream as an Arrow IPC stream or a Parquet file, one record batch (or Parquet row
+    group) per cursor batch, and yields the bytes as each batch is written. Column types come from
+    the column catalog (see arrow_type); columns without an Arrow type are sent as strings.
+    """
+    columns = row_stream.columns
+    types = [arrow_type(column_types.get(column, "")) for column in columns]
+    schema = pyarrow.schema([(column, column_type or pyarrow.string()) for column, column_type in zip(columns, types)])
+    sink = _ChunkSink()
+    if media_type == PARQUET:
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    try:
+        for batch in row_stream:
+            arrays = []
+            for index, column_type in enumerate(types):
+                values = [row[index] for row in batch]
+                if column_type is None:
+                    values = [_as_string(value) for value in values]
+                elif column_type == pyarrow.binary():
+                    values = [bytes(value) if value is not None else None for value in values]
+                arrays.append(pyarrow.array(values, type=schema.field(index).type))
+            record_batch = pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+            if media_type == PARQUET:
+                writer.write_table(pyarrow.Table.from_batches([record_batch]))
+            else:
+                writer.write_batch(record_batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    if data:
+        yield data
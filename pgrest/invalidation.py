@@ -0,0 +1,194 @@
+"""
+Cross-worker cache invalidation.
+
+Every worker keeps its own in-process metadata caches. When one worker changes tables, views, roles or
+tenants it publishes an event with NOTIFY on CHANNEL, and every worker's listener thread runs the handlers
+registered for that event kind. Each event takes a number from VERSION_SEQUENCE, and listeners poll the
+sequence when the channel is quiet. If the sequence is still past the last event a listener saw on the poll
+after it first moved there, an event was missed and the listener flushes every cache in FLUSH_ON_GAP instead.
+
+Events are dicts with a "kind" key, currently:
+    {"kind": "tenant_objects", "tenant": ..., "db_instance": ...}  tables or views in a tenant changed
+    {"kind": "roles", "tenant": ..., "username": ...}              a user's roles changed
+    {"kind": "tenants"}                                            a tenant was created
+"""
+
+import json
+import os
+import select
+import socket
+import threading
+
+import psycopg2
+import psycopg2.extensions
+from pgrest.cache import CACHES
+from pgrest.db_transactions import config
+from pgrest.db_transactions.pool import pooled_connection
+from tapisservice.config import conf
+from tapisservice.logs import get_logger
+logger = get_logger(__name__)
+
+CHANNEL = "pgrest_invalidation"
+# Created by the database_tenants 0003_invalidation_sequence migration.
+VERSION_SEQUENCE = "public.pgrest_invalidation_seq"
+# Metadata caches that are flushed when a listener can't tell what it missed.
+FLUSH_ON_GAP = ("descriptors", "column_catalog", "sk_roles", "tenant_registry")
+
+# Identifies this worker, so listeners can skip events they published themselves.
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+_HANDLERS = {}
+
+
+def on_event(kind):
+    """
+    Decorator registering a function to be called with every event of the given kind.
+    """
+    def register(handler):
+        _HANDLERS.setdefault(kind, []).append(handler)
+        return handler
+    return register
+
+
+def handle_event(event):
+    for handler in _HANDLERS.get(event.get("kind"), []):
+        try:
+            handler(event)
+        except Exception as e:
+            logger.error(f"Invalidation handler {handler.__name__} failed for event {event}. e: {e}")
+
+
+def flush_caches():
+    for name in FLUSH_ON_GAP:
+        cache = CACHES.get(name)
+        if cache is not None:
+            cache.clear()
+    logger.info(f"Flushed caches {FLUSH_ON_GAP}.")
+
+
+def publish(kind, **fields):
+    """
+    Applies an invalidation event in this worker, then broadcasts it to every other worker.
+    Publishing never raises; if the NOTIFY fails the other workers catch up on their next poll.
+    """
+    event = dict(fields, kind=kind, origin=ORIGIN)
+    handle_event(event)
+    if not conf.cache_invalidation_enabled:
+        return
+    try:
+        with pooled_connection(conf.cache_invalidation_db_instance) as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT nextval('{VERSION_SEQUENCE}')")
+                event["version"] = cur.fetchone()[0]
+                cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps(event)))
+            conn.commit()
+        logger.debug(f"Published invalidation event {event}.")
+    except Exception as e:
+        logger.error(f"Unable to publish invalidation event {event}. e: {e}")
+
+
+class InvalidationListener(threading.Thread):
+    """
+    Daemon thread that LISTENs on CHANNEL with its own connection and applies events from other workers.
+    """
+    def __init__(self, db_instance, poll_interval):
+        super().__init__(name="pgrest-invalidation-listener", daemon=True)
+        self.db_instance = db_instance
+        self.poll_interval = poll_interval
+        self.last_version = None
+        # Version a poll saw ahead of last_version, checked again on the next poll.
+        self.pending_version = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _current_version(self, cur):
+        cur.execute(f"SELECT last_value, is_called FROM {VERSION_SEQUENCE}")
+        last_value, is_called = cur.fetchone()
+        return last_value if is_called else 0
+
+    def _check_version(self, cur):
+        current = self._current_version(cur)
+        pending = self.pending_version
+        self.pending_version = None
+        if self.last_version is None:
+            self.last_version = current
+        elif pending is not None and pending > self.last_version:
+            logger.warning(f"Invalidation version moved from {self.last_version} to {pending} without "
+                           f"a notification; flushing caches.")
+            flush_caches()
+            self.last_version = max(self.last_version, current)
+        elif current > self.last_version:
+            # publish() takes its version before its NOTIFY commits, so the notification can still be on
+            # its way. It's only missed if it hasn't arrived by the next poll.
+            self.pending_version = current
+
+    def _receive(self, conn):
+        conn.poll()
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                event = json.loads(notify.payload)
+            except ValueError:
+                logger.error(f"Ignoring malformed invalidation payload: {notify.payload}")
+                continue
+            version = event.get("version")
+            if version is not None:
+                self.last_version = max(self.last_version or 0, version)
+            if event.get("origin") != ORIGIN:
+                handle_event(event)
+
+    def _listen(self):
+        conn = psycopg2.connect(**config.config(self.db_instance))
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANNEL}")
+            # Anything could have changed while we weren't listening.
+            if self.last_version is not None:
+                flush_caches()
+            self.last_version = self._current_version(cur)
+            self.pending_version = None
+            logger.info(f"Listening for invalidation events at version {self.last_version}.")
+            while not self._stop_event.is_set():
+                readable, _, _ = select.select([conn], [], [], self.poll_interval)
+                if readable:
+                    self._receive(conn)
+                else:
+                    self._check_version(cur)
+        finally:
+            conn.close()
+
+    def run(self):
+        backoff = 1
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+                backoff = 1
+            except Exception as e:
+                logger.error(f"Invalidation listener lost its connection, retrying in {backoff}s. e: {e}")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+
+_LISTENER = None
+
+
+def start_listener():
+    """
+    Starts this worker's listener thread, once. Called from paas/wsgi.py so every uWSGI worker gets one.
+    """
+    global _LISTENER
+    if not conf.cache_invalidation_enabled or _LISTENER is not None:
+        return _LISTENER
+    _LISTENER = InvalidationListener(conf.cache_invalidation_db_instance,
+                                     conf.cache_invalidation_poll_interval)
+    _LISTENER.start()
+    return _LISTENER
+
+
+def listener_stats():
+    return {"enabled": conf.cache_invalidation_enabled,
+            "listening": _LISTENER is not None and _LISTENER.is_alive(),
+            "last_version": _LISTENER.last_version if _LISTENER is not None else None}
@@ -0,0 +1,100 @@
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from pgrest.compression import compress, compress_stream, negotiate_encoding
+from tapisservice.config import conf
+
+# API requests authenticate with Tapis tokens on every call and never use Django sessions.
+API_PATH_PREFIX = '/v3/pgrest/'
+
+
+# Data endpoints whose responses are compressed by CompressionMiddleware.
+COMPRESSED_PATH_PREFIXES = ('/v3/pgrest/data/', '/v3/pgrest/views/')
+# Already compressed formats, not worth compressing again.
+UNCOMPRESSED_CONTENT_TYPES = ('application/vnd.apache.parquet',)
+
+
+def is_api_request(request):
+    return request.path.startswith(API_PATH_PREFIX)
+
+
+class APISkippingSessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware that leaves API requests alone, so they never load or save a row in django_session.
+    Other paths (e.g. the Django admin) still get sessions.
+    """
+    def process_request(self, request):
+        if is_api_request(request):
+            return
+        super().process_request(request)
+
+    def process_response(self, request, response):
+        if is_api_request(request):
+            return response
+        return super().process_response(request, response)
+
+
+class APISkippingAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    AuthenticationMiddleware needs a session, so it is skipped for API requests as well.
+    """
+    def process_request(self, request):
+        if is_api_request(request):
+            return
+        super().process_request(request)
+
+
+class APISkippingMessageMiddleware(MessageMiddleware):
+    """
+    Message storage falls back to sessions, so it is skipped for API requests as well.
+    """
+    def process_request(self, request):
+        if is_api_request(request):
+            return
+        super().process_request(request)
+
+    def process_response(self, request, response):
+        if is_api_request(request):
+            return response
+        return super().process_response(request, response)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses data and view responses with the first encoding in `compression_encodings` that the client's
+    Accept-Encoding allows (gzip, plus zstd and br when installed). Responses smaller than
+    `compression_min_size` bytes are sent as is. Streaming responses are compressed chunk by chunk as
+    they're sent, never buffered.
+    """
+    def process_response(self, request, response):
+        if not conf.compression_enabled or not request.path.startswith(COMPRESSED_PATH_PREFIXES):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.has_header('Content-Encoding') or \
+                response.get('Content-Type', '').startswith(UNCOMPRESSED_CONTENT_TYPES):
+            return response
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING'), conf.compression_encodings)
+        if encoding is None:
+            return response
+        level = getattr(conf, f"compression_{encoding}_level")
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding, level)
+            del response['Content-Length']
+        else:
+            if len(response.content) < conf.compression_min_size:
+                return response
+            compressed = compress(response.content, encoding, level)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(response.content))
+
+        # The compressed body isn't byte for byte what a strong ETag promised.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
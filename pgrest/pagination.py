@@ -0,0 +1,134 @@
+import base64
+import hashlib
+import json
+
+from pgrest.db_transactions.data_utils import get_column_catalog, get_unique_columns
+from tapisservice.logs import get_logger
+logger = get_logger(__name__)
+
+TOKEN_VERSION = 1
+
+
+def filters_digest(search_params):
+    """
+    Short digest of a request's search params, stored in continuation tokens so a token can't be
+    replayed against a different filter.
+    """
+    normalized = sorted([str(key), str(oper), str(value)] for key, oper, value in search_params or [])
+    return hashlib.sha1(json.dumps(normalized).encode()).hexdigest()[:12]
+
+
+class Keyset:
+    """
+    Keyset (seek) pagination over a table or view.
+
+    Rows are ordered by `order_column` (if any) and then by `key_column`, and each page starts
+    strictly after the last row of the previous page instead of using OFFSET. NULLs in the order
+    column always sort last. Views have no primary key, so for views the order column is the
+    only key and must have a unique index (only materialized views can have one); otherwise rows
+    sharing a value across a page boundary would be skipped. NULLs aren't unique, so rows after
+    the first NULL in that column aren't paged to.
+    """
+    def __init__(self, order_column, direction, key_column, after, digest):
+        self.order_column = order_column
+        self.direction = direction
+        self.key_column = key_column
+        self.after = after
+        self.digest = digest
+
+    @classmethod
+    def from_request(cls, tenant, obj_name, db_instance, key_column, search_params, order=None, token=None):
+        """
+        Builds the keyset for a request from its `order` param and continuation token (None on the first page).
+        Raises if the order is invalid or the token doesn't belong to this query.
+        """
+        order_column, direction = None, "ASC"
+        if order:
+            split_order = order.split(',')
+            order_column = split_order[0]
+            if len(split_order) > 2 or (len(split_order) == 2 and split_order[1] not in ["ASC", "DESC"]):
+                raise Exception(f"Order must be in the format 'columnName,DESC', 'columnName,ASC' or 'columnName'. "
+                                f"Got {order}")
+            if len(split_order) == 2:
+                direction = split_order[1]
+            if order_column not in get_column_catalog(tenant, obj_name, db_instance):
+                raise Exception(f"Got a columnName of {order_column} in order. Not a valid column name.")
+        if not key_column:
+            if not order_column:
+                raise Exception("Keyset pagination on a view requires an order column.")
+            if order_column not in get_unique_columns(tenant, obj_name, db_instance):
+                raise Exception(f"Keyset pagination on a view requires ordering by a column with a unique index; "
+                                f"{order_column} has none. Only materialized views can have unique indexes.")
+        if order_column == key_column:
+            order_column = None
+
+        digest = filters_digest(search_params)
+        after = None
+        if token:
+            try:
+                decoded = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+                valid = decoded.get("v") == TOKEN_VERSION
+            except Exception:
+                valid = False
+            if not valid:
+                raise Exception("Invalid continuation_token.")
+            if (decoded.get("o"), decoded.get("d"), decoded.get("k"), decoded.get("q")) != \
+                    (order_column, direction, key_column, digest):
+                raise Exception("continuation_token does not match this request's order and filters; "
+                                "repeat the same order and filters used for the first page.")
+            after = decoded["a"]
+        return cls(order_column, direction, key_column, after, digest)
+
+    def where(self):
+        """
+        Returns (sql, values) restricting rows to those after the previous page, or (None, []) on the first page.
+        """
+        if self.after is None:
+            return None, []
+        op = ">" if self.direction == "ASC" else "<"
+        last_order, last_key = self.after
+        if self.order_column is None:
+            return f"{self.key_column} {op} %s", [last_key]
+        if self.key_column is None:
+            if last_order is None:
+                # Past every non-null value and there's nothing to break ties between the NULLs.
+                return "FALSE", []
+            return f"({self.order_column} {op} %s OR {self.order_column} IS NULL)", [last_order]
+        if last_order is None:
+            return f"({self.order_column} IS NULL AND {self.key_column} {op} %s)", [last_key]
+        return (f"({self.order_column} {op} %s OR ({self.order_column} = %s AND {self.key_column} {op} %s) "
+                f"OR {self.order_column} IS NULL)"), [last_order, last_order, last_key]
+
+    def order_by(self):
+        columns = []
+        if self.order_column:
+            columns.append(f"{self.order_column} {self.direction} NULLS LAST")
+        if self.key_column:
+            columns.append(f"{self.key_column} {self.direction}")
+        return " ORDER BY " + ", ".join(columns)
+
+    def next_token(self, last_row):
+        """
+        Returns the continuation token for the page after the one ending with last_row (a row dict).
+        """
+        after = [last_row.get(self.order_column) if self.order_column else None,
+                 last_row.get(self.key_column) if self.key_column else None]
+        payload = {"v": TOKEN_VERSION,
+                   "o": self.order_column,
+                   "d": self.direction,
+                   "k": self.key_column,
+                   "q": self.digest,
+                   "a": after}
+        # default=str covers timestamps, dates and decimals; Postgres casts the strings back when comparing.
+        encoded = json.dumps(payload, default=str, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(encoded).decode().rstrip("=")
+
+
+def stream_with_continuation(chunks, row_stream, keyset, limit, metadata):
+    """
+    Passes streamed result chunks through, then adds the continuation token to metadata once the
+    last row is known. make_success_stream writes metadata after the result, so the token makes it in.
+    """
+    yield from chunks
+    if limit and row_stream.row_count == limit and row_stream.last_row is not None:
+        metadata["continuation_token"] = keyset.next_token(dict(zip(row_stream.columns, row_stream.last_row)))
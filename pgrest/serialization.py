@@ -0,0 +1,116 @@
+"""
+JSON serialization for responses and request bodies.
+
+dumps() returns bytes ready for HttpResponse and handles datetimes, dates, times, Decimals and UUIDs
+natively. Decimals (numeric columns) are JSON numbers, as the postgres_json read engine and Arrow output
+give them. Uses orjson when it's installed (and `json_serializer` config allows it), otherwise the
+stdlib json module. Both produce equivalent compact JSON for the types PgREST returns.
+"""
+import datetime
+import decimal
+import json
+import uuid
+
+from tapisservice.config import conf
+from tapisservice.logs import get_logger
+logger = get_logger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional, the stdlib serializer is used without it.
+    orjson = None
+
+
+def default(raw_object):
+    """
+    Converts the non-JSON types rows contain. Decimals become numbers; NaN and infinite values, which JSON
+    numbers can't hold, become strings the way Postgres' to_json writes them.
+    """
+    if isinstance(raw_object, (datetime.datetime, datetime.date, datetime.time)):
+        return raw_object.isoformat()
+    if isinstance(raw_object, decimal.Decimal):
+        if raw_object.is_finite():
+            return float(raw_object)
+        return str(raw_object)
+    if isinstance(raw_object, uuid.UUID):
+        return str(raw_object)
+    if isinstance(raw_object, memoryview):
+        return raw_object.tobytes().hex()
+    raise TypeError(f"Type {type(raw_object)} not serializable")
+
+
+class StdlibSerializer:
+    name = "stdlib"
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(default=default, separators=(",", ":"), ensure_ascii=False)
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonSerializer:
+    """
+    orjson serializes datetimes, dates, times and UUIDs itself, the same way as default() does;
+    default() is only called for Decimals and bytes.
+    """
+    name = "orjson"
+    OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=default, option=self.OPTIONS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+def get_serializer(name=None):
+    """
+    Returns the serializer named by `name` (or the `json_serializer` config): "orjson", "stdlib",
+    or "auto" for orjson when it's installed.
+    """
+    name = name or conf.json_serializer
+    if name not in ["auto", "orjson", "stdlib"]:
+        raise Exception(f"json_serializer must be one of 'auto', 'orjson' or 'stdlib'. Got {name}")
+    if name == "orjson" and orjson is None:
+        logger.warning("json_serializer is 'orjson' but orjson is not installed, using the stdlib serializer.")
+    if name != "stdlib" and orjson is not None:
+        return OrjsonSerializer()
+    return StdlibSerializer()
+
+
+SERIALIZER = get_serializer()
+
+
+def dumps(obj):
+    """
+    Serializes obj to JSON bytes.
+    """
+    return SERIALIZER.dumps(obj)
+
+
+def loads(data):
+    """
+    Parses JSON from bytes or str.
+    """
+    return SERIALIZER.loads(data)
+
+
+def iter_ndjson(stream):
+    """
+    Parses newline-delimited JSON from a file-like object of bytes one line at a time, so the whole body
+    never has to be in memory. Yields each value; blank lines are skipped.
+    """
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield SERIALIZER.loads(line)
+        except ValueError as e:
+            msg = f"Line {line_number} is not valid JSON; Details: {e}"
+            logger.warning(msg)
+            raise Exception(msg)
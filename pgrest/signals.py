@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from pgrest.descriptors import bump_descriptor_version
+from pgrest.models import ManageTables, ManageViews
+
+
+@receiver(post_save, sender=ManageTables)
+@receiver(post_delete, sender=ManageTables)
+@receiver(post_save, sender=ManageViews)
+@receiver(post_delete, sender=ManageViews)
+def manage_object_changed(sender, instance, **kwargs):
+    tenant = instance.tenant_id
+    bump_descriptor_version(tenant)
+    # Bump again once the write commits. Otherwise a request that read the old row while the
+    # transaction was open could cache it under the new version.
+    transaction.on_commit(lambda: bump_descriptor_version(tenant))
@@ -1,13 +1,34 @@
 # docker-compose run api python manage.py test
 # docker-compose run api python manage.py makemigrations
+import datetime
+import decimal
+import gzip
+import io
 import json
-
-from django.test import TestCase
+import threading
+import time
+import unittest
+import uuid
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from django.test import SimpleTestCase, TestCase
 from django.db import connection
 from django_tenants.test.cases import TenantTestCase
 from django_tenants.test.client import TenantClient
 
 from pgrest import test_data
+from pgrest.auth import V2ProfilesBackend, V2ProfilesError
+from pgrest.cache import LRUCache
+from pgrest.db_transactions import table_data
+from pgrest.db_transactions.data_utils import do_transaction, invalidate_column_catalog
+from pgrest.formats import arrow_available, arrow_type
+from pgrest import invalidation
+from pgrest.invalidation import InvalidationListener, publish
+from pgrest import serialization
+from pgrest import views
+from pgrest.views import ROLE_CACHE
+from tapisservice import errors
 from tapisservice.config import conf
 
 # SET YOUR HEADERS! Either way, user needs ADMIN role in SK.
@@ -271,6 +292,252 @@ class ResponseTestCase(TenantTestCase):
         response = self.client.get(f'/v3/pgrest/data/nope', **auth_headers)
         self.assertEqual(response.status_code, 404)
 
+    def test_list_table_contents_streamed(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": "hello", "col_two": i, "col_three": 90, "col_four": False, "col_five": "hehe"}
+                for i in range(3)]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?stream=true&order=col_two', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(body["status"], "success")
+        self.assertEqual([row["col_two"] for row in body["result"]], [0, 1, 2])
+        self.assertIn("_pkid", body["result"][0])
+
+    def test_list_table_contents_keyset(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": "hello", "col_two": i % 3, "col_three": 90, "col_four": False, "col_five": "hehe"}
+                for i in range(5)]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        seen = []
+        url = f'/v3/pgrest/data/{root_url}?keyset=true&limit=2&order=col_two'
+        while url:
+            response = self.client.get(url, **auth_headers)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            seen.extend(body["result"])
+            token = body["metadata"].get("continuation_token")
+            url = f'/v3/pgrest/data/{root_url}?limit=2&order=col_two&continuation_token={token}' if token else None
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len({row["_pkid"] for row in seen}), 5)
+        self.assertEqual([row["col_two"] for row in seen], sorted(row["col_two"] for row in seen))
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?keyset=true&limit=2&offset=2', **auth_headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_table_contents_select(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = {"col_one": "hello", "col_two": 100, "col_three": 90, "col_four": False, "col_five": "hehe"}
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?select=col_one,col_two', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["result"], [{"col_one": "hello", "col_two": 100}])
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?select=col_one,not_a_column', **auth_headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_table_contents_json_engine(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        table_name = self.init_resp_1["result"]["table_name"]
+        # init_table_1 doesn't set a primary key, so it gets the default one.
+        primary_key = f"{table_name}_id"
+        data = [{"col_one": "hello", "col_two": i, "col_three": 90, "col_four": False, "col_five": None}
+                for i in range(3)]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        search_params = [["col_two", ".gte", 1]]
+        python_rows = table_data.get_rows_from_table(table_name, search_params, "dev", None, None, "default",
+                                                     primary_key, order="col_two,DESC")
+        json_rows = table_data.get_rows_from_table_json(table_name, search_params, "dev", None, None, "default",
+                                                        primary_key, order="col_two,DESC")
+        self.assertEqual(json.loads(json_rows), python_rows)
+        self.assertEqual(table_data.get_rows_from_table_json(table_name, [["col_two", ".gt", 5]], "dev", None, None,
+                                                             "default", primary_key), "[]")
+
+    def test_list_table_contents_columnar(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": "hello", "col_two": i, "col_three": 90, "col_four": False, "col_five": None}
+                for i in range(4)]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?format=columnar&dictionary=true'
+                                   f'&select=col_one,col_two&order=col_two', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()["result"]
+        self.assertEqual([column["name"] for column in result["columns"]], ["col_one", "col_two"])
+        self.assertEqual(result["dictionaries"], {"col_one": ["hello"]})
+        self.assertEqual(result["rows"], [[0, 0], [0, 1], [0, 2], [0, 3]])
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?format=xml', **auth_headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_table_contents(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": "hello", "col_two": i, "col_three": 90, "col_four": False, "col_five": None}
+                for i in range(3)]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?select=col_one,col_two&order=col_two,DESC'
+                                   f'&col_two.gte=1', HTTP_ACCEPT='text/csv', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        csv_text = b"".join(response.streaming_content).decode()
+        self.assertEqual(csv_text.splitlines(), ["col_one,col_two", "hello,2", "hello,1"])
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?order=col_two',
+                                   HTTP_ACCEPT='application/x-ndjson', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["col_two"] for row in rows], [0, 1, 2])
+        self.assertIn("_pkid", rows[0])
+
+    @unittest.skipUnless(arrow_available(), "pyarrow is not installed")
+    def test_export_table_contents_arrow(self):
+        import pyarrow
+        import pyarrow.ipc
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": "hello", "col_two": i, "col_three": 90, "col_four": False, "col_five": None}
+                for i in range(3)]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?select=col_one,col_two,col_four&order=col_two',
+                                   HTTP_ACCEPT='application/vnd.apache.arrow.stream', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        table = pyarrow.ipc.open_stream(b"".join(response.streaming_content)).read_all()
+        self.assertEqual(table.schema.field("col_two").type, pyarrow.int32())
+        self.assertEqual(table.column("col_two").to_pylist(), [0, 1, 2])
+        self.assertEqual(table.column("col_four").to_pylist(), [False, False, False])
+
+    def test_list_table_contents_compressed(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": "hello", "col_two": i, "col_three": 90, "col_four": False, "col_five": "hehe"}
+                for i in range(100)]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', HTTP_ACCEPT_ENCODING='gzip', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))["result"]), 100)
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?stream=true', HTTP_ACCEPT_ENCODING='gzip',
+                                   **auth_headers)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(len(json.loads(body)["result"]), 100)
+
+    def test_list_table_contents_etag(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = {"col_one": "hello", "col_two": 100, "col_three": 90, "col_four": False, "col_five": "hehe"}
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?order=col_two', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?order=col_two', HTTP_IF_NONE_MATCH=etag,
+                                   **auth_headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        # A different query has a different ETag.
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?order=col_three', HTTP_IF_NONE_MATCH=etag,
+                                   **auth_headers)
+        self.assertEqual(response.status_code, 200)
+
+        # Writes change the table's ETag.
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?order=col_two', HTTP_IF_NONE_MATCH=etag,
+                                   **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()["result"]), 2)
+
+    def test_list_table_contents_numeric_across_read_engines(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        table_name = self.init_resp_1["result"]["table_name"]
+        data = {"col_one": "hello", "col_two": 100, "col_three": 90, "col_four": False, "col_five": "hehe"}
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # Table definitions can't declare numeric columns, so add one directly.
+        do_transaction(f"ALTER TABLE dev.{table_name} ADD COLUMN amount numeric(10, 2);", "default")
+        do_transaction(f"UPDATE dev.{table_name} SET amount = 1.50;", "default")
+        invalidate_column_catalog("dev", table_name, "default")
+
+        amounts = {}
+        read_engine = conf.read_engine
+        try:
+            for engine in ["python", "postgres_json"]:
+                conf.read_engine = engine
+                response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+                self.assertEqual(response.status_code, 200)
+                amounts[engine] = response.json()["result"][0]["amount"]
+        finally:
+            conf.read_engine = read_engine
+        self.assertEqual(amounts, {"python": 1.5, "postgres_json": 1.5})
+
+    def test_list_table_contents_etag_after_endpoint_disabled(self):
+        table_id = self.init_resp_1["result"]["table_id"]
+        root_url = self.init_resp_1["result"]["root_url"]
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # Disabling LIST ROWS doesn't write to the table, so the ETag would still match; the 304 must not be sent.
+        response = self.client.put(f'/v3/pgrest/manage/tables/{table_id}',
+                                   data=json.dumps({"endpoints": ["GET_ONE"]}),
+                                   content_type='application/json',
+                                   **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', HTTP_IF_NONE_MATCH=etag, **auth_headers)
+        self.assertEqual(response.status_code, 400)
+
     # ---- CREATE ROW ---- #
     def test_create_object_in_table(self):
         root_url = self.init_resp_1["result"]["root_url"]
@@ -312,6 +579,200 @@ class ResponseTestCase(TenantTestCase):
                                     content_type='application/json')
         self.assertEqual(response.status_code, 400)
 
+    def test_create_objects_in_table_reports_invalid_row_index_400(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": "hello", "col_two": 100, "col_three": 90, "col_four": False, "col_five": "hehe"},
+                {"col_one": 50, "col_two": 100, "col_three": 90, "col_four": False, "col_five": "hehe"},
+                {"col_one": "bye", "col_two": 100, "col_three": 90, "col_four": True, "col_five": "hehe"}]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("row 1:", response.json()["message"])
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual(len(response.json()["result"]), 0)
+
+    def test_create_objects_in_table_bulk(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": "hello", "col_two": 100, "col_three": 90, "col_four": False, "col_five": "hehe"},
+                {"col_one": "", "col_two": 101, "col_three": 91, "col_four": True, "col_five": "say \"hi\", ok"},
+                {"col_four": False}]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}?bulk=true',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        result = response.json()["result"]
+        self.assertEqual(result["inserted"], 3)
+        self.assertEqual(result["pk_max"] - result["pk_min"], 2)
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?order=col_two', **auth_headers)
+        rows = response.json()["result"]
+        self.assertEqual(len(rows), 3)
+        # Empty strings stay empty strings and missing columns get their DEFAULT (NULL here).
+        self.assertEqual(rows[1]["col_one"], "")
+        self.assertEqual(rows[1]["col_five"], 'say "hi", ok')
+        self.assertIsNone(rows[2]["col_one"])
+
+    def test_create_objects_in_table_bulk_sets_createtime_and_updatetime(self):
+        table = {"table_name": "bulk_times_table",
+                 "root_url": "bulk_times",
+                 "columns": {"name": {"data_type": "varchar", "char_len": 255, "null": True},
+                             "created": {"data_type": "timestamp", "default": "CREATETIME"},
+                             "updated": {"data_type": "timestamp", "default": "UPDATETIME"}}}
+        response = self.client.post('/v3/pgrest/manage/tables',
+                                    data=json.dumps(table),
+                                    content_type='application/json',
+                                    **auth_headers)
+        self.assertEqual(response.status_code, 200)
+
+        # Bulk inserts leave these columns out of the COPY, so their NOW() defaults fill them in.
+        response = self.client.post('/v3/pgrest/data/bulk_times?bulk=true',
+                                    **auth_headers,
+                                    data=json.dumps({"data": [{"name": "one"}, {"name": "two"}]}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["result"]["inserted"], 2)
+
+        response = self.client.get('/v3/pgrest/data/bulk_times', **auth_headers)
+        rows = response.json()["result"]
+        self.assertEqual(len(rows), 2)
+        for row in rows:
+            self.assertIsNotNone(row["created"])
+            self.assertIsNotNone(row["updated"])
+
+    def test_create_objects_in_table_bulk_invalid_row_400(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": "hello", "col_two": 100, "col_three": 90, "col_four": False, "col_five": "hehe"},
+                {"col_one": 50, "col_two": 100, "col_three": 90, "col_four": False, "col_five": "hehe"}]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}?bulk=true',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("row 1:", response.json()["message"])
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual(len(response.json()["result"]), 0)
+
+    def test_create_objects_in_table_ndjson(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        rows = [{"col_one": f"row {i}", "col_two": i, "col_three": 90, "col_four": False, "col_five": "hehe"}
+                for i in range(5)]
+        body = "\n".join(json.dumps(row) for row in rows) + "\n"
+        chunk_size = conf.ndjson_insert_chunk_size
+        conf.ndjson_insert_chunk_size = 2
+        try:
+            response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                        **auth_headers,
+                                        data=body,
+                                        content_type='application/x-ndjson')
+        finally:
+            conf.ndjson_insert_chunk_size = chunk_size
+        self.assertEqual(response.status_code, 200)
+        result = response.json()["result"]
+        self.assertEqual(result["inserted"], 5)
+        self.assertEqual([chunk["inserted"] for chunk in result["chunks"]], [2, 2, 1])
+        self.assertEqual([chunk["first_row"] for chunk in result["chunks"]], [0, 2, 4])
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual(len(response.json()["result"]), 5)
+
+    def test_create_objects_in_table_ndjson_chunked(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        rows = [{"col_one": f"row {i}", "col_two": i, "col_three": 90, "col_four": False} for i in range(3)]
+        body = "\n".join(json.dumps(row) for row in rows).encode()
+        # Chunked uploads come without a Content-Length; the test client leaves it out when given no data.
+        response = self.client.generic('POST', f'/v3/pgrest/data/{root_url}',
+                                       CONTENT_TYPE='application/x-ndjson',
+                                       HTTP_TRANSFER_ENCODING='chunked',
+                                       **{'wsgi.input': io.BytesIO(body)},
+                                       **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["result"]["inserted"], 3)
+
+        # Neither a Content-Length nor chunked: the body can't be read, so it isn't silently dropped.
+        response = self.client.generic('POST', f'/v3/pgrest/data/{root_url}',
+                                       CONTENT_TYPE='application/x-ndjson',
+                                       **{'wsgi.input': io.BytesIO(body)},
+                                       **auth_headers)
+        self.assertEqual(response.status_code, 411)
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual(len(response.json()["result"]), 3)
+
+    def test_create_objects_in_table_ndjson_empty_400(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data="\n\n",
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_objects_in_table_ndjson_invalid_line_400(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        body = json.dumps({"col_one": "hello", "col_two": 100, "col_three": 90, "col_four": False}) + "\nnot json\n"
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=body,
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Line 2", response.json()["message"])
+
+    def test_upsert_objects_in_table(self):
+        root_url = self.init_resp_3["result"]["root_url"]
+        data = [{"col_one": "one", "col_three": 1, "col_four": False},
+                {"col_one": "two", "col_three": 2, "col_four": False}]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data, "on_conflict": "col_one"}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["result"], {"inserted": 2, "updated": 0})
+
+        data = [{"col_one": "two", "col_three": 22, "col_four": True},
+                {"col_one": "three", "col_three": 3, "col_four": False}]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data, "on_conflict": "col_one"}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["result"], {"inserted": 1, "updated": 1})
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?order=col_one', **auth_headers)
+        rows = {row["col_one"]: row for row in response.json()["result"]}
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows["two"]["col_three"], 22)
+        # Columns the upsert didn't give keep their value.
+        self.assertEqual(rows["two"]["col_two"], "Test text")
+
+    def test_upsert_objects_in_table_repeated_key(self):
+        root_url = self.init_resp_3["result"]["root_url"]
+        data = [{"col_one": "one", "col_three": 1, "col_four": False, "col_five": "first"},
+                {"col_one": "two", "col_three": 2, "col_four": False},
+                {"col_one": "one", "col_three": 11, "col_four": True}]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data, "on_conflict": "col_one"}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["result"], {"inserted": 2, "updated": 0})
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        rows = {row["col_one"]: row for row in response.json()["result"]}
+        self.assertEqual(len(rows), 2)
+        # The later row wins; columns only the earlier row gave are kept, as with upserting one by one.
+        self.assertEqual(rows["one"]["col_three"], 11)
+        self.assertEqual(rows["one"]["col_four"], True)
+        self.assertEqual(rows["one"]["col_five"], "first")
+
+    def test_upsert_objects_in_table_unknown_conflict_target_400(self):
+        root_url = self.init_resp_3["result"]["root_url"]
+        data = [{"col_one": "one", "col_three": 1, "col_four": False}]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data, "on_conflict": "col_three"}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
     def test_create_object_in_nonexistent_table_400(self):
         data = {"col_one": "hello", "col_two": 100, "col_three": 90, "col_four": False, "col_five": "hehe"}
         response = self.client.post(f'/v3/pgrest/data/nah',
@@ -474,6 +935,112 @@ class ResponseTestCase(TenantTestCase):
         response = self.client.delete(f'/v3/pgrest/data/{root_url}/89898989', **auth_headers)
         self.assertEqual(response.status_code, 400)
 
+    def test_delete_rows_with_where_in_batches(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": f"row {i}", "col_two": i, "col_three": 90 if i < 7 else 10, "col_four": False}
+                for i in range(10)]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        batch_size = conf.delete_batch_size
+        conf.delete_batch_size = 3
+        try:
+            response = self.client.delete(f'/v3/pgrest/data/{root_url}',
+                                          data=json.dumps({"where": {"col_three": {"operator": "eq", "value": 90}}}),
+                                          content_type='application/json',
+                                          **auth_headers)
+        finally:
+            conf.delete_batch_size = batch_size
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["result"], {"deleted": 7, "batches": 3, "truncated": False})
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual(len(response.json()["result"]), 3)
+
+    def test_delete_rows_with_where_truncated(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": f"row {i}", "col_two": i, "col_three": 90, "col_four": False} for i in range(7)]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        batch_size, max_batches = conf.delete_batch_size, conf.delete_max_batches
+        conf.delete_batch_size, conf.delete_max_batches = 3, 1
+        try:
+            response = self.client.delete(f'/v3/pgrest/data/{root_url}',
+                                          data=json.dumps({"where": {"col_three": {"operator": "eq", "value": 90}}}),
+                                          content_type='application/json',
+                                          **auth_headers)
+        finally:
+            conf.delete_batch_size, conf.delete_max_batches = batch_size, max_batches
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["result"], {"deleted": 3, "batches": 1, "truncated": True})
+
+    def test_delete_rows_nonexistent_table_404(self):
+        response = self.client.delete('/v3/pgrest/data/not_a_table',
+                                      data=json.dumps({"pks": [1]}),
+                                      content_type='application/json',
+                                      **auth_headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_delete_rows_with_falsy_where_value(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": f"row {i}", "col_two": i, "col_three": 0 if i < 2 else 90, "col_four": i == 0}
+                for i in range(4)]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.delete(f'/v3/pgrest/data/{root_url}',
+                                      data=json.dumps({"where": {"col_three": {"operator": "eq", "value": 0},
+                                                                 "col_four": {"operator": "eq", "value": False}}}),
+                                      content_type='application/json',
+                                      **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["result"]["deleted"], 1)
+
+        response = self.client.delete(f'/v3/pgrest/data/{root_url}',
+                                      data=json.dumps({"where": {"col_three": {"operator": "eq"}}}),
+                                      content_type='application/json',
+                                      **auth_headers)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual(len(response.json()["result"]), 3)
+
+    def test_delete_rows_with_pks(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": f"row {i}", "col_two": i, "col_three": 90, "col_four": False} for i in range(3)]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    **auth_headers,
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?order=col_two', **auth_headers)
+        pks = [row["_pkid"] for row in response.json()["result"]]
+
+        response = self.client.delete(f'/v3/pgrest/data/{root_url}',
+                                      data=json.dumps({"pks": pks[:2]}),
+                                      content_type='application/json',
+                                      **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["result"]["deleted"], 2)
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual([row["_pkid"] for row in response.json()["result"]], pks[2:])
+
+    def test_delete_rows_without_filter_400(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        response = self.client.delete(f'/v3/pgrest/data/{root_url}',
+                                      data=json.dumps({}),
+                                      content_type='application/json',
+                                      **auth_headers)
+        self.assertEqual(response.status_code, 400)
+
     # ---- LIST SINGLE ROW ---- #
     # first, we need to create row
     def test_list_single_row(self):
@@ -1059,6 +1626,64 @@ class ResponseTestCase(TenantTestCase):
         for resp in response.json()["result"]:
             self.assertNotEqual(resp["col_one"], 90)
 
+    def test_update_rows_by_pk_batch(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = [{"col_one": "hello", "col_two": 100, "col_three": 90, "col_four": False, "col_five": "hehe"},
+                {"col_one": "hi", "col_two": 101, "col_three": 90, "col_four": False, "col_five": "hehe"},
+                {"col_one": "bye", "col_two": 102, "col_three": 90, "col_four": False, "col_five": "hehe"}]
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json',
+                                    **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?order=col_two', **auth_headers)
+        pks = [row["_pkid"] for row in response.json()["result"]]
+
+        updates = [{"pk": pks[0], "changes": {"col_three": 1, "col_five": "one"}},
+                   {"pk": pks[1], "changes": {"col_three": 2}},
+                   {"pk": pks[2], "changes": {"col_three": "not an int"}},
+                   {"pk": max(pks) + 100, "changes": {"col_three": 4}}]
+        response = self.client.put(f'/v3/pgrest/data/{root_url}',
+                                   data=json.dumps({"data": updates}),
+                                   content_type='application/json',
+                                   **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()["result"]
+        self.assertEqual(result["updated"], 2)
+        self.assertEqual(result["failed"], 2)
+        self.assertEqual([entry["success"] for entry in result["results"]], [True, True, False, False])
+        self.assertIn("error", result["results"][3])
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?order=col_two', **auth_headers)
+        rows = response.json()["result"]
+        self.assertEqual([row["col_three"] for row in rows], [1, 2, 90])
+        self.assertEqual([row["col_five"] for row in rows], ["one", "hehe", "hehe"])
+
+    def test_update_rows_by_pk_batch_uncastable_pk(self):
+        root_url = self.init_resp_1["result"]["root_url"]
+        data = {"col_one": "hello", "col_two": 100, "col_three": 90, "col_four": False, "col_five": "hehe"}
+        response = self.client.post(f'/v3/pgrest/data/{root_url}',
+                                    data=json.dumps({"data": data}),
+                                    content_type='application/json',
+                                    **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        pk = response.json()["result"][0]["_pkid"]
+
+        # The integer pk "abc" is reported on its own rather than failing the statement for every row.
+        updates = [{"pk": "abc", "changes": {"col_three": 1}},
+                   {"pk": str(pk), "changes": {"col_three": 2}}]
+        response = self.client.put(f'/v3/pgrest/data/{root_url}',
+                                   data=json.dumps({"data": updates}),
+                                   content_type='application/json',
+                                   **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()["result"]
+        self.assertEqual([entry["success"] for entry in result["results"]], [False, True])
+        self.assertIn("not a valid integer", result["results"][0]["error"])
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual(response.json()["result"][0]["col_three"], 2)
+
     ###############
     # ENUMS TESTS #
     ###############
@@ -1112,6 +1737,25 @@ class ResponseTestCase(TenantTestCase):
                                     **auth_headers)
         self.assertEqual(response.status_code, 200)
 
+    # Cached table descriptors must not outlive a root_url change.
+    def test_change_root_url_after_data_access(self):
+        table_id = self.init_resp_4["result"]["table_id"]
+        root_url = self.init_resp_4["result"]["root_url"]
+        new_url = "alter_root_url_cached_test"
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.put(f'/v3/pgrest/manage/tables/{table_id}',
+                                   data=json.dumps({"root_url": new_url}),
+                                   content_type='application/json',
+                                   **auth_headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(f'/v3/pgrest/data/{new_url}', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+
     # Change table_name
     def test_change_table_name(self):
         table_id = self.init_resp_3["result"]["table_id"]
@@ -1266,6 +1910,30 @@ class ResponseTestCase(TenantTestCase):
                                     **auth_headers)
         self.assertEqual(response.status_code, 400)
 
+    # Column catalog used by filters and order is refreshed after altering the table.
+    def test_filter_after_add_and_drop_column(self):
+        table_id = self.init_resp_3["result"]["table_id"]
+        root_url = self.init_resp_3["result"]["root_url"]
+        # Filter once so the table's columns get cached.
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?col_five.eq=hehe', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.put(f'/v3/pgrest/manage/tables/{table_id}',
+                                   data=json.dumps({"add_column": {"col_six": {"data_type": "integer"}}}),
+                                   content_type='application/json',
+                                   **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?col_six.eq=1&order=col_six', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.put(f'/v3/pgrest/manage/tables/{table_id}',
+                                   data=json.dumps({"drop_column": "col_five"}),
+                                   content_type='application/json',
+                                   **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/v3/pgrest/data/{root_url}?col_five.eq=hehe', **auth_headers)
+        self.assertEqual(response.status_code, 400)
+
     # Drop default
     def test_drop_default(self):
         table_id = self.init_resp_3["result"]["table_id"]
@@ -1350,6 +2018,20 @@ class ResponseTestCase(TenantTestCase):
         response = self.client.get(f'/v3/pgrest/manage/views', **auth_headers)
         self.assertEqual(len(response.json()["result"]), 1)
 
+    def test_view_keyset_requires_unique_order_column(self):
+        response = self.client.post(f'/v3/pgrest/manage/views', **auth_headers,
+                                    data=json.dumps({'view_name': 'test_view',
+                                                     'root_url': 'just_a_cool_url',
+                                                     'select_query': '*',
+                                                     'from_table': 'initial_table_2'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # Plain views can't have unique indexes, so a page boundary could skip rows sharing the order value.
+        response = self.client.get('/v3/pgrest/views/just_a_cool_url?keyset=true&limit=2&order=col_two',
+                                   **auth_headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("unique index", response.json()["message"])
+
     # Check that all search parameters work on views too.
     def test_all_search_parameters(self):
         # Add data to init_table_5
@@ -1618,3 +2300,264 @@ class ResponseTestCase(TenantTestCase):
         self.assertEqual(response.status_code, 200)
         res_dict = response.json()
         self.assertEqual(res_dict['result'], "No changes made. User already didn't have role")
+
+    ###############
+    # STATS TESTS #
+    ###############
+
+    def test_stats(self):
+        # Hit the data path so this worker has a pool for the default db_instance.
+        root_url = self.init_resp_1["result"]["root_url"]
+        response = self.client.get(f'/v3/pgrest/data/{root_url}', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/v3/pgrest/manage/stats', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        pool_stats = response.json()["result"]["connection_pools"]["default"]
+        self.assertGreaterEqual(pool_stats["checkouts"], 1)
+        self.assertLessEqual(pool_stats["open"], pool_stats["max_size"])
+
+    def test_role_cache(self):
+        # Every request looks up the caller's roles, repeat requests should be served from the role cache.
+        for _ in range(3):
+            response = self.client.get('/v3/pgrest/manage/tables', **auth_headers)
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/v3/pgrest/manage/stats', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        role_stats = response.json()["result"]["caches"]["sk_roles"]
+        self.assertGreaterEqual(role_stats["hits"], 2)
+        self.assertLessEqual(role_stats["size"], role_stats["maxsize"])
+
+    def test_invalidation_event_evicts_roles(self):
+        response = self.client.get('/v3/pgrest/manage/tables', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        cached = [key for key in list(ROLE_CACHE._data) if key[0] == 'dev']
+        self.assertTrue(cached)
+
+        tenant, username = cached[0]
+        publish("roles", tenant=tenant, username=username)
+        self.assertIsNone(ROLE_CACHE.get((tenant, username)))
+
+    def test_tenant_registry(self):
+        for _ in range(2):
+            response = self.client.get('/v3/pgrest/manage/tables', **auth_headers)
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/v3/pgrest/manage/stats', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        registry_stats = response.json()["result"]["caches"]["tenant_registry"]
+        # Base URL and tenant record lookups on every request after the first are hits.
+        self.assertGreaterEqual(registry_stats["hits"], 2)
+
+    def test_api_requests_do_not_use_sessions(self):
+        response = self.client.get('/v3/pgrest/manage/tables', **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('sessionid', response.cookies)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM public.django_session")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class StubProfilesHandler(BaseHTTPRequestHandler):
+    """
+    Stands in for the v2 profiles API. 'Bearer good' is user testuser, 'Bearer down' is a server error,
+    anything else is an invalid token.
+    """
+    calls = 0
+
+    def do_GET(self):
+        StubProfilesHandler.calls += 1
+        auth = self.headers.get('Authorization')
+        if auth == 'Bearer down':
+            self.send_response(503)
+            body = b'{}'
+        elif auth == 'Bearer good':
+            self.send_response(200)
+            body = json.dumps({"result": {"username": "testuser"}}).encode()
+        else:
+            self.send_response(401)
+            body = json.dumps({"status": "error", "message": "Invalid Credentials"}).encode()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class V2ProfilesBackendTestCase(SimpleTestCase):
+    def setUp(self):
+        StubProfilesHandler.calls = 0
+        self.server = HTTPServer(('127.0.0.1', 0), StubProfilesHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.backend = V2ProfilesBackend(url=f"http://127.0.0.1:{self.server.server_port}/profiles/v2/me",
+                                         connect_timeout=1,
+                                         read_timeout=2,
+                                         cache_ttl=60,
+                                         negative_ttl=60,
+                                         maxsize=10,
+                                         pool_size=2)
+
+    def tearDown(self):
+        self.backend.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_valid_token_is_cached(self):
+        self.assertEqual(self.backend.resolve_username('good'), 'testuser')
+        self.assertEqual(self.backend.resolve_username('good'), 'testuser')
+        self.assertEqual(StubProfilesHandler.calls, 1)
+
+    def test_invalid_token_is_negatively_cached(self):
+        self.assertIsNone(self.backend.resolve_username('bad'))
+        self.assertIsNone(self.backend.resolve_username('bad'))
+        self.assertEqual(StubProfilesHandler.calls, 1)
+
+    def test_server_error_is_not_cached(self):
+        with self.assertRaises(V2ProfilesError):
+            self.backend.resolve_username('down')
+        with self.assertRaises(V2ProfilesError):
+            self.backend.resolve_username('down')
+        self.assertEqual(StubProfilesHandler.calls, 2)
+
+
+@unittest.skipUnless(arrow_available(), "pyarrow is not installed")
+class ArrowTypeTestCase(SimpleTestCase):
+    def test_numeric_types(self):
+        import pyarrow
+        self.assertEqual(arrow_type("numeric(10,2)"), pyarrow.decimal128(10, 2))
+        self.assertEqual(arrow_type("numeric(50,4)"), pyarrow.decimal256(50, 4))
+        # Too wide for any Arrow decimal, or no fixed precision at all: sent as strings.
+        self.assertIsNone(arrow_type("numeric(100,4)"))
+        self.assertIsNone(arrow_type("numeric"))
+
+
+class LRUCacheTestCase(SimpleTestCase):
+    def test_load_invalidated_midway_is_not_cached(self):
+        cache = LRUCache("test_generation")
+
+        def loader():
+            # E.g. a roles event popping the entry while SK is still answering with the old roles.
+            cache.pop("key")
+            return "old"
+
+        self.assertEqual(cache.get_or_load("key", loader), "old")
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.get_or_load("key", lambda: "new"), "new")
+        self.assertEqual(cache.get("key"), "new")
+
+
+class TokenClaimsCacheTestCase(SimpleTestCase):
+    class StubTapis:
+        # Stands in for the service's tapipy client; validate_token counts its calls.
+        def __init__(self, exp):
+            self.exp = exp
+            self.calls = 0
+
+        def validate_token(self, token):
+            self.calls += 1
+            if token == "bad":
+                raise errors.AuthenticationError(msg="Invalid token")
+            return {"tapis/username": "testuser", "tapis/tenant_id": "dev", "exp": self.exp}
+
+    def setUp(self):
+        views.TOKEN_CLAIMS_CACHE.clear()
+        self.addCleanup(views.TOKEN_CLAIMS_CACHE.clear)
+
+    def test_second_call_skips_validation(self):
+        stub = self.StubTapis(exp=time.time() + 300)
+        with mock.patch.object(views, "t", stub):
+            self.assertEqual(views.validate_token_cached("good")["tapis/username"], "testuser")
+            self.assertEqual(views.validate_token_cached("good")["tapis/username"], "testuser")
+        self.assertEqual(stub.calls, 1)
+
+    def test_entry_expires_at_token_exp(self):
+        stub = self.StubTapis(exp=time.time() + 0.2)
+        with mock.patch.object(views, "t", stub):
+            views.validate_token_cached("good")
+            views.validate_token_cached("good")
+            self.assertEqual(stub.calls, 1)
+            time.sleep(0.3)
+            views.validate_token_cached("good")
+        self.assertEqual(stub.calls, 2)
+
+    def test_invalid_token_is_not_cached(self):
+        stub = self.StubTapis(exp=time.time() + 300)
+        with mock.patch.object(views, "t", stub):
+            for _ in range(2):
+                with self.assertRaises(errors.AuthenticationError):
+                    views.validate_token_cached("bad")
+        self.assertEqual(stub.calls, 2)
+        self.assertEqual(len(views.TOKEN_CLAIMS_CACHE), 0)
+
+
+class SerializationTestCase(SimpleTestCase):
+    row = {"id": 1,
+           "created": datetime.datetime(2023, 5, 3, 12, 0, 0, 500),
+           "day": datetime.date(2023, 5, 3),
+           "amount": decimal.Decimal("1.50"),
+           "uid": uuid.UUID(int=5),
+           "name": "caf\u00e9",
+           "tags": ["a", "b"],
+           "note": None}
+
+    def test_stdlib_serializer(self):
+        data = serialization.StdlibSerializer().dumps({"result": [self.row]})
+        self.assertIsInstance(data, bytes)
+        row = json.loads(data)["result"][0]
+        self.assertEqual(row["created"], "2023-05-03T12:00:00.000500")
+        self.assertEqual(row["day"], "2023-05-03")
+        self.assertEqual(row["amount"], 1.5)
+        self.assertEqual(row["uid"], "00000000-0000-0000-0000-000000000005")
+        self.assertEqual(row["name"], "caf\u00e9")
+
+    def test_non_finite_decimals_are_strings(self):
+        data = serialization.StdlibSerializer().dumps({"amount": decimal.Decimal("NaN")})
+        self.assertEqual(json.loads(data)["amount"], "NaN")
+
+    @unittest.skipUnless(serialization.orjson is not None, "orjson is not installed")
+    def test_orjson_matches_stdlib(self):
+        self.assertEqual(serialization.OrjsonSerializer().dumps(self.row),
+                         serialization.StdlibSerializer().dumps(self.row))
+
+
+class InvalidationListenerTestCase(SimpleTestCase):
+    class SequenceCursor:
+        # Stands in for the listener's cursor; _current_version reads (last_value, is_called).
+        def __init__(self):
+            self.value = 0
+
+        def execute(self, command):
+            pass
+
+        def fetchone(self):
+            return (self.value, True)
+
+    def setUp(self):
+        self.cur = self.SequenceCursor()
+        self.listener = InvalidationListener("default", 1)
+        self.listener.last_version = 0
+        self.flushes = []
+        self._flush_caches = invalidation.flush_caches
+        invalidation.flush_caches = lambda: self.flushes.append(True)
+
+    def tearDown(self):
+        invalidation.flush_caches = self._flush_caches
+
+    def test_notification_in_flight_is_not_a_gap(self):
+        # publish() took version 1 but its NOTIFY only arrives after the poll.
+        self.cur.value = 1
+        self.listener._check_version(self.cur)
+        self.listener.last_version = 1
+        self.listener._check_version(self.cur)
+        self.assertEqual(self.flushes, [])
+
+    def test_gap_flushes_on_second_poll(self):
+        self.cur.value = 1
+        self.listener._check_version(self.cur)
+        self.assertEqual(self.flushes, [])
+        self.listener._check_version(self.cur)
+        self.assertEqual(self.flushes, [True])
+        self.assertEqual(self.listener.last_version, 1)
@@ -24,6 +24,9 @@ urlpatterns = [
     # (Materialized) Views: GET ALL, POST
     url('^v3/pgrest/manage/views', views.ViewManagement.as_view()),
 
+    # Stats: GET
+    url('^v3/pgrest/manage/stats', views.StatsResource.as_view()),
+
     # Roles: GET SINGLE, DELETE
     url('^v3/pgrest/manage/roles/(?P<role_name>.+)', views.RoleManagementByName.as_view()),
     # Roles: GET ALL, POST
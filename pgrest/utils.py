@@ -1,4 +1,3 @@
-import json
 import datetime
 
 from django.http import HttpResponseForbidden
@@ -6,6 +5,7 @@ from django.core.serializers.json import DjangoJSONEncoder
 
 from tapisservice import errors as common_errors
 from pgrest.__init__ import t
+from pgrest import serialization
 from tapisservice.config import conf
 from tapisservice.logs import get_logger
 from tapipy.errors import UnauthorizedError
@@ -45,7 +45,7 @@ def make_error(msg=None, metadata={}):
          "version": get_version(),
          "result": None,
          "metadata": metadata}
-    return json.dumps(d)
+    return serialization.dumps(d)
 
 
 def make_success(result=None, msg=None, metadata={}):
@@ -61,7 +61,79 @@ def make_success(result=None, msg=None, metadata={}):
          "version": get_version(),
          "result": result,
          "metadata": metadata}
-    return json.dumps(d, default=timestampJSONEncoder)
+    return serialization.dumps(d)
+
+
+def make_success_json(result_json, msg=None, metadata=None):
+    """
+    Version of make_success for a result that is already JSON text (e.g. built by Postgres with json_agg).
+    The text is spliced into the response as is, without being parsed.
+    """
+    if not msg:
+        msg = "The request was successful."
+    head = serialization.dumps({"status": "success",
+                                "message": msg,
+                                "version": get_version()})
+    if isinstance(result_json, str):
+        result_json = result_json.encode()
+    return (head[:-1] + b',"result":' + result_json +
+            b',"metadata":' + serialization.dumps(metadata or {}) + b'}')
+
+
+def make_success_stream(result_chunks, msg=None, metadata=None):
+    """
+    Generator version of make_success for StreamingHttpResponse. result_chunks yields JSON text for
+    consecutive items of the result list (several comma separated items per chunk is fine). The
+    metadata dict is serialized after the result, so it may be filled in while the result streams.
+    """
+    if not msg:
+        msg = "The request was successful."
+    head = serialization.dumps({"status": "success",
+                                "message": msg,
+                                "version": get_version()})
+    yield head[:-1] + b',"result":['
+    first = True
+    for chunk in result_chunks:
+        if not chunk:
+            continue
+        yield chunk if first else b"," + chunk
+        first = False
+    yield b'],"metadata":' + serialization.dumps(metadata or {}) + b'}'
+
+
+def rows_to_json_chunks(row_stream, primary_key=None):
+    """
+    Serializes each batch from a RowStream into a chunk of comma separated JSON objects for
+    make_success_stream. When primary_key is given and was selected, each row also gets the `_pkid` field.
+    """
+    columns = row_stream.columns
+    if primary_key not in columns:
+        primary_key = None
+    for batch in row_stream:
+        rows = [dict(zip(columns, row)) for row in batch]
+        if primary_key:
+            for row in rows:
+                row['_pkid'] = row[primary_key]
+        # Strip the list brackets, make_success_stream supplies them.
+        yield serialization.dumps(rows)[1:-1]
+
+
+def rows_to_ndjson_chunks(row_stream, primary_key=None):
+    """
+    Serializes each batch from a RowStream as newline delimited JSON, one row object per line.
+    When primary_key is given and was selected, each row also gets the `_pkid` field.
+    """
+    columns = row_stream.columns
+    if primary_key not in columns:
+        primary_key = None
+    for batch in row_stream:
+        lines = []
+        for row in batch:
+            row = dict(zip(columns, row))
+            if primary_key:
+                row['_pkid'] = row[primary_key]
+            lines.append(serialization.dumps(row))
+        yield b"\n".join(lines) + b"\n"
 
 
 def create_validate_schema(columns, tenant, existing_enum_names):
@@ -113,15 +185,64 @@ def create_validate_schema(columns, tenant, existing_enum_names):
     return schema_create, schema_update
 
 
+
+def where_clause_to_search_params(where_clause):
+    """
+    Parses the where clause of write requests, {column: {"operator": oper, "value": value}, ...}, into the
+    search_params format search_parse() takes, [[column, .oper, value], ...].
+    """
+    logger.info(f"Parsing where_clause: {where_clause}")
+    if not isinstance(where_clause, dict):
+        msg = f"Error, where clause should come as a dict, got {type(where_clause)}"
+        logger.error(msg)
+        raise Exception(msg)
+    search_params = []
+    for where_key, where_dict in where_clause.items():
+        if not isinstance(where_dict, dict):
+            msg = f"Error in where_clause. Got key, but value should be of type dict, got {where_dict}"
+            logger.error(msg)
+            raise Exception(msg)
+        where_oper = where_dict.get("operator")
+        where_value = where_dict.get("value")
+        if not where_oper:
+            msg = f"'operator' must be a key in where_clause dict. where_clause dict: {where_dict}"
+            logger.error(msg)
+            raise Exception(msg)
+        if not isinstance(where_oper, str):
+            msg = f"'operator' must be a string, got: {where_oper}, type: {type(where_oper)}"
+            logger.error(msg)
+            raise Exception(msg)
+
+        opers = ['neq', 'eq', 'lte', 'lt', 'gte', 'gt', 'nin', 'in', 'nlike', 'like', 'between', 'nbetween', 'null']
+        if where_oper not in opers:
+            msg = f"where_oper must be in {opers}, got {where_oper}."
+            logger.error(msg)
+            raise Exception(msg)
+
+        # Falsy values such as false, 0 and "" are valid filters, so check for the key itself.
+        # Only the null operator may omit it, in which case it means "is null".
+        if "value" not in where_dict:
+            if where_oper != "null":
+                msg = f"'value' must be a key in where_clause dict. where_clause dict: {where_dict}"
+                logger.error(msg)
+                raise Exception(msg)
+            where_value = "true"
+        elif where_oper == "null" and isinstance(where_value, bool):
+            where_value = str(where_value).lower()
+
+        search_params.append([where_key, f".{where_oper}", where_value])
+    logger.info(f"Search params: {search_params}")
+    return search_params
+
 def is_admin(view):
     """
     Determines if a user has an admin role, and returns a 403 if they do not.
     """
     def wrapper(self, request, *args, **kwargs):
         logger.debug("top of is_admin()")
-        roles = request.session['roles']
+        roles = request.auth_context.roles
         if "PGREST_ADMIN" not in roles:
-            msg = f"User {request.session['username']} does not have permission to manage database tables."
+            msg = f"User {request.auth_context.username} does not have permission to manage database tables."
             return HttpResponseForbidden(make_error(msg=msg))
         else:
             return view(self, request, *args, **kwargs)
@@ -134,9 +255,9 @@ def is_role_admin(view):
     """
     def wrapper(self, request, *args, **kwargs):
         logger.debug("top of is_role_admin()")
-        roles = request.session['roles']
+        roles = request.auth_context.roles
         if "PGREST_ADMIN" not in roles and "PGREST_ROLE_ADMIN" not in roles:
-            msg = f"User {request.session['username']} does not have permission to manage pgrest roles."
+            msg = f"User {request.auth_context.username} does not have permission to manage pgrest roles."
             return HttpResponseForbidden(make_error(msg=msg))
         else:
             return view(self, request, *args, **kwargs)
@@ -148,9 +269,9 @@ def can_write(view):
     Determines if a user has an admin or a write role, and returns a 403 if they do not.
     """
     def wrapper(self, request, *args, **kwargs):
-        roles = request.session["roles"]
+        roles = request.auth_context.roles
         if "PGREST_ADMIN" not in roles and "PGREST_WRITE" not in roles:
-            msg = f"User {request.session['username']} does not have permission to write."
+            msg = f"User {request.auth_context.username} does not have permission to write."
             return HttpResponseForbidden(make_error(msg=msg))
         else:
             return view(self, request, *args, **kwargs)
@@ -162,9 +283,9 @@ def can_read(view):
     Determines if a user has an admin role, or write role, or read role, and returns a 403 if they do not.
     """
     def wrapper(self, request, *args, **kwargs):
-        roles = request.session["roles"]
+        roles = request.auth_context.roles
         if "PGREST_ADMIN" not in roles and "PGREST_WRITE" not in roles and "PGREST_READ" not in roles:
-            msg = f"User {request.session['username']} does not have permission to read."
+            msg = f"User {request.auth_context.username} does not have permission to read."
             return HttpResponseForbidden(make_error(msg=msg))
         else:
             return view(self, request, *args, **kwargs)
@@ -176,9 +297,9 @@ def is_user(view):
     Determines if a user has an user role, or read role, or write role, or admin role, and returns a 403 if they do not.
     """
     def wrapper(self, request, *args, **kwargs):
-        roles = request.session["roles"]
+        roles = request.auth_context.roles
         if "PGREST_ADMIN" not in roles and "PGREST_WRITE" not in roles and "PGREST_READ" not in roles and "PGREST_USER" not in roles:
-            msg = f"User {request.session['username']} is not a user on this tenant for PgREST."
+            msg = f"User {request.auth_context.username} is not a user on this tenant for PgREST."
             return HttpResponseForbidden(make_error(msg=msg))
         else:
             return view(self, request, *args, **kwargs)
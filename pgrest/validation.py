@@ -0,0 +1,149 @@
+import hashlib
+import json
+import threading
+from collections.abc import Mapping, Sequence, Sized
+
+from cerberus import Validator
+from pgrest.cache import LRUCache
+from tapisservice.config import conf
+from tapisservice.logs import get_logger
+logger = get_logger(__name__)
+
+# Compiled row validators, {(table_id, schema_version): RowValidator}
+VALIDATORS = LRUCache("row_validators", maxsize=conf.validator_cache_max_size)
+
+# Type checks matching Cerberus' own type definitions, as (included types, excluded types).
+# Note Cerberus accepts bools as integers and floats, so we do too.
+TYPE_CHECKS = {
+    "string": ((str,), ()),
+    "integer": ((int,), ()),
+    "float": ((float, int), ()),
+    "number": ((int, float), (bool,)),
+    "boolean": ((bool,), ()),
+    "list": ((Sequence,), (str,)),
+    "dict": ((Mapping,), ()),
+}
+# Rules create_validate_schema() generates that the fast path knows how to check.
+SUPPORTED_RULES = {"type", "required", "nullable", "maxlength"}
+
+
+class RowValidator:
+    """
+    Validates rows against a table's create or update schema.
+
+    The schema is compiled once into a list of plain Python checks. Rows are run through
+    those checks and only rows that fail are handed to Cerberus, which produces the error
+    messages users already get. Schemas using rules the fast path doesn't know fall back
+    to Cerberus for every row.
+    """
+    def __init__(self, schema):
+        self.schema = schema
+        self._validator = Validator(schema)
+        # Cerberus validators keep state between calls, so don't share one across threads.
+        self._lock = threading.Lock()
+        self._fields = self._compile(schema)
+        if self._fields is None:
+            logger.debug(f"Schema uses rules outside of {SUPPORTED_RULES}; validating with Cerberus only.")
+
+    @staticmethod
+    def _compile(schema):
+        fields = {}
+        for column, rules in schema.items():
+            if not isinstance(rules, dict) or not set(rules) <= SUPPORTED_RULES:
+                return None
+            type_name = rules.get("type")
+            if type_name is not None and type_name not in TYPE_CHECKS:
+                return None
+            included, excluded = TYPE_CHECKS.get(type_name, ((object,), ()))
+            fields[column] = (included,
+                              excluded,
+                              rules.get("required", False),
+                              rules.get("nullable", False),
+                              rules.get("maxlength"))
+        return fields
+
+    def _fast_check(self, row):
+        fields = self._fields
+        for column in row:
+            if column not in fields:
+                return False
+        for column, (included, excluded, required, nullable, maxlength) in fields.items():
+            if column not in row:
+                if required:
+                    return False
+                continue
+            value = row[column]
+            if value is None:
+                if not nullable:
+                    return False
+                continue
+            if not isinstance(value, included) or (excluded and isinstance(value, excluded)):
+                return False
+            if maxlength is not None and isinstance(value, Sized) and len(value) > maxlength:
+                return False
+        return True
+
+    def _cerberus_errors(self, row):
+        with self._lock:
+            if self._validator.validate(row):
+                return None
+            return self._validator.errors
+
+    def validate(self, row):
+        """
+        Returns None if row is valid, otherwise the Cerberus error dict.
+        """
+        if self._fields is not None and isinstance(row, dict) and self._fast_check(row):
+            return None
+        if not isinstance(row, dict):
+            return {"row": [f"must be of dict type, got {type(row).__name__}"]}
+        return self._cerberus_errors(row)
+
+    def validate_rows(self, rows):
+        """
+        Validates a list of rows in one pass. Returns a list of {"index": i, "errors": {...}}
+        for every invalid row; an empty list means every row is valid.
+        """
+        invalid = []
+        for index, row in enumerate(rows):
+            errors = self.validate(row)
+            if errors:
+                invalid.append({"index": index, "errors": errors})
+        return invalid
+
+
+def schema_version(schema):
+    """
+    Returns a short digest of a validation schema. Any change to the schema changes its version.
+    """
+    return hashlib.sha1(json.dumps(schema, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def get_validator(table_id, schema):
+    """
+    Returns the cached RowValidator for a table's schema, compiling it on first use.
+    table_id may be None for callers that don't know the table, the schema version alone is then the key.
+    """
+    key = (table_id, schema_version(schema))
+    validator = VALIDATORS.get(key)
+    if validator is None:
+        validator = RowValidator(schema)
+        VALIDATORS.set(key, validator)
+    return validator
+
+
+def invalidate_validators(table_id):
+    """
+    Drops every cached validator for a table. Call after the table's schemas change or the table is dropped.
+    """
+    VALIDATORS.evict(lambda key: key[0] == table_id)
+
+
+def format_row_errors(invalid_rows, limit=10):
+    """
+    Formats validate_rows() output for error messages, capped at `limit` rows.
+    """
+    shown = "; ".join(f"row {entry['index']}: {entry['errors']}" for entry in invalid_rows[:limit])
+    if len(invalid_rows) > limit:
+        shown += f"; ...and {len(invalid_rows) - limit} more invalid rows"
+    return shown
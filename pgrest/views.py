@@ -1,30 +1,41 @@
 import datetime
 import json
+import os
 import re
+import time
 import timeit
 import copy
 
-import requests
-from cerberus import Validator
-from database_tenants.models import Tenants
+from database_tenants.registry import get_tenant_record, tenant_id_for_base_url
 from django.db import transaction
 from django.http import (HttpResponse, HttpResponseBadRequest,
                          HttpResponseForbidden, HttpResponseNotFound,
-                         HttpResponseServerError)
-from pgrest.db_transactions.data_utils import do_transaction
+                         HttpResponseServerError, StreamingHttpResponse)
+from pgrest.db_transactions.data_utils import do_transaction, get_column_catalog, invalidate_column_catalog
 from rest_framework.views import APIView
 
-from pgrest.db_transactions import (bulk_data, manage_tables, table_data,
+from pgrest.db_transactions import (bulk_data, manage_tables, pool, table_data,
                                     view_data)
 from pgrest.models import ManageTables, ManageTablesTransition, ManageViews
 from pgrest.__init__ import t
-from pgrest.utils import get_tenant_id_from_base_url
+from pgrest.auth import AuthContext, V2ProfilesError, get_v2_backend, token_digest
+from pgrest.cache import LRUCache, cache_stats
+from pgrest.descriptors import get_table_descriptor, get_view_descriptor
+from pgrest.etags import etag_response, sends_etag, table_etag, view_etag
+from pgrest.formats import (ARROW_MEDIA_TYPES, CSV, JSON, NDJSON, PARQUET, RESPONSE_FORMATS, arrow_available,
+                            arrow_chunks, columnar_result, negotiate_media_type)
+from pgrest.invalidation import listener_stats, on_event, publish
+from pgrest.pagination import Keyset, stream_with_continuation
+from pgrest import serialization
+from pgrest.validation import get_validator, invalidate_validators
 from tapisservice import errors
+from tapisservice.config import conf
 from tapisservice.logs import get_logger
 #from tapisservice.auth import validate_token
 from pgrest.utils import (can_read, can_write, create_validate_schema,
                           is_admin, is_role_admin, is_user, make_error,
-                          make_success)
+                          make_success, make_success_json, make_success_stream,
+                          rows_to_json_chunks, rows_to_ndjson_chunks, where_clause_to_search_params)
 
 logger = get_logger(__name__)
 
@@ -52,6 +63,26 @@ def error_500(request):
                         status=500)
 
 
+# Claims of tokens that passed t.validate_token, {sha256(token): claims}. Entries expire at the token's exp claim.
+TOKEN_CLAIMS_CACHE = LRUCache("token_claims", maxsize=conf.token_cache_max_size)
+
+
+def validate_token_cached(token):
+    """
+    Returns the token's claims, only running t.validate_token for tokens not seen before
+    (or seen since they were last cached and evicted). Tokens without an exp claim are never cached.
+    """
+    key = token_digest(token)
+    claims = TOKEN_CLAIMS_CACHE.get(key)
+    if claims is not None:
+        return claims
+    claims = t.validate_token(token)
+    exp = claims.get('exp')
+    if isinstance(exp, (int, float)) and exp > time.time():
+        TOKEN_CLAIMS_CACHE.set(key, claims, expires_at=exp)
+    return claims
+
+
 def resolve_tapis_v3_token(request, tenant_id):
     """
     Validates a tapis v3 token in the X-Tapis-Token header
@@ -59,7 +90,7 @@ def resolve_tapis_v3_token(request, tenant_id):
     v3_token = request.META.get('HTTP_X_TAPIS_TOKEN')
     if v3_token:
         try:
-            claims = t.validate_token(v3_token)
+            claims = validate_token_cached(v3_token)
         except errors.NoTokenError as e:
             msg = "No Tapis token found in the request. Be sure to specify the X-Tapis-Token header."
             logger.info(msg)
@@ -106,19 +137,12 @@ def get_username_for_request(request, tenant_id):
         return resolve_tapis_v3_token(request, tenant_id)
 
     try:
-        url = "https://api.tacc.utexas.edu/profiles/v2/me"
-        head = {'Authorization': f'Bearer {v2_token}'}
-        response = requests.get(url, headers=head)
-    except Exception as e:
-        msg = f"Got exception making request to profiles API. Exception: {e}"
-        logger.error(msg)
+        username = get_v2_backend().resolve_username(v2_token)
+    except V2ProfilesError as e:
+        logger.error(str(e))
         msg = "Unable to validate v2 token; internal error looking up the associated profile."
         return None, HttpResponseForbidden(make_error(msg=msg))
-    logger.debug(f"got response from profiles API: {response}")
-    # get username
-    try:
-        username = response.json()['result']['username']
-    except KeyError:
+    if not username:
         msg = "Unable to validate v2 token; either the token is invalid, " \
               "expired, or does not represent a valid user in the v2 TACC tenant."
         logger.error(msg)
@@ -127,7 +151,15 @@ def get_username_for_request(request, tenant_id):
     return username, None
 
 
-def get_user_sk_roles(tenant, username):
+# SK roles, {(tenant, username): [role_name, ...]}. Entries are dropped when roles are granted or
+# revoked through this API; roles changed directly in SK show up once the entry expires.
+ROLE_CACHE = LRUCache("sk_roles",
+                      maxsize=conf.role_cache_max_size,
+                      ttl=conf.role_cache_ttl,
+                      stale_ttl=conf.role_cache_stale_ttl)
+
+
+def fetch_user_sk_roles(tenant, username):
     logger.debug(f"Getting SK roles on tenant {tenant} and user {username}")
     start_timer = timeit.default_timer()
     try:
@@ -142,15 +174,29 @@ def get_user_sk_roles(tenant, username):
     total = (end_timer - start_timer) * 1000
     if total > 4000:
         logger.critical(f"t.sk.getUserRoles took {total} to run for user {username}, tenant: {tenant}")
-    roles_list = roles_obj.names
+    roles_list = list(roles_obj.names)
     logger.debug(f"Roles received: {roles_list}")
     return roles_list
 
 
+def get_user_sk_roles(tenant, username):
+    """
+    Returns the user's SK roles, from ROLE_CACHE when possible. Concurrent misses for the same user
+    share one SK call, and if SK fails the last known roles are used for up to role_cache_stale_ttl.
+    """
+    roles = ROLE_CACHE.get_or_load((tenant, username), lambda: fetch_user_sk_roles(tenant, username))
+    return list(roles)
+
+
+@on_event("roles")
+def invalidate_user_sk_roles(event):
+    ROLE_CACHE.pop((event["tenant"], event["username"]))
+
+
 class RoleSessionMixin:
     """
     Retrieves username from Agave for tacc.prod token, then retrieves roles for this user in SK and stores data
-    in django session.
+    in request.auth_context for the rest of the request.
     """
 
     # Override dispatch to decode token and store variables before routing the request.
@@ -158,6 +204,7 @@ class RoleSessionMixin:
         logger.info(f"top of dispatch; headers: {request.META.keys()}")
         # first, determine tenant_id from base URL --
         tenant_id = None
+        tenant_record = None
         try:
             # Get the base url from the incoming request, and then use that to determine tenant_id
             request_url = request.scheme + "://" + request.get_host()
@@ -170,7 +217,12 @@ class RoleSessionMixin:
                 if tapis_local_tenant:
                     tenant_id = tapis_local_tenant
             if not tenant_id:
-                tenant_id = get_tenant_id_from_base_url(request_url, t.tenant_cache)
+                # GetTenantsFromRequest already resolved the tenant from the base URL.
+                tenant_record = getattr(request, 'tenant_record', None)
+                if tenant_record:
+                    tenant_id = tenant_record.tenant_id
+                else:
+                    tenant_id = tenant_id_for_base_url(request_url)
         except Exception as e:
             msg = f"Error occurred while calculating tenant ID from the request base URL."
             logger.error(msg)
@@ -191,10 +243,7 @@ class RoleSessionMixin:
 
         # Grab data about roles from SK.
         try:
-            roles = t.sk.getUserRoles(user=username, tenant=tenant_id, _tapis_set_x_headers_from_service=True)
-            role_list = list()
-            for name in roles.names:
-                role_list.append(name)
+            role_list = get_user_sk_roles(tenant_id, username)
         except Exception as e:
             msg = f"Error occurred while retrieving roles from SK: {e}"
             logger.error(msg)
@@ -202,7 +251,11 @@ class RoleSessionMixin:
         logger.debug(f"got roles: {role_list}")
         
         try:
-            db_instance_name = Tenants.objects.get(tenant_name=tenant_id).db_instance_name
+            if tenant_record is None:
+                tenant_record = get_tenant_record(tenant_id)
+            if tenant_record is None:
+                raise Exception(f"No tenant named {tenant_id}")
+            db_instance_name = tenant_record.db_instance_name
         except Exception as e:
             msg = f"Error occurred while retrieving the db instance name for tenant '{tenant_id}'. " \
                   f"Details: {e}."
@@ -210,10 +263,10 @@ class RoleSessionMixin:
             return HttpResponseBadRequest(make_error(msg=msg))
         logger.debug(f"got db_instance_name: {db_instance_name}")
 
-        request.session['roles'] = role_list
-        request.session['username'] = username
-        request.session['tenant_id'] = tenant_id
-        request.session['db_instance_name'] = db_instance_name
+        request.auth_context = AuthContext(username=username,
+                                           tenant_id=tenant_id,
+                                           roles=role_list,
+                                           db_instance_name=db_instance_name)
 
         return super().dispatch(request, *args, **kwargs)
 
@@ -228,7 +281,7 @@ class TableManagement(RoleSessionMixin, APIView):
     @is_admin
     def get(self, request, *args, **kwargs):
         logger.debug("top of get /manage/tables")
-        req_tenant = request.session['tenant_id']
+        req_tenant = request.auth_context.tenant_id
 
         # Check for details=true. Decide what a brief description and a detailed description is.
         details = self.request.query_params.get('details')
@@ -274,8 +327,8 @@ class TableManagement(RoleSessionMixin, APIView):
     @is_admin
     def post(self, request, *args, **kwargs):
         logger.debug("top of post /manage/tables")
-        req_tenant = request.session['tenant_id']
-        db_instance_name = request.session['db_instance_name']
+        req_tenant = request.auth_context.tenant_id
+        db_instance_name = request.auth_context.db_instance_name
 
         # Parse out required fields.
         try:
@@ -405,6 +458,7 @@ class TableManagement(RoleSessionMixin, APIView):
             msg = f"Failed to create table {table_name}. {e}"
             logger.error(msg)
             return HttpResponseBadRequest(make_error(msg=msg))
+        publish("tenant_objects", tenant=req_tenant, db_instance=db_instance_name)
 
         return HttpResponse(make_success(result=result), content_type='application/json')
 
@@ -456,7 +510,7 @@ class TableManagementById(RoleSessionMixin, APIView):
     def get(self, request, *args, **kwargs):
         logger.debug("top of get /manage/tables/<id>")
         # req_tenant = "public"
-        req_tenant = request.session['tenant_id']
+        req_tenant = request.auth_context.tenant_id
 
         # Check for details=true. Decide what a brief description and a detailed description is.
         details = self.request.query_params.get('details')
@@ -521,6 +575,16 @@ class TableManagementById(RoleSessionMixin, APIView):
 
     @is_admin
     def put(self, request, *args, **kwargs):
+        # Every branch of alter_table() may have changed the table (or reverted a change), so tell
+        # the other workers however it returns.
+        try:
+            return self.alter_table(request, *args, **kwargs)
+        finally:
+            publish("tenant_objects",
+                    tenant=request.auth_context.tenant_id,
+                    db_instance=request.auth_context.db_instance_name)
+
+    def alter_table(self, request, *args, **kwargs):
         """Alter tables using Postgres Alter table commands. This is complicated because
         each table has it's column_definition saved in managetables along with table name.
         We use these to ensure row puts are in the proper formatting and that we call the correct
@@ -557,8 +621,8 @@ class TableManagementById(RoleSessionMixin, APIView):
             400: Description of operation error.
         """
         logger.debug("top of put /manage/tables/<table_id>")
-        req_tenant = request.session['tenant_id']
-        db_instance_name = request.session['db_instance_name']
+        req_tenant = request.auth_context.tenant_id
+        db_instance_name = request.auth_context.db_instance_name
 
         # Parse out required fields.
         try:
@@ -636,7 +700,9 @@ class TableManagementById(RoleSessionMixin, APIView):
                 table.table_name = table_name
                 table.save()
                 command = f"ALTER TABLE {req_tenant}.{backup_table.table_name} RENAME TO {table_name}"
-                do_transaction(command, db_instance_name)
+                do_transaction(command, db_instance_name, changes=(req_tenant, table_name))
+                invalidate_column_catalog(req_tenant, backup_table.table_name, db_instance_name)
+                invalidate_column_catalog(req_tenant, table_name, db_instance_name)
             except Exception as e:
                 # Revert Django
                 backup_table.save()
@@ -783,8 +849,10 @@ class TableManagementById(RoleSessionMixin, APIView):
                 table.validate_json_create = validate_json_create
                 table.validate_json_update = validate_json_update
                 table.save()
+                invalidate_validators(table.manage_table_id)
                 command = f"ALTER TABLE {req_tenant}.{backup_table.table_name} ALTER COLUMN {column_name} TYPE {new_type}"
-                do_transaction(command, db_instance_name)
+                do_transaction(command, db_instance_name, changes=(req_tenant, backup_table.table_name))
+                invalidate_column_catalog(req_tenant, backup_table.table_name, db_instance_name)
             except Exception as e:
                 # Revert Django
                 backup_table.save()
@@ -965,8 +1033,10 @@ class TableManagementById(RoleSessionMixin, APIView):
                 table.validate_json_create = validate_json_create
                 table.validate_json_update = validate_json_update
                 table.save()
+                invalidate_validators(table.manage_table_id)
                 command = f"ALTER TABLE {req_tenant}.{backup_table.table_name} ADD {col_def_command};"
-                do_transaction(command, db_instance_name)
+                do_transaction(command, db_instance_name, changes=(req_tenant, backup_table.table_name))
+                invalidate_column_catalog(req_tenant, backup_table.table_name, db_instance_name)
             except Exception as e:
                 # Revert Django
                 backup_table.save()
@@ -1015,8 +1085,10 @@ class TableManagementById(RoleSessionMixin, APIView):
                 table.validate_json_create = validate_json_create
                 table.validate_json_update = validate_json_update
                 table.save()
+                invalidate_validators(table.manage_table_id)
                 command = f"ALTER TABLE {req_tenant}.{backup_table.table_name} DROP COLUMN {column_name}"
-                do_transaction(command, db_instance_name)
+                do_transaction(command, db_instance_name, changes=(req_tenant, backup_table.table_name))
+                invalidate_column_catalog(req_tenant, backup_table.table_name, db_instance_name)
             except Exception as e:
                 # Revert Django
                 backup_table.save()
@@ -1065,8 +1137,9 @@ class TableManagementById(RoleSessionMixin, APIView):
                 table.validate_json_create = validate_json_create
                 table.validate_json_update = validate_json_update
                 table.save()
+                invalidate_validators(table.manage_table_id)
                 command = f"ALTER TABLE {req_tenant}.{backup_table.table_name} ALTER COLUMN {column_name} DROP DEFAULT"
-                do_transaction(command, db_instance_name)
+                do_transaction(command, db_instance_name, changes=(req_tenant, backup_table.table_name))
             except Exception as e:
                 # Revert Django
                 backup_table.save()
@@ -1129,8 +1202,9 @@ class TableManagementById(RoleSessionMixin, APIView):
                 table.validate_json_create = validate_json_create
                 table.validate_json_update = validate_json_update
                 table.save()
+                invalidate_validators(table.manage_table_id)
                 command = f"ALTER TABLE {req_tenant}.{backup_table.table_name} ALTER COLUMN {column_name} SET DEFAULT {new_default}"
-                do_transaction(command, db_instance_name)
+                do_transaction(command, db_instance_name, changes=(req_tenant, backup_table.table_name))
             except Exception as e:
                 # Revert Django
                 backup_table.save()
@@ -1145,8 +1219,8 @@ class TableManagementById(RoleSessionMixin, APIView):
     @is_admin
     def delete(self, request, *args, **kwargs):
         logger.debug("top of del /manage/tables/<id>")
-        req_tenant = request.session['tenant_id']
-        db_instance_name = request.session['db_instance_name']
+        req_tenant = request.auth_context.tenant_id
+        db_instance_name = request.auth_context.db_instance_name
 
         # Parse out required fields.
         try:
@@ -1169,6 +1243,7 @@ class TableManagementById(RoleSessionMixin, APIView):
             msg = f"Failed to drop table {table.table_name} from the ManageTables table: {e}"
             logger.error(msg)
             return HttpResponseBadRequest(make_error(msg=msg))
+        publish("tenant_objects", tenant=req_tenant, db_instance=db_instance_name)
 
         return HttpResponse(make_success(msg="Table deleted successfully."), content_type='application/json')
 
@@ -1176,6 +1251,7 @@ class TableManagementById(RoleSessionMixin, APIView):
     def delete_transaction(self, table, tenant_id, db_instance_name):
         ManageTables.objects.get(table_name=table.table_name, tenant_id=tenant_id).delete()
         manage_tables.delete_table(table.table_name, tenant_id, db_instance=db_instance_name)
+        invalidate_validators(table.manage_table_id)
 
 
 class TableManagementDump(RoleSessionMixin, APIView):
@@ -1187,7 +1263,7 @@ class TableManagementDump(RoleSessionMixin, APIView):
     @is_admin
     def post(self, request, *args, **kwargs):
         # req_tenant = "public"
-        req_tenant = request.session['tenant_id']
+        req_tenant = request.auth_context.tenant_id
 
         # Can send in ALL or list of table name(s)
         if request.data == "all":
@@ -1221,7 +1297,7 @@ class TableManagementLoad(RoleSessionMixin, APIView):
     @is_admin
     def post(self, request, *args, **kwargs):
         # req_tenant = "public"
-        req_tenant = request.session['tenant_id']
+        req_tenant = request.auth_context.tenant_id
 
 
 # For dynamic views, all end users will end up here. We will find the corresponding table
@@ -1236,17 +1312,27 @@ class DynamicView(RoleSessionMixin, APIView):
     POST: Creates a new row in the table based on root URL. Restricted to WRITE and above role.
     PUT: Updates the rows in the given table based on filter. If no filter is provided, updates the entire table.
     Restricted to WRITE and above role.
+    DELETE: Deletes the rows in the given table matching a filter or a list of primary keys, in batches.
+    Restricted to WRITE and above role.
     """
     @can_read
+    @sends_etag
     def get(self, request, *args, **kwargs):
         logger.debug("top of get /data/<root_url>")
-        req_tenant = request.session['tenant_id']
-        db_instance = request.session['db_instance_name']
+        req_tenant = request.auth_context.tenant_id
+        db_instance = request.auth_context.db_instance_name
 
         params = self.request.query_params
         limit = self.request.query_params.get("limit")
         offset = self.request.query_params.get("offset")
         order = self.request.query_params.get("order")
+        stream = self.request.query_params.get("stream", "").lower() == "true"
+        use_keyset = self.request.query_params.get("keyset", "").lower() == "true"
+        continuation_token = self.request.query_params.get("continuation_token")
+        select = self.request.query_params.get("select")
+        response_format = self.request.query_params.get("format", "json")
+        dictionary = self.request.query_params.get("dictionary", "").lower() == "true"
+        media_type = negotiate_media_type(request.META.get("HTTP_ACCEPT"))
 
         # Parse out required fields.
         try:
@@ -1257,7 +1343,7 @@ class DynamicView(RoleSessionMixin, APIView):
             return HttpResponseBadRequest(make_error(msg=msg))
 
         try:
-            table = ManageTables.objects.get(root_url=root_url, tenant_id=req_tenant)
+            table = get_table_descriptor(req_tenant, root_url)
         except ManageTables.DoesNotExist:
             msg = f"Table with root url {root_url} does not exist."
             logger.warning(msg)
@@ -1268,6 +1354,10 @@ class DynamicView(RoleSessionMixin, APIView):
             logger.warning(msg)
             return HttpResponseBadRequest(make_error(msg=msg))
 
+        not_modified = etag_response(request, table_etag(request, table))
+        if not_modified:
+            return not_modified
+
         try:
             # Parse params, if the key contains a search operation, throw it into search_params
             # search_params list is [[key, oper, value], ...]
@@ -1310,6 +1400,84 @@ class DynamicView(RoleSessionMixin, APIView):
                 logger.error(msg)
                 return HttpResponseBadRequest(make_error(msg=msg))
 
+            if response_format not in RESPONSE_FORMATS:
+                msg = f"format must be one of {RESPONSE_FORMATS}. Got {response_format}"
+                logger.warning(msg)
+                return HttpResponseBadRequest(make_error(msg=msg))
+            if stream and response_format != "json":
+                msg = f"stream can't be combined with format {response_format}."
+                logger.warning(msg)
+                return HttpResponseBadRequest(make_error(msg=msg))
+            if media_type != JSON and (use_keyset or continuation_token or response_format != "json"):
+                msg = f"Accept: {media_type} can't be combined with keyset pagination or format {response_format}."
+                logger.warning(msg)
+                return HttpResponseBadRequest(make_error(msg=msg))
+            if media_type in ARROW_MEDIA_TYPES and not arrow_available():
+                msg = f"Accept: {media_type} requires pyarrow, which is not installed on this server."
+                logger.warning(msg)
+                return HttpResponse(make_error(msg=msg), status=406, content_type='application/json')
+
+            # ?keyset=true starts keyset pagination, later pages pass back metadata.continuation_token.
+            keyset = None
+            if use_keyset or continuation_token:
+                if offset:
+                    msg = "offset can't be combined with keyset pagination, use continuation_token instead."
+                    logger.warning(msg)
+                    return HttpResponseBadRequest(make_error(msg=msg))
+                keyset = Keyset.from_request(req_tenant, table.table_name, db_instance, table.primary_key, search_params,
+                                             order=order, token=continuation_token)
+
+            # Accept: text/csv and application/x-ndjson export the rows with constant memory.
+            if media_type == CSV:
+                chunks = table_data.copy_rows_from_table(table.table_name, search_params, req_tenant, limit, offset,
+                                                         db_instance, order=order, select=select)
+                response = StreamingHttpResponse(chunks, content_type='text/csv; charset=utf-8')
+                response['Content-Disposition'] = f'attachment; filename="{root_url}.csv"'
+                return response
+            if media_type == NDJSON:
+                rows = table_data.stream_rows_from_table(table.table_name, search_params, req_tenant, limit, offset,
+                                                         db_instance, order=order, select=select)
+                return StreamingHttpResponse(rows_to_ndjson_chunks(rows, table.primary_key), content_type=NDJSON)
+            # Accept: application/vnd.apache.arrow.stream or application/vnd.apache.parquet for analytical reads.
+            if media_type in ARROW_MEDIA_TYPES:
+                rows = table_data.stream_rows_from_table(table.table_name, search_params, req_tenant, limit, offset,
+                                                         db_instance, order=order, select=select)
+                column_types = get_column_catalog(req_tenant, table.table_name, db_instance)
+                response = StreamingHttpResponse(arrow_chunks(rows, column_types, media_type), content_type=media_type)
+                if media_type == PARQUET:
+                    response['Content-Disposition'] = f'attachment; filename="{root_url}.parquet"'
+                return response
+
+            # ?stream=true sends rows as they're read from a server-side cursor, for results too large to hold in memory.
+            if stream:
+                rows = table_data.stream_rows_from_table(table.table_name, search_params, req_tenant, limit, offset,
+                                                         db_instance, order=order, keyset=keyset, select=select)
+                metadata = {}
+                chunks = rows_to_json_chunks(rows, table.primary_key)
+                if keyset:
+                    chunks = stream_with_continuation(chunks, rows, keyset, limit, metadata)
+                return StreamingHttpResponse(make_success_stream(chunks, metadata=metadata),
+                                             content_type='application/json')
+
+            # ?format=columnar sends column names and types once and rows as arrays.
+            if response_format == "columnar":
+                columns, rows = table_data.get_rows_from_table(table.table_name, search_params, req_tenant, limit,
+                                                               offset, db_instance, table.primary_key, order=order,
+                                                               keyset=keyset, select=select, as_tuples=True)
+                metadata = {}
+                if keyset and limit and len(rows) == limit:
+                    metadata["continuation_token"] = keyset.next_token(dict(zip(columns, rows[-1])))
+                result = columnar_result(columns, rows, get_column_catalog(req_tenant, table.table_name, db_instance),
+                                         table.primary_key, dictionary)
+                return HttpResponse(make_success(result=result, metadata=metadata), content_type='application/json')
+
+            # Keyset pages need the last row in Python for the continuation token.
+            if conf.read_engine == "postgres_json" and not keyset:
+                result_json = table_data.get_rows_from_table_json(table.table_name, search_params, req_tenant, limit,
+                                                                  offset, db_instance, table.primary_key, order=order,
+                                                                  select=select)
+                return HttpResponse(make_success_json(result_json), content_type='application/json')
+
             if order is not None:
                 result = table_data.get_rows_from_table(table.table_name,
                                                         search_params,
@@ -1318,23 +1486,29 @@ class DynamicView(RoleSessionMixin, APIView):
                                                         offset,
                                                         db_instance,
                                                         table.primary_key,
-                                                        order=order)
+                                                        order=order,
+                                                        keyset=keyset,
+                                                        select=select)
             else:
                 result = table_data.get_rows_from_table(table.table_name, search_params, req_tenant, limit, offset,
-                                                        db_instance, table.primary_key)
+                                                        db_instance, table.primary_key, keyset=keyset,
+                                                        select=select)
+            metadata = {}
+            if keyset and limit and len(result) == limit:
+                metadata["continuation_token"] = keyset.next_token(result[-1])
         except Exception as e:
             msg = f"Failed to retrieve rows from table {table.table_name} on tenant {req_tenant}. {e}"
             logger.error(msg)
             return HttpResponseBadRequest(make_error(msg=msg))
 
-        return HttpResponse(make_success(result=result), content_type='application/json')
+        return HttpResponse(make_success(result=result, metadata=metadata), content_type='application/json')
 
     @can_write
     def post(self, request, *args, **kwargs):
         logger.debug("top of post /data/<root_url>")
         try:
-            req_tenant = request.session['tenant_id']
-            db_instance = request.session['db_instance_name']
+            req_tenant = request.auth_context.tenant_id
+            db_instance = request.auth_context.db_instance_name
         except Exception as e:
             msg = f"Invalid request; unable to determine database instance; Details: {e}"
             logger.debug(msg)
@@ -1355,7 +1529,7 @@ class DynamicView(RoleSessionMixin, APIView):
             return HttpResponseBadRequest(make_error(msg=msg))
 
         try:
-            table = ManageTables.objects.get(root_url=root_url, tenant_id=req_tenant)
+            table = get_table_descriptor(req_tenant, root_url)
         except ManageTables.DoesNotExist:
             msg = f"Table with root url {root_url} does not exist."
             logger.warning(msg)
@@ -1380,6 +1554,9 @@ class DynamicView(RoleSessionMixin, APIView):
             logger.warning(msg)
             return HttpResponseBadRequest(make_error(msg=msg))
 
+        if NDJSON in request_content_type:
+            return self.post_ndjson(request, table, req_tenant, db_instance)
+
         try:
             data = request.data['data']
         except KeyError as e:
@@ -1391,13 +1568,42 @@ class DynamicView(RoleSessionMixin, APIView):
             logger.debug(msg)
             return HttpResponseBadRequest(make_error(msg=msg))
 
+        # ?bulk=true loads rows with COPY and returns counts and the inserted primary key range instead of the rows.
+        bulk = self.request.query_params.get("bulk", "").lower() == "true"
+        # With on_conflict (the primary key or a unique constraint name), rows that conflict update the existing row.
+        on_conflict = request.data.get("on_conflict")
+        if bulk and on_conflict:
+            msg = "on_conflict can't be used with bulk=true."
+            logger.debug(msg)
+            return HttpResponseBadRequest(make_error(msg=msg))
         try:
-            new_rows = table_data.row_creator(table.table_name,
-                                              data,
-                                              req_tenant,
-                                              table.primary_key,
-                                              table.validate_json_create,
-                                              db_instance=db_instance)
+            if on_conflict:
+                new_rows = table_data.upsert_rows(table.table_name,
+                                                  data,
+                                                  req_tenant,
+                                                  table.primary_key,
+                                                  table.validate_json_create,
+                                                  on_conflict,
+                                                  constraints=table.constraints,
+                                                  special_rules=table.special_rules,
+                                                  db_instance=db_instance,
+                                                  table_id=table.manage_table_id)
+            elif bulk:
+                new_rows = table_data.bulk_insert_rows(table.table_name,
+                                                       data,
+                                                       req_tenant,
+                                                       table.primary_key,
+                                                       table.validate_json_create,
+                                                       db_instance=db_instance,
+                                                       table_id=table.manage_table_id)
+            else:
+                new_rows = table_data.row_creator(table.table_name,
+                                                  data,
+                                                  req_tenant,
+                                                  table.primary_key,
+                                                  table.validate_json_create,
+                                                  db_instance=db_instance,
+                                                  table_id=table.manage_table_id)
         except Exception as e:
             msg = f"Failed to add rows to table {table.table_name} on tenant {req_tenant}. {e}"
             logger.error(msg)
@@ -1405,14 +1611,57 @@ class DynamicView(RoleSessionMixin, APIView):
 
         return HttpResponse(make_success(result=new_rows), content_type='application/json')
 
+    def post_ndjson(self, request, table, req_tenant, db_instance):
+        """
+        Row creation from an application/x-ndjson body, one row object per line. The body is parsed as it's
+        read and rows are inserted ndjson_insert_chunk_size at a time, each chunk in its own transaction.
+        Returns {"inserted": total, "chunks": [summary, ...]}. If a chunk fails, chunks before it stay
+        committed and are listed in the error's metadata. Bodies without rows are rejected.
+        """
+        stream = request.stream
+        if stream is None:
+            if request.META.get("HTTP_TRANSFER_ENCODING", "").lower() == "chunked":
+                # Without a Content-Length, Django and DRF see an empty body. The server hands chunked
+                # bodies over decoded in wsgi.input, which is read until it runs out.
+                stream = request.META["wsgi.input"]
+            else:
+                msg = "application/x-ndjson bodies need a Content-Length or Transfer-Encoding: chunked."
+                logger.debug(msg)
+                return HttpResponse(make_error(msg=msg), status=411, content_type='application/json')
+        lines = iter(stream.readline, b"")
+        chunks = []
+        try:
+            rows = table_data.bulk_insert_row_chunks(table.table_name,
+                                                     serialization.iter_ndjson(lines),
+                                                     req_tenant,
+                                                     table.primary_key,
+                                                     table.validate_json_create,
+                                                     conf.ndjson_insert_chunk_size,
+                                                     db_instance=db_instance,
+                                                     table_id=table.manage_table_id)
+            for summary in rows:
+                chunks.append(summary)
+            if not chunks:
+                msg = "The application/x-ndjson body contained no rows."
+                logger.debug(msg)
+                raise Exception(msg)
+        except Exception as e:
+            msg = f"Failed to add rows to table {table.table_name} on tenant {req_tenant}. {e}"
+            logger.error(msg)
+            metadata = {"inserted": sum(summary["inserted"] for summary in chunks), "chunks": chunks}
+            return HttpResponseBadRequest(make_error(msg=msg, metadata=metadata))
+
+        result = {"inserted": sum(summary["inserted"] for summary in chunks), "chunks": chunks}
+        return HttpResponse(make_success(result=result), content_type='application/json')
+
     @can_write
     def put(self, request, *args, **kwargs):
         logger.debug("top of put /data/<root_url>")
-        req_tenant = request.session['tenant_id']
-        db_instance = request.session['db_instance_name']
+        req_tenant = request.auth_context.tenant_id
+        db_instance = request.auth_context.db_instance_name
 
         # Parse out required fields.
-        result_dict = json.loads(request.body.decode())
+        result_dict = serialization.loads(request.body)
         try:
             root_url = self.kwargs["root_url"]
             data = result_dict["data"]
@@ -1423,7 +1672,7 @@ class DynamicView(RoleSessionMixin, APIView):
         where_clause = result_dict.get("where", None)
 
         try:
-            table = ManageTables.objects.get(root_url=root_url, tenant_id=req_tenant)
+            table = get_table_descriptor(req_tenant, root_url)
         except ManageTables.DoesNotExist:
             msg = f"Table with root url {root_url} does not exist."
             logger.warning(msg)
@@ -1434,6 +1683,27 @@ class DynamicView(RoleSessionMixin, APIView):
             logger.warning(msg)
             return HttpResponseBadRequest(make_error(msg=msg))
 
+        # data as a list of {"pk": pk, "changes": {...}} objects updates each row by primary key with its own values.
+        if isinstance(data, list):
+            if where_clause:
+                msg = "A where clause can't be used when data is a list of per-row updates."
+                logger.debug(msg)
+                return HttpResponseBadRequest(make_error(msg=msg))
+            try:
+                result = table_data.update_rows_with_pks(table.table_name,
+                                                         data,
+                                                         req_tenant,
+                                                         table.primary_key,
+                                                         table.validate_json_update,
+                                                         special_rules=table.special_rules,
+                                                         db_instance=db_instance,
+                                                         table_id=table.manage_table_id)
+            except Exception as e:
+                msg = f"Failed to update rows in table {table.table_name} on tenant {req_tenant}. {e}"
+                logger.error(msg)
+                return HttpResponseBadRequest(make_error(msg=msg))
+            return HttpResponse(make_success(result=result), content_type='application/json')
+
         # Check if any keys in the table.special_rules are in the UPDATETIME list. If they are,
         #  we check posted data, if they didn't set it, we set it to current time.
         try:
@@ -1447,9 +1717,9 @@ class DynamicView(RoleSessionMixin, APIView):
             return HttpResponseBadRequest(make_error(msg=msg))
 
         try:
-            v = Validator(table.validate_json_update)
-            if not v.validate(data):
-                msg = f"Data determined invalid from json validation schema: {v.errors}"
+            errors = get_validator(table.manage_table_id, table.validate_json_update).validate(data)
+            if errors:
+                msg = f"Data determined invalid from json validation schema: {errors}"
                 logger.warning(msg)
                 return HttpResponseBadRequest(make_error(msg=msg))
         except Exception as e:
@@ -1461,41 +1731,7 @@ class DynamicView(RoleSessionMixin, APIView):
             if where_clause:
                 # where_clause comes in as {variable: {"operator": oper, "value": value}, ...}
                 # Need to parse dict to search_param format. [[key, oper, value], ...]
-                logger.info(f"Parsing where_clause: {where_clause}")
-                search_params = []
-                if not isinstance(where_clause, dict):
-                    msg = f"Error, where clause should come as a dict, got {type(where_clause)}"
-                    logger.error(msg)
-                    return HttpResponseBadRequest(make_error(msg=msg))
-                for where_key, where_dict in where_clause.items():
-                    if not isinstance(where_dict, dict):
-                        msg = f"Error in where_clause. Got key, but value should be of type dict, got {where_dict}"
-                        logger.error(msg)
-                        return HttpResponseBadRequest(make_error(msg=msg))
-                    where_oper = where_dict.get("operator")
-                    where_value = where_dict.get("value")
-                    if not where_oper:
-                        msg = f"'operator' must be a key in where_clause dict. where_clause dict: {where_dict}"
-                        logger.error(msg)
-                        return HttpResponseBadRequest(make_error(msg=msg))
-                    if not where_value:
-                        msg = f"'value' must be a key in where_clause dict. where_clause dict: {where_dict}"
-                        logger.error(msg)
-                        return HttpResponseBadRequest(make_error(msg=msg))
-                    if not isinstance(where_oper, str):
-                        msg = f"'operator' must be a string, got: {where_oper}, type: {type(where_oper)}"
-                        logger.error(msg)
-                        return HttpResponseBadRequest(make_error(msg=msg))
-                    
-                    logger.info('HERE WHERE_CLAUSE')
-                    opers = ['neq', 'eq', 'lte', 'lt', 'gte', 'gt', 'nin', 'in', 'nlike', 'like', 'between', 'nbetween', 'null']
-                    if where_oper not in opers:
-                        msg = f"where_oper must be in {opers}, got {where_oper}."
-                        logger.error(msg)
-                        return HttpResponseBadRequest(make_error(msg=msg))
-                    
-                    search_params.append([where_key, f".{where_oper}", where_value])
-                logger.info(f"Search params: {search_params}")
+                search_params = where_clause_to_search_params(where_clause)
                 table_data.update_rows_with_where(table.table_name, data, req_tenant, db_instance, search_params)
             else:
                 table_data.update_rows_with_where(table.table_name, data, req_tenant, db_instance)
@@ -1506,6 +1742,50 @@ class DynamicView(RoleSessionMixin, APIView):
 
         return HttpResponse(make_success(msg="Table put successfully."), content_type='application/json')
 
+    @can_write
+    def delete(self, request, *args, **kwargs):
+        logger.debug("top of del /data/<root_url>")
+        req_tenant = request.auth_context.tenant_id
+        db_instance = request.auth_context.db_instance_name
+
+        # Parse out required fields. Body is {"where": {...}} (same format as PUT) or {"pks": [pk, ...]}.
+        try:
+            root_url = self.kwargs["root_url"]
+            result_dict = serialization.loads(request.body or b"{}")
+            where_clause = result_dict.get("where")
+            pks = result_dict.get("pks")
+        except Exception as e:
+            msg = f"Could not parse the request. Is the body valid JSON? Details: {e}"
+            logger.debug(msg)
+            return HttpResponseBadRequest(make_error(msg=msg))
+        if bool(where_clause) == bool(pks):
+            msg = "Deleting rows requires exactly one of 'where' or 'pks'."
+            logger.warning(msg)
+            return HttpResponseBadRequest(make_error(msg=msg))
+
+        try:
+            table = get_table_descriptor(req_tenant, root_url)
+        except ManageTables.DoesNotExist:
+            msg = f"Table with root url {root_url} does not exist."
+            logger.warning(msg)
+            return HttpResponseNotFound(make_error(msg=msg))
+
+        if "DELETE" not in table.endpoints:
+            msg = "API access to DELETE disabled."
+            logger.warning(msg)
+            return HttpResponseBadRequest(make_error(msg=msg))
+
+        try:
+            search_params = where_clause_to_search_params(where_clause) if where_clause else None
+            result = table_data.delete_rows(table.table_name, req_tenant, table.primary_key, db_instance=db_instance,
+                                            search_params=search_params, pks=pks)
+        except Exception as e:
+            msg = f"Failed to delete rows from table {table.table_name} in tenant {req_tenant}. {e}"
+            logger.error(msg)
+            return HttpResponseBadRequest(make_error(msg=msg))
+
+        return HttpResponse(make_success(result=result, msg="Rows deleted successfully."), content_type='application/json')
+
 
 class DynamicViewById(RoleSessionMixin, APIView):
     """
@@ -1516,8 +1796,8 @@ class DynamicViewById(RoleSessionMixin, APIView):
     @can_read
     def get(self, request, *args, **kwargs):
         logger.debug("top of get /data/<root_url>/<pk>")
-        req_tenant = request.session['tenant_id']
-        db_instance = request.session['db_instance_name']
+        req_tenant = request.auth_context.tenant_id
+        db_instance = request.auth_context.db_instance_name
 
         # Parse out required fields.
         try:
@@ -1529,7 +1809,7 @@ class DynamicViewById(RoleSessionMixin, APIView):
             return HttpResponseBadRequest(make_error(msg=msg))
 
         try:
-            table = ManageTables.objects.get(root_url=root_url, tenant_id=req_tenant)
+            table = get_table_descriptor(req_tenant, root_url)
         except ManageTables.DoesNotExist:
             msg = f"Table with root url {root_url} does not exist."
             logger.warning(msg)
@@ -1541,7 +1821,8 @@ class DynamicViewById(RoleSessionMixin, APIView):
             return HttpResponseBadRequest(make_error(msg=msg))
 
         try:
-            result = table_data.get_row_from_table(table.table_name, pk_id, req_tenant, table.primary_key, db_instance)
+            result = table_data.get_row_from_table(table.table_name, pk_id, req_tenant, table.primary_key, db_instance,
+                                                   select=self.request.query_params.get("select"))
         except Exception as e:
             msg = f"Failed to retrieve row from table {table.table_name} with pk {pk_id} on tenant {req_tenant}. {e}"
             logger.error(msg)
@@ -1552,8 +1833,8 @@ class DynamicViewById(RoleSessionMixin, APIView):
     @can_write
     def put(self, request, *args, **kwargs):
         logger.debug("top of put /data/<root_url>/<pk>")
-        req_tenant = request.session['tenant_id']
-        db_instance = request.session['db_instance_name']
+        req_tenant = request.auth_context.tenant_id
+        db_instance = request.auth_context.db_instance_name
 
         # Parse out required fields.
         try:
@@ -1566,7 +1847,7 @@ class DynamicViewById(RoleSessionMixin, APIView):
             return HttpResponseBadRequest(make_error(msg=msg))
 
         try:
-            table = ManageTables.objects.get(root_url=root_url, tenant_id=req_tenant)
+            table = get_table_descriptor(req_tenant, root_url)
         except ManageTables.DoesNotExist:
             msg = f"Table with root url {root_url} does not exist."
             logger.warning(msg)
@@ -1590,9 +1871,9 @@ class DynamicViewById(RoleSessionMixin, APIView):
             return HttpResponseBadRequest(make_error(msg=msg))
 
         try:
-            v = Validator(table.validate_json_update)
-            if not v.validate(data):
-                msg = f"Data determined invalid from json validation schema: {v.errors}"
+            errors = get_validator(table.manage_table_id, table.validate_json_update).validate(data)
+            if errors:
+                msg = f"Data determined invalid from json validation schema: {errors}"
                 logger.warning(msg)
                 return HttpResponseBadRequest(make_error(msg=msg))
         except Exception as e:
@@ -1628,8 +1909,8 @@ class DynamicViewById(RoleSessionMixin, APIView):
     @can_write
     def delete(self, request, *args, **kwargs):
         logger.debug("top of del /data/<root_url>/<pk>")
-        req_tenant = request.session['tenant_id']
-        db_instance = request.session['db_instance_name']
+        req_tenant = request.auth_context.tenant_id
+        db_instance = request.auth_context.db_instance_name
 
         # Parse out required fields.
         try:
@@ -1641,7 +1922,7 @@ class DynamicViewById(RoleSessionMixin, APIView):
             return HttpResponseBadRequest(make_error(msg=msg))
 
         try:
-            table = ManageTables.objects.get(root_url=root_url, tenant_id=req_tenant)
+            table = get_table_descriptor(req_tenant, root_url)
         except ManageTables.DoesNotExist:
             msg = f"Table with root url {root_url} does not exist."
             logger.warning(msg)
@@ -1672,7 +1953,7 @@ class ViewManagement(RoleSessionMixin, APIView):
     @is_admin
     def get(self, request, *args, **kwargs):
         logger.debug("top of get /manage/views")
-        req_tenant = request.session['tenant_id']
+        req_tenant = request.auth_context.tenant_id
 
         # Check for details=true. Decide what a brief description and a detailed description is.
         details = self.request.query_params.get('details')
@@ -1711,9 +1992,9 @@ class ViewManagement(RoleSessionMixin, APIView):
     @is_admin
     def post(self, request, *args, **kwargs):
         logger.debug("top of post /manage/views")
-        req_tenant = request.session['tenant_id']
-        db_instance_name = request.session['db_instance_name']
-        req_username = request.session['username']
+        req_tenant = request.auth_context.tenant_id
+        db_instance_name = request.auth_context.db_instance_name
+        req_username = request.auth_context.username
 
         # Parse out required fields.
         try:
@@ -1779,8 +2060,8 @@ class ViewManagement(RoleSessionMixin, APIView):
         # If raw_sql or materialized_view_raw_sql being used, select_query, where_query, from_table are disallowed.
         if raw_sql or materialized_view_raw_sql:
             # Permission check, ensure user has PGREST_ADMIN role.
-            # Get all user roles from sk and check if user has role.
-            user_roles = get_user_sk_roles(req_tenant, req_username)
+            # Uses the roles RoleSessionMixin resolved for this request.
+            user_roles = request.auth_context.roles
             if not "PGREST_ADMIN" in user_roles:
                 msg = f"User {req_username} in tenant {req_tenant} requires PGREST_ADMIN role for (materialized_)raw_sql view creation."
                 logger.debug(msg)
@@ -1848,6 +2129,7 @@ class ViewManagement(RoleSessionMixin, APIView):
             msg = f"Failed to create view {view_name}. {error}"
             logger.error(msg)
             return HttpResponseBadRequest(make_error(msg=msg, metadata=metadata))
+        publish("tenant_objects", tenant=req_tenant, db_instance=db_instance_name)
 
         return HttpResponse(make_success(result=result, metadata=metadata), content_type='application/json')
 
@@ -1885,7 +2167,7 @@ class ViewManagementById(RoleSessionMixin, APIView):
     @is_admin
     def get(self, request, *args, **kwargs):
         logger.debug("top of get /manage/views/<manage_view_id>")
-        req_tenant = request.session['tenant_id']
+        req_tenant = request.auth_context.tenant_id
 
         # Check for details=true. Decide what a brief description and a detailed description is.
         details = self.request.query_params.get('details')
@@ -1942,8 +2224,8 @@ class ViewManagementById(RoleSessionMixin, APIView):
     @is_admin
     def delete(self, request, *args, **kwargs):
         logger.debug("top of del /manage/views/<manage_view_id>")
-        req_tenant = request.session['tenant_id']
-        db_instance_name = request.session['db_instance_name']
+        req_tenant = request.auth_context.tenant_id
+        db_instance_name = request.auth_context.db_instance_name
 
         # Parse out required fields.
         try:
@@ -1973,6 +2255,7 @@ class ViewManagementById(RoleSessionMixin, APIView):
             msg = f"Failed to drop view {view.view_name} from the ManageViews table: {e}"
             logger.error(msg)
             return HttpResponseBadRequest(make_error(msg=msg))
+        publish("tenant_objects", tenant=req_tenant, db_instance=db_instance_name)
 
         return HttpResponse(make_success(msg="View deleted successfully."), content_type='application/json')
 
@@ -1994,8 +2277,8 @@ class ViewsRefreshResource(RoleSessionMixin, APIView):
     @is_admin
     def get(self, request, *args, **kwargs):
         logger.debug("top of get /manage/views/<manage_view_id>/refresh")
-        req_tenant = request.session['tenant_id']
-        db_instance_name = request.session['db_instance_name']
+        req_tenant = request.auth_context.tenant_id
+        db_instance_name = request.auth_context.db_instance_name
 
         # Parse out required fields.
         try:
@@ -2052,16 +2335,24 @@ class ViewsResource(RoleSessionMixin, APIView):
     with permission rules that their user follows.
     """
     @is_user
+    @sends_etag
     def get(self, request, *args, **kwargs):
         logger.debug("top of get /views/<root_url>")
-        req_tenant = request.session['tenant_id']
-        db_instance = request.session['db_instance_name']
-        req_username = request.session['username']
+        req_tenant = request.auth_context.tenant_id
+        db_instance = request.auth_context.db_instance_name
+        req_username = request.auth_context.username
 
         params = self.request.query_params
         limit = self.request.query_params.get("limit")
         offset = self.request.query_params.get("offset")
         order = self.request.query_params.get("order")
+        stream = self.request.query_params.get("stream", "").lower() == "true"
+        use_keyset = self.request.query_params.get("keyset", "").lower() == "true"
+        continuation_token = self.request.query_params.get("continuation_token")
+        select = self.request.query_params.get("select")
+        response_format = self.request.query_params.get("format", "json")
+        dictionary = self.request.query_params.get("dictionary", "").lower() == "true"
+        media_type = negotiate_media_type(request.META.get("HTTP_ACCEPT"))
 
         # Parse out required fields.
         try:
@@ -2072,15 +2363,15 @@ class ViewsResource(RoleSessionMixin, APIView):
             return HttpResponseBadRequest(make_error(msg=msg))
 
         try:
-            view = ManageViews.objects.get(root_url=root_url, tenant_id=req_tenant)
+            view = get_view_descriptor(req_tenant, root_url)
         except ManageViews.DoesNotExist:
             msg = f"View with root url {root_url} does not exist."
             logger.warning(msg)
             return HttpResponseNotFound(make_error(msg=msg))
 
         # Permission check, permission_rules cross-refed with sk roles
-        # Get all user roles from sk and check if view's permission_rules are a subset of user_roles
-        user_roles = get_user_sk_roles(req_tenant, req_username)
+        # Check if view's permission_rules are a subset of the roles RoleSessionMixin resolved for this request.
+        user_roles = request.auth_context.roles
         try:
             if not set(view.permission_rules).issubset(set(user_roles)):
                 msg = (f"User {req_username} in tenant {req_tenant} does not have permission to access view {view.view_name}"
@@ -2097,6 +2388,10 @@ class ViewsResource(RoleSessionMixin, APIView):
             logger.warning(msg)
             return HttpResponseBadRequest(make_error(msg=msg))
 
+        not_modified = etag_response(request, view_etag(request, view))
+        if not_modified:
+            return not_modified
+
         try:
             # Parse params, if the key contains a search operation, throw it into search_params
             # search_params list is [[key, oper, value], ...]
@@ -2139,6 +2434,83 @@ class ViewsResource(RoleSessionMixin, APIView):
                 logger.error(msg)
                 return HttpResponseBadRequest(make_error(msg=msg))
 
+            if response_format not in RESPONSE_FORMATS:
+                msg = f"format must be one of {RESPONSE_FORMATS}. Got {response_format}"
+                logger.warning(msg)
+                return HttpResponseBadRequest(make_error(msg=msg))
+            if stream and response_format != "json":
+                msg = f"stream can't be combined with format {response_format}."
+                logger.warning(msg)
+                return HttpResponseBadRequest(make_error(msg=msg))
+            if media_type != JSON and (use_keyset or continuation_token or response_format != "json"):
+                msg = f"Accept: {media_type} can't be combined with keyset pagination or format {response_format}."
+                logger.warning(msg)
+                return HttpResponseBadRequest(make_error(msg=msg))
+            if media_type in ARROW_MEDIA_TYPES and not arrow_available():
+                msg = f"Accept: {media_type} requires pyarrow, which is not installed on this server."
+                logger.warning(msg)
+                return HttpResponse(make_error(msg=msg), status=406, content_type='application/json')
+
+            # ?keyset=true starts keyset pagination, later pages pass back metadata.continuation_token.
+            keyset = None
+            if use_keyset or continuation_token:
+                if offset:
+                    msg = "offset can't be combined with keyset pagination, use continuation_token instead."
+                    logger.warning(msg)
+                    return HttpResponseBadRequest(make_error(msg=msg))
+                keyset = Keyset.from_request(req_tenant, view.view_name, db_instance, None, search_params,
+                                             order=order, token=continuation_token)
+
+            # Accept: text/csv and application/x-ndjson export the rows with constant memory.
+            if media_type == CSV:
+                chunks = view_data.copy_rows_from_view(view.view_name, search_params, req_tenant, limit, offset,
+                                                       db_instance, order=order, select=select)
+                response = StreamingHttpResponse(chunks, content_type='text/csv; charset=utf-8')
+                response['Content-Disposition'] = f'attachment; filename="{root_url}.csv"'
+                return response
+            if media_type == NDJSON:
+                rows = view_data.stream_rows_from_view(view.view_name, search_params, req_tenant, limit, offset,
+                                                       db_instance, order=order, select=select)
+                return StreamingHttpResponse(rows_to_ndjson_chunks(rows), content_type=NDJSON)
+            # Accept: application/vnd.apache.arrow.stream or application/vnd.apache.parquet for analytical reads.
+            if media_type in ARROW_MEDIA_TYPES:
+                rows = view_data.stream_rows_from_view(view.view_name, search_params, req_tenant, limit, offset,
+                                                       db_instance, order=order, select=select)
+                column_types = get_column_catalog(req_tenant, view.view_name, db_instance)
+                response = StreamingHttpResponse(arrow_chunks(rows, column_types, media_type), content_type=media_type)
+                if media_type == PARQUET:
+                    response['Content-Disposition'] = f'attachment; filename="{root_url}.parquet"'
+                return response
+
+            # ?stream=true sends rows as they're read from a server-side cursor, for results too large to hold in memory.
+            if stream:
+                rows = view_data.stream_rows_from_view(view.view_name, search_params, req_tenant, limit, offset,
+                                                       db_instance, order=order, keyset=keyset, select=select)
+                metadata = {}
+                chunks = rows_to_json_chunks(rows)
+                if keyset:
+                    chunks = stream_with_continuation(chunks, rows, keyset, limit, metadata)
+                return StreamingHttpResponse(make_success_stream(chunks, metadata=metadata),
+                                             content_type='application/json')
+
+            # ?format=columnar sends column names and types once and rows as arrays.
+            if response_format == "columnar":
+                columns, rows = view_data.get_rows_from_view(view.view_name, search_params, req_tenant, limit, offset,
+                                                             db_instance, view.manage_view_id, order=order,
+                                                             keyset=keyset, select=select, as_tuples=True)
+                metadata = {}
+                if keyset and limit and len(rows) == limit:
+                    metadata["continuation_token"] = keyset.next_token(dict(zip(columns, rows[-1])))
+                result = columnar_result(columns, rows, get_column_catalog(req_tenant, view.view_name, db_instance),
+                                         dictionary=dictionary)
+                return HttpResponse(make_success(result=result, metadata=metadata), content_type='application/json')
+
+            # Keyset pages need the last row in Python for the continuation token.
+            if conf.read_engine == "postgres_json" and not keyset:
+                result_json = view_data.get_rows_from_view_json(view.view_name, search_params, req_tenant, limit, offset,
+                                                                db_instance, order=order, select=select)
+                return HttpResponse(make_success_json(result_json), content_type='application/json')
+
             if order is not None:
                 result = view_data.get_rows_from_view(view.view_name,
                                                       search_params,
@@ -2147,16 +2519,22 @@ class ViewsResource(RoleSessionMixin, APIView):
                                                       offset,
                                                       db_instance,
                                                       view.manage_view_id,
-                                                      order=order)
+                                                      order=order,
+                                                      keyset=keyset,
+                                                      select=select)
             else:
                 result = view_data.get_rows_from_view(view.view_name, search_params, req_tenant, limit, offset, db_instance,
-                                                      view.manage_view_id)
+                                                      view.manage_view_id, keyset=keyset,
+                                                      select=select)
+            metadata = {}
+            if keyset and limit and len(result) == limit:
+                metadata["continuation_token"] = keyset.next_token(result[-1])
         except Exception as e:
             msg = f"Failed to retrieve rows from view {view.view_name} on tenant {req_tenant}. {e}"
             logger.error(msg)
             return HttpResponseBadRequest(make_error(msg=msg))
 
-        return HttpResponse(make_success(result=result), content_type='application/json')
+        return HttpResponse(make_success(result=result, metadata=metadata), content_type='application/json')
 
 
 ### Roles
@@ -2170,7 +2548,7 @@ class RoleManagement(RoleSessionMixin, APIView):
     @is_role_admin
     def get(self, request, *args, **kwargs):
         logger.debug("top of get /manage/roles")
-        req_tenant = request.session['tenant_id']
+        req_tenant = request.auth_context.tenant_id
 
         try:
             full_tenant_role_list = t.sk.getRoleNames(tenant=req_tenant, _tapis_set_x_headers_from_service=True).names
@@ -2194,7 +2572,7 @@ class RoleManagement(RoleSessionMixin, APIView):
     @is_role_admin
     def post(self, request, *args, **kwargs):
         logger.debug("top of post /manage/roles")
-        req_tenant = request.session['tenant_id']
+        req_tenant = request.auth_context.tenant_id
 
         # Parse out required fields.
         try:
@@ -2244,7 +2622,7 @@ class RoleManagementByName(RoleSessionMixin, APIView):
     @is_role_admin
     def get(self, request, *args, **kwargs):
         logger.debug("top of get /manage/roles/{role_name}")
-        req_tenant = request.session['tenant_id']
+        req_tenant = request.auth_context.tenant_id
 
         # Parse out required fields.
         try:
@@ -2289,7 +2667,7 @@ class RoleManagementByName(RoleSessionMixin, APIView):
     @is_role_admin
     def post(self, request, *args, **kwargs):
         logger.debug("top of post /manage/roles/{role_name}")
-        req_tenant = request.session['tenant_id']
+        req_tenant = request.auth_context.tenant_id
 
         # Parse out required fields.
         try:
@@ -2339,6 +2717,7 @@ class RoleManagementByName(RoleSessionMixin, APIView):
         if method == "grant":
             try:
                 granted_role = t.sk.grantRole(tenant=req_tenant, roleName=role_name, user=username, _tapis_set_x_headers_from_service=True)
+                publish("roles", tenant=req_tenant, username=username)
                 # returns 'changes': 1 if a change was made, otherwise 0.
                 if granted_role.changes:
                     return HttpResponse(make_success(result="Role granted to user"), content_type='application/json')
@@ -2352,6 +2731,7 @@ class RoleManagementByName(RoleSessionMixin, APIView):
         elif method == "revoke":
             try:
                 revoked_role = t.sk.revokeUserRole(tenant=req_tenant, roleName=role_name, user=username, _tapis_set_x_headers_from_service=True)
+                publish("roles", tenant=req_tenant, username=username)
                 # returns 'changes': 1 if a change was made, otherwise 0.
                 if revoked_role.changes:
                     return HttpResponse(make_success(result="Role revoked from user"), content_type='application/json')
@@ -2372,7 +2752,7 @@ class HealthCheck(RoleSessionMixin, APIView):
     """
     def get(self, request, *args, **kwargs):
         logger.debug("top of get /healthcheck")
-        req_tenant = request.session['tenant_id']
+        req_tenant = request.auth_context.tenant_id
 
         try:
             views = ManageViews.objects.filter(tenant_id=req_tenant)
@@ -2383,3 +2763,24 @@ class HealthCheck(RoleSessionMixin, APIView):
             databaseAccess = False
 
         return HttpResponse(make_success(msg={"databaseAccess": databaseAccess}), content_type='application/json')
+
+
+### Stats
+class StatsResource(RoleSessionMixin, APIView):
+    """
+    GET: Returns runtime stats for the worker process that handled the request, e.g. connection pool and cache usage.
+    Each uWSGI worker keeps its own pools, so repeated calls may be answered by different workers.
+    Restricted to ADMIN role only.
+    """
+    @is_admin
+    def get(self, request, *args, **kwargs):
+        logger.debug("top of get /manage/stats")
+
+        result = {
+            "pid": os.getpid(),
+            "connection_pools": pool.pool_stats(),
+            "caches": cache_stats(),
+            "invalidation": listener_stats()
+        }
+
+        return HttpResponse(make_success(result=result), content_type='application/json')